@@ -0,0 +1,466 @@
+"""
+Benchmark harness for the signing and HTTP hot paths. It runs fully offline: JSON-LD contexts are served from the bundle
+in `src/contexts`, the signing key is generated on the fly and Keycloak and the Federated Catalogue are replaced by the
+local stand-ins in `mock_services.py`.
+
+Each phase of the creation of a Self Description is measured separately for several generated Claim sets of varying
+size and nesting as well as the request examples of `openapi-spec.yaml`:
+
+    python benchmarks/benchmark.py --output results.json
+    python benchmarks/benchmark.py --baseline results.json --max-regression 0.2
+
+The results are written as JSON. If a baseline is given, the median of each benchmark is compared to the baseline and the
+exit code is 1 if any benchmark is slower than allowed.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from hashlib import sha256
+
+import yaml
+from jwcrypto import jws
+from jwcrypto.jwk import JWK
+from pyld import jsonld
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+sys.path.insert(0, SRC_DIR)
+
+from canonicalization import CanonicalizationEngine  # noqa: E402
+from did_store import DIDStore  # noqa: E402
+from document_loader import CachingDocumentLoader, DEFAULT_CONTEXT_BUNDLE_DIR  # noqa: E402
+from federated_catalogue_client import FederatedCatalogueClient  # noqa: E402
+from mock_services import MockServices  # noqa: E402
+from self_description_processor import SelfDescriptionProcessor  # noqa: E402
+from signature_suites import get_signature_suite  # noqa: E402
+from signing_pool import SigningPool  # noqa: E402
+
+CREDENTIAL_ISSUER = "did:web:benchmark.example.org"
+# Generated Claim sets: name, literals per node, nesting depth, child nodes per node
+GENERATED_CLAIM_SETS = [("small", 5, 0, 0),
+                        ("medium", 20, 1, 3),
+                        ("large", 20, 3, 3),
+                        ("deep", 3, 8, 1)]
+BENCHMARKS = ["normalization", "hashing", "signing", "add_proof", "signing_pool", "create_self_description",
+              "did_store_write", "bulk_upload", "http_vc_from_claims", "http_vp_from_claims", "http_upload_from_claims"]
+# Bulk uploads are sent to a Catalogue that rejects uploads above this concurrency with 429
+BULK_UPLOAD_SIZE = 50
+BULK_UPLOAD_CATALOGUE_CONCURRENCY = 4
+BULK_UPLOAD_CATALOGUE_DELAY_SEC = 0.005
+# Concurrent submitters of Proofs per worker of the signing pool, so the workers never wait for the next task
+SIGNING_POOL_SUBMITTERS_PER_WORKER = 2
+# Arguments of `JWK.generate` for the key types of the signature suites (see `src/signature_suites.py`)
+SIGNING_KEY_TYPES = {"RSA": {"kty": "RSA", "size": 2048},
+                     "EC": {"kty": "EC", "crv": "P-256"},
+                     "OKP": {"kty": "OKP", "crv": "Ed25519"}}
+
+
+def generate_claims(literal_count: int, nesting_depth: int, children_per_node: int, node_id: str = "root") -> dict:
+    """
+    Generate a Claim set with typed literals and nested nodes similar to the Claims used in practice.
+    :param literal_count: Number of literal properties per node
+    :param nesting_depth: Number of levels of nested nodes below the root node
+    :param children_per_node: Number of nested nodes per node
+    :param node_id: ID of the generated node
+    :return: The Claims
+    """
+    # The root node uses `id` like the Claims expected by the API, which is mapped to `@id` by the credentials context
+    node = {"id" if node_id == "root" else "@id": "https://benchmark.example.org/{}".format(node_id),
+            "@type": "example:ExampleServiceOffering"}
+    for index in range(literal_count):
+        if index % 3 == 0:
+            node["example:property{}".format(index)] = {"@type": "xsd:string", "@value": "value {}".format(index)}
+        elif index % 3 == 1:
+            node["example:property{}".format(index)] = {"@type": "xsd:integer", "@value": str(index)}
+        else:
+            node["example:property{}".format(index)] = {"@id": "https://benchmark.example.org/ref/{}".format(index)}
+    if nesting_depth > 0:
+        node["example:hasPart"] = [generate_claims(literal_count, nesting_depth - 1, children_per_node,
+                                                   "{}-{}".format(node_id, index))
+                                   for index in range(children_per_node)]
+    if node_id == "root":
+        node["@context"] = {"example": "https://benchmark.example.org/ontology/",
+                            "xsd": "http://www.w3.org/2001/XMLSchema#"}
+    return node
+
+
+def load_spec_claim_sets(spec_path: str) -> dict[str, dict]:
+    """
+    Create Claim sets from the examples of the API specification: the example of the schema `ServiceOfferingClaims`
+    (the request body of the `*-from-claims` endpoints) and the `credentialSubject` of the `/vp-from-vcs` example.
+    :param spec_path: Path of `openapi-spec.yaml`
+    :return: The Claim sets by name
+    """
+    with open(spec_path, "r") as spec_file:
+        spec = yaml.safe_load(spec_file)
+    vp_from_vcs_example = spec["paths"]["/vp-from-vcs"]["post"]["requestBody"]["content"]["application/json"]["example"]
+    claims_schema = {"$ref": "#/components/schemas/ServiceOfferingClaims"}
+    return {"spec_service_offering_claims": create_schema_example(spec, claims_schema),
+            "spec_example_service_offering": vp_from_vcs_example[0]["credentialSubject"]}
+
+
+def create_schema_example(spec: dict, schema: dict):
+    """
+    Assemble an example object from the examples of the properties of a schema.
+    """
+    if "$ref" in schema:
+        schema = spec["components"]["schemas"][schema["$ref"].rsplit("/", 1)[1]]
+    if schema.get("type") == "object":
+        return {name: create_schema_example(spec, property_schema)
+                for name, property_schema in schema.get("properties", {}).items()}
+    return schema.get("example")
+
+
+def create_claim_sets(spec_path: str) -> dict[str, dict]:
+    claim_sets = {name: generate_claims(literal_count, nesting_depth, children_per_node)
+                  for name, literal_count, nesting_depth, children_per_node in GENERATED_CLAIM_SETS}
+    claim_sets.update(load_spec_claim_sets(spec_path))
+    return claim_sets
+
+
+def create_credential(claims: dict) -> dict:
+    """
+    Create an unsigned Verifiable Credential in the same way as `SelfDescriptionProcessor`.
+    """
+    return {"@context": ["https://www.w3.org/2018/credentials/v1",
+                         "https://www.w3.org/2018/credentials/examples/v1"],
+            "type": ["VerifiableCredential"],
+            "issuer": CREDENTIAL_ISSUER,
+            "issuanceDate": "2024-01-01T00:00:00Z",
+            "expirationDate": "2024-06-17T00:00:00Z",
+            "credentialSubject": json.loads(json.dumps(claims))}
+
+
+def measure(function: Callable, iterations: int, warmup: int, operations_per_call: int = 1) -> dict:
+    """
+    Call a function repeatedly and summarize the latencies.
+    :param function: Function to be measured, called without arguments
+    :param iterations: Number of measured calls
+    :param warmup: Number of calls before the measurement
+    :param operations_per_call: Number of operations performed by each call, used to compute the throughput
+    :return: Latency statistics in milliseconds and the throughput
+    """
+    for _ in range(warmup):
+        function()
+    latencies_ms = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        latencies_ms.append((time.perf_counter() - started) * 1000)
+    latencies_ms.sort()
+    return {"iterations": iterations,
+            "mean_ms": statistics.fmean(latencies_ms),
+            "p50_ms": percentile(latencies_ms, 50),
+            "p95_ms": percentile(latencies_ms, 95),
+            "p99_ms": percentile(latencies_ms, 99),
+            "min_ms": latencies_ms[0],
+            "max_ms": latencies_ms[-1],
+            "ops_per_sec": 1000 * iterations * operations_per_call / sum(latencies_ms) if sum(latencies_ms) > 0
+            else None}
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def write_signing_key(work_dir: str, key_type: str) -> tuple[JWK, str]:
+    signature_jwk = JWK.generate(**SIGNING_KEY_TYPES[key_type])
+    pem_path = os.path.join(work_dir, "signing-key.pem")
+    with open(pem_path, "wb") as pem_file:
+        pem_file.write(signature_jwk.export_to_pem(private_key=True, password=None))
+    return signature_jwk, pem_path
+
+
+def import_app(work_dir: str, pem_path: str, mock_services_url: str, use_legacy_signature: bool,
+               canonicalization_engine: str):
+    """
+    Import the Flask application configured for the benchmark. The configuration is read from environment variables
+    on import, so this must only be called once.
+    """
+    did_storage_path = os.path.join(work_dir, "did-http")
+    os.makedirs(did_storage_path)
+    os.environ.update({"CREDENTIAL_ISSUER": CREDENTIAL_ISSUER,
+                       "CREDENTIAL_ISSUER_PRIVATE_KEY_PEM_PATH": pem_path,
+                       "DID_STORAGE_TYPE": "local",
+                       "DID_STORAGE_PATH": did_storage_path,
+                       "JSONLD_OFFLINE_MODE": "true",
+                       "USE_LEGACY_CATALOGUE_SIGNATURE": str(use_legacy_signature),
+                       "JSONLD_CANONICALIZATION_ENGINE": canonicalization_engine,
+                       "KEYCLOAK_SERVER_URL": mock_services_url + "/",
+                       "FEDERATED_CATALOGUE_URL": mock_services_url,
+                       "FEDERATED_CATALOGUE_USER_NAME": "benchmark",
+                       "FEDERATED_CATALOGUE_USER_PASSWORD": "benchmark",
+                       "KEYCLOAK_CLIENT_SECRET": "benchmark",
+                       "OPERATING_MODE": "API"})
+    # The specification is loaded relative to the working directory
+    os.chdir(ROOT_DIR)
+    import self_description_creator
+    logging.getLogger().setLevel(logging.WARNING)
+    return self_description_creator.app
+
+
+def run_benchmarks(arguments: argparse.Namespace) -> list[dict]:
+    results = []
+    selected_benchmarks = arguments.benchmarks.split(",") if arguments.benchmarks else BENCHMARKS
+    claim_sets = create_claim_sets(os.path.join(ROOT_DIR, "openapi-spec.yaml"))
+    if arguments.claim_sets:
+        claim_sets = {name: claims for name, claims in claim_sets.items() if name in arguments.claim_sets.split(",")}
+
+    def record(benchmark: str, claim_set: str, function: Callable, operations_per_call: int = 1, **details) -> None:
+        if benchmark not in selected_benchmarks:
+            return
+        result = {"benchmark": benchmark, "claim_set": claim_set}
+        result.update(details)
+        result.update(measure(function, arguments.iterations, arguments.warmup, operations_per_call))
+        logging.warning("{benchmark} [claim_set: {claim_set}, details: {details}] p50: {p50:.2f} ms".format(
+            benchmark=benchmark, claim_set=claim_set, details=details, p50=result["p50_ms"]))
+        results.append(result)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        signature_jwk, pem_path = write_signing_key(work_dir, arguments.signing_key_type)
+        # Signing is measured for every suite, the other benchmarks use the selected key type
+        signature_suite_keys = {key_type: JWK.generate(**key_arguments)
+                                for key_type, key_arguments in SIGNING_KEY_TYPES.items()}
+        document_loader = CachingDocumentLoader(bundle_dir=DEFAULT_CONTEXT_BUNDLE_DIR, cache_size=100,
+                                                cache_ttl_sec=0, offline=True)
+        normalization_options = {"algorithm": "URDNA2015", "format": "application/n-quads",
+                                 "documentLoader": document_loader}
+        canonicalization_engine = CanonicalizationEngine(context_cache_size=100, context_cache_ttl_sec=0)
+        processor = SelfDescriptionProcessor(credential_issuer=CREDENTIAL_ISSUER, signature_jwk=signature_jwk,
+                                             use_legacy_catalogue_signature=arguments.legacy_signature,
+                                             did_store=None, document_loader=document_loader,
+                                             canonicalization_engine=canonicalization_engine
+                                             if arguments.canonicalization_engine == "optimized" else None)
+        did_stores = {"local": DIDStore("local", os.path.join(work_dir, "did-local"), "https://benchmark.example.org"),
+                      "sqlite": DIDStore("sqlite", os.path.join(work_dir, "did.sqlite"),
+                                         "https://benchmark.example.org")}
+        os.makedirs(os.path.join(work_dir, "did-local"))
+
+        mock_services = MockServices().start()
+        throttling_mock_services = MockServices(upload_delay_sec=BULK_UPLOAD_CATALOGUE_DELAY_SEC,
+                                                max_concurrent_uploads=BULK_UPLOAD_CATALOGUE_CONCURRENCY).start()
+        bulk_upload_client = FederatedCatalogueClient(
+            federated_catalogue_url=throttling_mock_services.url, keycloak_server_url=throttling_mock_services.url + "/",
+            federated_catalogue_user_name="benchmark", federated_catalogue_user_password="benchmark",
+            keycloak_client_secret="benchmark", connection_pool_size=16, retry_backoff_factor=0.01,
+            bulk_max_in_flight=16, bulk_max_attempts=10)
+        app = None
+        if any(benchmark.startswith("http_") for benchmark in selected_benchmarks):
+            app = import_app(work_dir, pem_path, mock_services.url, arguments.legacy_signature,
+                             arguments.canonicalization_engine)
+        try:
+            for name, claims in claim_sets.items():
+                credential = create_credential(claims)
+                canonical_credential = jsonld.normalize(credential, options=normalization_options)
+                hashed_credential = sha256(canonical_credential.encode("utf-8")).hexdigest()
+                size = {"claims_bytes": len(json.dumps(claims)), "nquads": canonical_credential.count("\n")}
+
+                record("normalization", name,
+                       lambda: jsonld.normalize(credential, options=normalization_options), engine="pyld", **size)
+                record("normalization", name,
+                       lambda: canonicalization_engine.normalize(credential, options=normalization_options),
+                       engine="optimized", **size)
+                record("hashing", name, lambda: sha256(canonical_credential.encode("utf-8")).hexdigest(), **size)
+                for suite_jwk in signature_suite_keys.values():
+                    algorithm = get_signature_suite(suite_jwk).algorithm
+                    record("signing", name, lambda: sign(suite_jwk, hashed_credential, algorithm), algorithm=algorithm)
+                record("add_proof", name, lambda: processor.add_proof(create_credential(claims)), **size)
+                record("create_self_description", name, lambda: processor.create_self_description(
+                    json.loads(json.dumps(claims))), **size)
+                signed_credential = processor.add_proof(create_credential(claims))
+                for storage_type, did_store in did_stores.items():
+                    record("did_store_write", name, lambda: did_store.save_object_into_storage(
+                        did_store.create_transient_did_store_object(dict(signed_credential))),
+                           storage_type=storage_type, **size)
+                self_description = processor.create_self_description(json.loads(json.dumps(claims)))
+                record("bulk_upload", name, lambda: bulk_upload(bulk_upload_client, self_description),
+                       batch_size=BULK_UPLOAD_SIZE, catalogue_concurrency=BULK_UPLOAD_CATALOGUE_CONCURRENCY)
+                if app is not None:
+                    client = app.test_client()
+                    body = json.dumps(claims)
+                    for benchmark, path in [("http_vc_from_claims", "/vc-from-claims"),
+                                            ("http_vp_from_claims", "/vp-from-claims"),
+                                            ("http_upload_from_claims", "/federated-catalogue/upload-from-claims")]:
+                        record(benchmark, name, lambda: post(client, path, body), **size)
+            if "signing_pool" in selected_benchmarks:
+                pool_results = []
+                for pool_size in parse_signing_pool_sizes(arguments.signing_pool_sizes):
+                    results_count = len(results)
+                    run_signing_pool_benchmark(record, pool_size, signature_jwk, claim_sets, arguments)
+                    pool_results.extend(results[results_count:])
+                add_signing_pool_scaling(pool_results)
+        finally:
+            mock_services.stop()
+            throttling_mock_services.stop()
+            for did_store in did_stores.values():
+                did_store.close()
+    return results
+
+
+def parse_signing_pool_sizes(signing_pool_sizes: str) -> list[int]:
+    """
+    :param signing_pool_sizes: Comma-separated pool sizes, all sizes from 1 to the number of CPU cores if empty
+    """
+    if signing_pool_sizes:
+        return [int(pool_size) for pool_size in signing_pool_sizes.split(",")]
+    return list(range(1, (os.cpu_count() or 1) + 1))
+
+
+def run_signing_pool_benchmark(record: Callable, pool_size: int, signature_jwk: JWK, claim_sets: dict[str, dict],
+                               arguments: argparse.Namespace) -> None:
+    """
+    Measure the throughput of a signing pool of the given size like with `SIGNING_POOL_SIZE`. Each measured call
+    submits `SIGNING_POOL_SUBMITTERS_PER_WORKER` Proofs per worker concurrently, like parallel requests of Gunicorn
+    threads, and waits for all of them.
+    """
+    submitters = pool_size * SIGNING_POOL_SUBMITTERS_PER_WORKER
+    canonicalization_kwargs = None
+    if arguments.canonicalization_engine == "optimized":
+        canonicalization_kwargs = {"context_cache_size": 100, "context_cache_ttl_sec": 0}
+    signing_pool = SigningPool(pool_size=pool_size, queue_size=submitters, queue_timeout_sec=60,
+                               signature_jwk=signature_jwk,
+                               processor_kwargs={"credential_issuer": CREDENTIAL_ISSUER,
+                                                 "use_legacy_catalogue_signature": arguments.legacy_signature,
+                                                 "verification_method_fragment":
+                                                     get_signature_suite(signature_jwk).verification_method_fragment},
+                               document_loader_kwargs={"bundle_dir": DEFAULT_CONTEXT_BUNDLE_DIR, "cache_size": 100,
+                                                       "cache_ttl_sec": 0, "offline": True},
+                               canonicalization_kwargs=canonicalization_kwargs)
+    try:
+        signing_pool.warm_up(timeout_sec=60)
+        with ThreadPoolExecutor(max_workers=submitters) as submitter_executor:
+            for name, claims in claim_sets.items():
+                def add_proofs():
+                    futures = [submitter_executor.submit(signing_pool.add_proof, create_credential(claims))
+                               for _ in range(submitters)]
+                    for future in futures:
+                        future.result()
+
+                record("signing_pool", name, add_proofs, operations_per_call=submitters, pool_size=pool_size,
+                       submitters=submitters)
+    finally:
+        signing_pool.shutdown()
+
+
+def add_signing_pool_scaling(pool_results: list[dict]) -> None:
+    """
+    Add the throughput relative to a pool with a single worker to the results of the benchmark `signing_pool`, which
+    is close to the pool size if the throughput scales linearly with the number of cores.
+    """
+    single_worker_ops_per_sec = {result["claim_set"]: result["ops_per_sec"] for result in pool_results
+                                 if result["pool_size"] == 1}
+    for result in pool_results:
+        if single_worker_ops_per_sec.get(result["claim_set"]):
+            result["scaling"] = result["ops_per_sec"] / single_worker_ops_per_sec[result["claim_set"]]
+
+
+def sign(signature_jwk: JWK, payload: str, algorithm: str) -> str:
+    jws_token = jws.JWS(payload)
+    jws_token.add_signature(signature_jwk, protected='{"b64":false,"crit":["b64"],"alg":"%s"}' % algorithm,
+                            alg=algorithm)
+    return jws_token.objects["signature"]
+
+
+def bulk_upload(client: FederatedCatalogueClient, self_description: dict) -> None:
+    results = client.send_many_to_federated_catalogue(self_description for _ in range(BULK_UPLOAD_SIZE))
+    failed = [result for result in results if result["status"] != "success"]
+    if failed:
+        raise RuntimeError("Bulk upload failed [failed: {}, first_error: {}]".format(len(failed), failed[0]["error"]))
+
+
+def post(client, path: str, body: str) -> None:
+    response = client.post(path, data=body, content_type="application/json")
+    if response.status_code >= 300:
+        raise RuntimeError("Request to {} failed [status: {}, body: {}]".format(path, response.status_code,
+                                                                               response.get_data(as_text=True)))
+
+
+def compare_with_baseline(results: list[dict], baseline_path: str, max_regression: float) -> list[dict]:
+    """
+    :return: The benchmarks whose median is more than `max_regression` slower than in the baseline
+    """
+    with open(baseline_path, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+
+    def key(result: dict) -> tuple:
+        return (result["benchmark"], result["claim_set"], result.get("storage_type"), result.get("engine"),
+                result.get("algorithm"), result.get("pool_size"))
+
+    baseline_results = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get(key(result))
+        if baseline_result is None or baseline_result["p50_ms"] <= 0:
+            continue
+        ratio = result["p50_ms"] / baseline_result["p50_ms"]
+        if ratio > 1 + max_regression:
+            regressions.append({"benchmark": result["benchmark"], "claim_set": result["claim_set"],
+                                "storage_type": result.get("storage_type"), "engine": result.get("engine"),
+                                "algorithm": result.get("algorithm"), "pool_size": result.get("pool_size"),
+                                "baseline_p50_ms": baseline_result["p50_ms"],
+                                "p50_ms": result["p50_ms"], "ratio": ratio})
+    return regressions
+
+
+def parse_arguments(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the creation of Self Descriptions.")
+    parser.add_argument("--iterations", type=int, default=20, help="Number of measured calls per benchmark")
+    parser.add_argument("--warmup", type=int, default=3, help="Number of calls before each measurement")
+    parser.add_argument("--benchmarks", default="", help="Comma-separated benchmarks to run: " + ",".join(BENCHMARKS))
+    parser.add_argument("--claim-sets", default="", help="Comma-separated Claim sets to use (default: all)")
+    parser.add_argument("--legacy-signature", action="store_true",
+                        help="Sign in the same way as with USE_LEGACY_CATALOGUE_SIGNATURE")
+    parser.add_argument("--canonicalization-engine", default="optimized", choices=["optimized", "pyld"],
+                        help="Engine used to create Proofs, see JSONLD_CANONICALIZATION_ENGINE")
+    parser.add_argument("--signing-key-type", default="RSA", choices=list(SIGNING_KEY_TYPES),
+                        help="Type of the key used by all benchmarks except signing, which covers every type")
+    parser.add_argument("--signing-pool-sizes", default="",
+                        help="Comma-separated pool sizes of the benchmark signing_pool (default: 1 to the CPU count)")
+    parser.add_argument("--output", default="", help="File the results are written to (default: stdout)")
+    parser.add_argument("--baseline", default="", help="Results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed relative increase of the median latency compared to the baseline")
+    return parser.parse_args(args)
+
+
+def main(args: list[str]) -> int:
+    arguments = parse_arguments(args)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    # Keeps stdout clean for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_benchmarks(arguments)
+    report = {"metadata": {"created": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
+                           "python": platform.python_version(),
+                           "platform": platform.platform(),
+                           "cpu_count": os.cpu_count(),
+                           "iterations": arguments.iterations,
+                           "legacy_signature": arguments.legacy_signature,
+                           "canonicalization_engine": arguments.canonicalization_engine,
+                           "signing_key_type": arguments.signing_key_type},
+              "results": results}
+    exit_code = 0
+    if arguments.baseline:
+        report["regressions"] = compare_with_baseline(results, arguments.baseline, arguments.max_regression)
+        exit_code = 1 if report["regressions"] else 0
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
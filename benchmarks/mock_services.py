@@ -0,0 +1,121 @@
+"""
+Local stand-ins for Keycloak and the XFSC Federated Catalogue, so that the upload path can be exercised without network
+access. Only the endpoints used by `FederatedCatalogueClient` are implemented.
+"""
+from __future__ import annotations  # used for linting (type annotations)
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _MockServer(ThreadingHTTPServer):
+    # Async clients open many connections at once, which would exceed the default listen backlog of 5
+    request_queue_size = 1024
+
+
+class MockServices:
+    """
+    Class can be used to run a Keycloak token endpoint and the Self Description endpoint of the Federated Catalogue in a
+    background thread. The Keycloak server URL is `<url>/` and the Federated Catalogue URL is `<url>`.
+    """
+
+    def __init__(self, upload_delay_sec: float = 0.0, port: int = 0, max_concurrent_uploads: int = 0,
+                 retry_after_sec: int | None = None) -> None:
+        """
+
+        :param upload_delay_sec: Time the Self Description endpoint waits before answering, to simulate a remote
+        Catalogue
+        :param port: Port to listen on, a free port is chosen if 0
+        :param max_concurrent_uploads: If above 0, uploads exceeding this number of concurrent uploads are rejected
+        with 429, to simulate a rate limited Catalogue
+        :param retry_after_sec: Value of the `Retry-After` header of rejected uploads, the header is omitted if `None`
+        """
+        self.upload_delay_sec = upload_delay_sec
+        self.max_concurrent_uploads = max_concurrent_uploads
+        self.retry_after_sec = retry_after_sec
+        self.counters = {"token_requests": 0, "uploads": 0, "throttled_uploads": 0, "max_concurrent_uploads_seen": 0}
+        self.__concurrent_uploads = 0
+        self.__lock = threading.Lock()
+        self.__server = _MockServer(("127.0.0.1", port), self._create_handler())
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self) -> "MockServices":
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def _count(self, counter: str) -> None:
+        with self.__lock:
+            self.counters[counter] += 1
+
+    def _start_upload(self) -> bool:
+        with self.__lock:
+            if 0 < self.max_concurrent_uploads <= self.__concurrent_uploads:
+                self.counters["throttled_uploads"] += 1
+                return False
+            self.__concurrent_uploads += 1
+            self.counters["max_concurrent_uploads_seen"] = max(self.counters["max_concurrent_uploads_seen"],
+                                                               self.__concurrent_uploads)
+            return True
+
+    def _finish_upload(self) -> None:
+        with self.__lock:
+            self.__concurrent_uploads -= 1
+            self.counters["uploads"] += 1
+
+    def _create_handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, which would otherwise be delayed by Nagle's algorithm
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict, headers: dict | None = None) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.endswith("/protocol/openid-connect/token"):
+                    services._count("token_requests")
+                    self._send_json(200, {"access_token": "mock-access-token",
+                                          "refresh_token": "mock-refresh-token",
+                                          "token_type": "Bearer",
+                                          "expires_in": 300,
+                                          "refresh_expires_in": 1800})
+                elif self.path.endswith("/self-descriptions"):
+                    if not services._start_upload():
+                        headers = {} if services.retry_after_sec is None else {
+                            "Retry-After": str(services.retry_after_sec)}
+                        self._send_json(429, {"error": "too many requests"}, headers)
+                        return
+                    try:
+                        if services.upload_delay_sec > 0:
+                            time.sleep(services.upload_delay_sec)
+                    finally:
+                        services._finish_upload()
+                    self._send_json(201, {"status": "created"})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+        return Handler
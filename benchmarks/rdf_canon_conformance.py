@@ -0,0 +1,89 @@
+"""
+Conformance check of the optimized canonicalization engine against the W3C RDF Dataset Canonicalization test suite
+(https://github.com/w3c/rdf-canon). The suite isn't bundled, so the manifest of a local checkout has to be given:
+
+    git clone https://github.com/w3c/rdf-canon.git
+    python benchmarks/rdf_canon_conformance.py rdf-canon/tests/manifest.jsonld
+
+The input of every evaluation test is canonicalized by the first degree labeling of `canonicalization.py` (falling back
+to PyLD if blank nodes share a hash, like the engine does) and compared to the expected N-Quads and to the output of
+PyLD. Tests of other hash algorithms and of the issued identifier maps are skipped. The exit code is 1 if any output
+differs.
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+
+from pyld.jsonld import JsonLdProcessor, URDNA2015
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+from canonicalization import canonicalize_dataset  # noqa: E402
+
+NORMALIZATION_OPTIONS = {"algorithm": "URDNA2015", "format": "application/n-quads"}
+
+
+def parse_arguments(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the W3C RDF Dataset Canonicalization test suite.")
+    parser.add_argument("manifest", help="Path of tests/manifest.jsonld of a checkout of w3c/rdf-canon")
+    parser.add_argument("--verbose", action="store_true", help="Print the result of every test")
+    return parser.parse_args(args)
+
+
+def read_file(manifest_dir: str, path: str) -> str:
+    with open(os.path.join(manifest_dir, path), encoding="utf-8") as file:
+        return file.read()
+
+
+def run_test(manifest_dir: str, test: dict) -> tuple[str, str]:
+    """
+    :param manifest_dir: Folder of the manifest, the paths of the tests are relative to it
+    :param test: Entry of the manifest
+    :return: The result (`passed`, `failed` or `skipped`) and the labeling algorithm or the reason of the result
+    """
+    test_types = test.get("type", test.get("@type", []))
+    if isinstance(test_types, str):
+        test_types = [test_types]
+    if not any(test_type.endswith("EvalTest") for test_type in test_types):
+        return "skipped", "not an evaluation test"
+    if test.get("hashAlgorithm", "SHA256") != "SHA256":
+        return "skipped", "hash algorithm " + test["hashAlgorithm"]
+    if not test.get("result", "").endswith(".nq"):
+        return "skipped", "result isn't N-Quads"
+    dataset = JsonLdProcessor.parse_nquads(read_file(manifest_dir, test["action"]))
+    expected = read_file(manifest_dir, test["result"])
+    canonical_nquads = canonicalize_dataset(dataset)
+    algorithm = "first_degree"
+    if canonical_nquads is None:
+        canonical_nquads = URDNA2015().main(copy.deepcopy(dataset), NORMALIZATION_OPTIONS)
+        algorithm = "pyld"
+    if canonical_nquads != expected:
+        return "failed", algorithm + " output differs from the expected result"
+    if canonical_nquads != URDNA2015().main(copy.deepcopy(dataset), NORMALIZATION_OPTIONS):
+        return "failed", algorithm + " output differs from PyLD"
+    return "passed", algorithm
+
+
+def main(args: list[str]) -> int:
+    arguments = parse_arguments(args)
+    manifest_dir = os.path.dirname(os.path.abspath(arguments.manifest))
+    with open(arguments.manifest, encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    results = {"passed": 0, "failed": 0, "skipped": 0}
+    for test in manifest.get("entries", manifest.get("sequence", [])):
+        try:
+            result, reason = run_test(manifest_dir, test)
+        except Exception as e:
+            result, reason = "failed", repr(e)
+        results[result] += 1
+        if arguments.verbose or result == "failed":
+            print("{id} {result} [{reason}]".format(id=test.get("id", test.get("@id")), result=result, reason=reason))
+    print(json.dumps(results))
+    return 1 if results["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,199 @@
+"""
+ASGI entry point of the application. The endpoints sending Self Descriptions to the XFSC Federated Catalogue are served
+by async handlers, so a request waiting for Keycloak or the Catalogue doesn't occupy a thread. Creating the Self
+Descriptions is CPU-bound and therefore runs in an executor. All other endpoints are served by the Flask application.
+
+    SERVER_INTERFACE=asgi gunicorn --config gunicorn.conf.py
+"""
+import asyncio
+import contextlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import self_description_creator as sd_creator
+from async_federated_catalogue_client import AsyncFederatedCatalogueClient
+from metrics import HTTP_REQUEST_SECONDS
+from self_description_processor import IdempotencyKeyConflictError
+
+
+
+def create_signing_executor() -> ThreadPoolExecutor:
+    """
+    Create the executor creating Self Descriptions for the async handlers. Its threads provide no CPU parallelism:
+    normalizations are serialized by `canonicalization.PYLD_LOCK` and signing holds the GIL. If a signing pool is
+    configured, the Proofs are created by its worker processes and the threads merely wait for them, so the executor
+    gets at least one thread per worker process to keep all of them busy.
+    :return: The executor
+    """
+    max_workers = sd_creator.ASYNC_SIGNING_THREADS
+    if sd_creator.signing_pool is not None:
+        max_workers = max(max_workers, sd_creator.SIGNING_POOL_SIZE)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-signing")
+
+
+signing_executor = create_signing_executor()
+# Variable will be initialized on first use by get_async_federated_catalogue_client() inside the event loop
+async_federated_catalogue_client: AsyncFederatedCatalogueClient | None = None
+
+
+def get_async_federated_catalogue_client() -> AsyncFederatedCatalogueClient:
+    """
+    Return the async client for the Federated Catalogue, which is shared across requests to reuse the cached Keycloak
+    token and the pooled connections.
+    :return: The shared client
+    """
+    global async_federated_catalogue_client
+    if async_federated_catalogue_client is None:
+        async_federated_catalogue_client = AsyncFederatedCatalogueClient(
+            federated_catalogue_url=sd_creator.FEDERATED_CATALOGUE_URL,
+            keycloak_server_url=sd_creator.KEYCLOAK_SERVER_URL,
+            federated_catalogue_user_name=sd_creator.FEDERATED_CATALOGUE_USER_NAME,
+            federated_catalogue_user_password=sd_creator.FEDERATED_CATALOGUE_USER_PASSWORD,
+            keycloak_client_secret=sd_creator.KEYCLOAK_CLIENT_SECRET,
+            keycloak_token_refresh_margin_sec=sd_creator.KEYCLOAK_TOKEN_REFRESH_MARGIN_SEC,
+            connection_pool_size=sd_creator.ASYNC_FEDERATED_CATALOGUE_CONNECTION_POOL_SIZE,
+            connect_timeout_sec=sd_creator.FEDERATED_CATALOGUE_CONNECT_TIMEOUT_SEC,
+            read_timeout_sec=sd_creator.FEDERATED_CATALOGUE_READ_TIMEOUT_SEC,
+            retry_backoff_factor=sd_creator.FEDERATED_CATALOGUE_RETRY_BACKOFF_FACTOR,
+            bulk_max_in_flight=sd_creator.FEDERATED_CATALOGUE_BULK_MAX_IN_FLIGHT,
+            bulk_max_attempts=sd_creator.FEDERATED_CATALOGUE_BULK_MAX_ATTEMPTS)
+    return async_federated_catalogue_client
+
+
+async def create_self_description(claims: dict, idempotency_key: str | None = None) -> dict:
+    """
+    Create a Self Description in the signing executor.
+    :param claims: The Claims of the Self Description
+    :param idempotency_key: Optional key of the signing cache
+    :return: The created Self Description
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        signing_executor, sd_creator.self_description_processor.create_self_description, claims, idempotency_key)
+
+
+async def get_json_request_body(request: Request):
+    if request.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+        raise TypeError("No proper request body found")
+    return json.loads(await request.body())
+
+
+async def read_batch_request_body(request: Request) -> bytes:
+    """
+    Read the body of a batch request, stopping as soon as it exceeds the maximum size.
+    :param request: The batch request
+    :return: The request body
+    """
+    content_length = request.headers.get("Content-Length")
+    if content_length is not None and int(content_length) > sd_creator.BATCH_MAX_BODY_BYTES:
+        raise sd_creator.BatchLimitExceededError(
+            "Request body exceeds the maximum size of {} bytes".format(sd_creator.BATCH_MAX_BODY_BYTES))
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > sd_creator.BATCH_MAX_BODY_BYTES:
+            break
+    return bytes(body)
+
+
+def create_error_response(error: Exception, status_code: int) -> JSONResponse:
+    error_msg = sd_creator.ERROR_MESSAGE_TEMPLATE.format(error_details=error.args)
+    sd_creator.app.logger.warning(error_msg)
+    return JSONResponse({"status": "failed", "error": error_msg}, status_code=status_code)
+
+
+def observe_request_latency(request: Request, status_code: int, request_start: float):
+    HTTP_REQUEST_SECONDS.labels(request.method, request.url.path, str(status_code)).observe(
+        time.perf_counter() - request_start)
+
+
+async def post_claims_to_federated_catalogue(request: Request) -> JSONResponse:
+    request_start = time.perf_counter()
+    try:
+        federated_catalogue_client = get_async_federated_catalogue_client()
+        claims: dict = await get_json_request_body(request)
+        sd_creator.check_if_id_is_present(claims)
+        self_description = await create_self_description(claims, request.headers.get("Idempotency-Key"))
+        await federated_catalogue_client.send_to_federated_catalogue(self_description)
+        response = JSONResponse({"status": "success"}, status_code=201)
+    except IdempotencyKeyConflictError as e:
+        response = create_error_response(e, 422)
+    except Exception as e:
+        response = create_error_response(e, 500)
+    observe_request_latency(request, response.status_code, request_start)
+    return response
+
+
+async def post_claims_batch_to_federated_catalogue(request: Request) -> JSONResponse:
+    request_start = time.perf_counter()
+    try:
+        federated_catalogue_client = get_async_federated_catalogue_client()
+        mimetype = request.headers.get("Content-Type", "").split(";")[0].strip()
+        items = sd_creator.parse_batch_request_body(await read_batch_request_body(request), mimetype)
+        response = JSONResponse(await upload_batch_to_federated_catalogue(items, federated_catalogue_client))
+    except sd_creator.BatchLimitExceededError as e:
+        response = create_error_response(e, 413)
+    except Exception as e:
+        response = create_error_response(e, 500)
+    observe_request_latency(request, response.status_code, request_start)
+    return response
+
+
+async def upload_batch_to_federated_catalogue(items: list, client: AsyncFederatedCatalogueClient) -> dict:
+    """
+    Async variant of `self_description_creator.upload_batch_to_federated_catalogue`. Self Descriptions are created in
+    the signing executor and each one is sent as soon as it has been created.
+    :param items: The items of the batch
+    :param client: The client used to send the Presentations
+    :return: A report with the number of succeeded and failed items and the result of every item
+    """
+    results = [None] * len(items)
+    # Item indexes by the index of their Self Description within the bulk upload
+    item_indexes = []
+    self_descriptions = []
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            if not isinstance(item, dict):
+                raise TypeError("Batch item must be a JSON object")
+            sd_creator.check_if_id_is_present(item)
+        except Exception as e:
+            error_msg = sd_creator.ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+            sd_creator.app.logger.warning(error_msg)
+            results[index] = {"index": index, "status": "failed", "error": error_msg}
+            continue
+        item_indexes.append(index)
+        self_descriptions.append(create_self_description(item))
+
+    for upload_result in await client.send_many_to_federated_catalogue(self_descriptions):
+        index = item_indexes[upload_result["index"]]
+        results[index] = dict(upload_result, index=index)
+    for index in range(len(results)):
+        if results[index] is None:
+            # The client reports every Self Description, a missing result must not fail the whole batch though
+            results[index] = {"index": index, "status": "failed", "error": sd_creator.ERROR_MESSAGE_TEMPLATE.format(
+                error_details=("No upload result has been reported",))}
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    return {"status": "success", "succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_):
+    yield
+    if async_federated_catalogue_client is not None:
+        await async_federated_catalogue_client.close()
+
+
+app = Starlette(routes=[Route("/federated-catalogue/upload-from-claims", post_claims_to_federated_catalogue,
+                              methods=["POST"]),
+                        Route("/federated-catalogue/upload-from-claims/batch",
+                              post_claims_batch_to_federated_catalogue, methods=["POST"]),
+                        Mount("/", app=WsgiToAsgi(sd_creator.app))],
+                lifespan=lifespan)
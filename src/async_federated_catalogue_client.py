@@ -0,0 +1,317 @@
+from __future__ import annotations  # used for linting (type annotations)
+import asyncio
+import json
+import logging
+import time
+from collections.abc import Awaitable, Callable, Iterable
+
+import httpx
+
+from federated_catalogue_client import AIMDConcurrencyLimit, BulkUploadRetryPolicy, get_throttling, \
+    KeycloakTokenCache
+from metrics import FEDERATED_CATALOGUE_POST_SECONDS
+
+logger = logging.getLogger()
+
+KEYCLOAK_REALM = "gaia-x"
+KEYCLOAK_CLIENT_ID = "federated-catalogue"
+
+
+def get_keycloak_token_url(keycloak_server_url: str) -> str:
+    """
+    :param keycloak_server_url: Base URL of Keycloak, with or without trailing slash
+    :return: URL of the token endpoint of the realm of the Federated Catalogue
+    """
+    return "{}/realms/{}/protocol/openid-connect/token".format(keycloak_server_url.rstrip("/"), KEYCLOAK_REALM)
+
+
+class AsyncFederatedCatalogueClient:
+    """
+    Asyncio variant of `FederatedCatalogueClient`. Requests to Keycloak and the XFSC Federated Catalogue don't block a
+    thread while waiting for the response, so a single event loop can hold thousands of uploads in flight. The client
+    must be used by the event loop it has been created in.
+    """
+
+    def __init__(self, federated_catalogue_url: str, keycloak_server_url: str, federated_catalogue_user_name: str,
+                 federated_catalogue_user_password: str, keycloak_client_secret: str,
+                 keycloak_token_refresh_margin_sec: float = 30.0, connection_pool_size: int = 100,
+                 connect_timeout_sec: float = 5.0, read_timeout_sec: float = 60.0, retry_backoff_factor: float = 0.5,
+                 bulk_max_in_flight: int = 8, bulk_max_attempts: int = 5):
+        """
+
+        :param federated_catalogue_url:
+        :param keycloak_server_url:
+        :param federated_catalogue_user_name:
+        :param federated_catalogue_user_password:
+        :param keycloak_client_secret:
+        :param keycloak_token_refresh_margin_sec: Cached tokens are refreshed this many seconds before they expire
+        :param connection_pool_size: Maximum number of connections to the Federated Catalogue. Further requests wait for
+        a free connection, which doesn't block a thread.
+        :param connect_timeout_sec: Timeout for establishing a connection to the Federated Catalogue
+        :param read_timeout_sec: Timeout for waiting on the response of the Federated Catalogue
+        :param retry_backoff_factor: Factor of the exponential backoff between retries of throttled bulk uploads
+        :param bulk_max_in_flight: Maximum number of Self Descriptions sent concurrently by
+        `send_many_to_federated_catalogue`
+        :param bulk_max_attempts: Maximum number of attempts per Self Description in `send_many_to_federated_catalogue`
+        if the Federated Catalogue responds with 429 or 503
+        """
+        if not federated_catalogue_url or \
+                not keycloak_server_url or \
+                not federated_catalogue_user_name or \
+                not federated_catalogue_user_password or \
+                not keycloak_client_secret:
+            err_msg = "Request to Federated Catalogue cannot be performed due to missing environment variables"
+            logger.warning(err_msg)
+            raise NameError(err_msg)
+        self.__federated_catalogue_url = federated_catalogue_url
+        self.__token_url = get_keycloak_token_url(keycloak_server_url)
+        self.__federated_catalogue_user_name = federated_catalogue_user_name
+        self.__federated_catalogue_user_password = federated_catalogue_user_password
+        self.__keycloak_client_secret = keycloak_client_secret
+        self.__bulk_max_in_flight = max(bulk_max_in_flight, 1)
+        self.__bulk_retry_policy = BulkUploadRetryPolicy(max_attempts=bulk_max_attempts,
+                                                         backoff_factor=retry_backoff_factor)
+        self.__http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout_sec, connect=connect_timeout_sec, pool=None),
+            limits=httpx.Limits(max_connections=connection_pool_size,
+                                max_keepalive_connections=connection_pool_size))
+        self.__token_cache = KeycloakTokenCache(refresh_margin_sec=keycloak_token_refresh_margin_sec)
+        # Ensures that concurrent requests share a single token fetch
+        self.__token_lock = asyncio.Lock()
+
+    async def send_to_federated_catalogue(self, self_description: dict):
+        """
+        Send Self Description to GXFS Federated Catalogue.
+        :param self_description: Self Description to be send
+        """
+        response = await self._send_self_description(json.dumps(self_description))
+        if response.is_success:
+            logger.debug("SD successfully sent to Federated Catalogue")
+        else:
+            error_msg = "An error occurred while sending Self Description to Federated Catalogue " \
+                        "[status_code: {}, response_body: {}".format(response.status_code, response.text)
+            raise IOError(error_msg)
+
+    async def send_many_to_federated_catalogue(self, self_descriptions: Iterable[Awaitable[dict] | dict],
+                                               on_result: Callable[[dict], None] | None = None,
+                                               max_in_flight: int | None = None) -> list[dict]:
+        """
+        Send many Self Descriptions to GXFS Federated Catalogue concurrently, adapting the number of requests in flight
+        to the load of the Catalogue like `FederatedCatalogueClient.send_many_to_federated_catalogue`. Items can be
+        awaitables, e.g. futures of Self Descriptions created in an executor, which are awaited as part of their
+        upload. An item whose awaitable raises is reported as failed.
+        :param self_descriptions: Self Descriptions or awaitables returning them
+        :param on_result: Function that is called with the result of each Self Description as soon as it is known,
+        results are not collected if it is set
+        :param max_in_flight: Maximum number of concurrent requests, defaults to `bulk_max_in_flight`
+        :return: Results in the order of the Self Descriptions, each containing its index, status ("success" or
+        "failed"), the last status code, the number of attempts and an error message for failed ones
+        """
+        limiter = AsyncAdaptiveConcurrencyLimiter(max_limit=max(max_in_flight or self.__bulk_max_in_flight, 1))
+        results = []
+
+        async def send(index: int, item):
+            try:
+                result = await self._send_with_rate_control(index, item, limiter)
+            except Exception as e:
+                # Every Self Description must be reported, otherwise the caller would miss its result
+                logger.error("An error occurred while sending Self Description of a bulk upload [index: {index}, "
+                             "error: {error}]".format(index=index, error=e.args))
+                result = {"index": index, "status": "failed", "status_code": None, "attempts": 0,
+                          "error": "An error occurred while sending Self Description to Federated Catalogue "
+                                   "[error: {error}]".format(error=e.args)}
+            try:
+                if on_result is not None:
+                    on_result(result)
+                else:
+                    results.append(result)
+            except Exception as e:
+                logger.error("An error occurred while handling the result of a bulk upload [index: {index}, "
+                             "error: {error}]".format(index=index, error=e.args))
+
+        await asyncio.gather(*[send(index, item) for index, item in enumerate(self_descriptions)])
+        results.sort(key=lambda result: result["index"])
+        return results
+
+    async def _send_with_rate_control(self, index: int, item,
+                                      limiter: AsyncAdaptiveConcurrencyLimiter) -> dict:
+        """
+        Send a single Self Description of a bulk upload, retrying it as long as the Catalogue is throttling.
+        :param index: Index of the Self Description within the bulk upload
+        :param item: Self Description to be sent or an awaitable returning it
+        :param limiter: The limiter shared by all requests of the bulk upload
+        :return: The result of the Self Description
+        """
+        result = {"index": index, "status": "failed", "status_code": None, "attempts": 0}
+        try:
+            self_description = await item if isinstance(item, Awaitable) else item
+            result["id"] = self_description.get("id")
+            request_body = json.dumps(self_description)
+        except Exception as e:
+            result["error"] = "Self Description can't be created [error: {error}]".format(error=e.args)
+            return result
+        while True:
+            result["attempts"] += 1
+            started = await limiter.acquire()
+            try:
+                response = await self._send_self_description(request_body)
+            except Exception as e:
+                # Without a response there is no sign of overload, so the limit is neither decreased nor increased
+                await limiter.release(started, failed=True)
+                self.__bulk_retry_policy.handle_error(result, e)
+                return result
+            throttled, retry_after_sec = get_throttling(response)
+            await limiter.release(started, throttled=throttled, retry_after_sec=retry_after_sec)
+            retry_delay_sec = self.__bulk_retry_policy.handle_response(result, response.status_code,
+                                                                       response.is_success, response.text,
+                                                                       retry_after_sec)
+            if retry_delay_sec is None:
+                return result
+            await asyncio.sleep(retry_delay_sec)
+
+    async def _send_self_description(self, request_body: str) -> httpx.Response:
+        """
+        Post a serialized Self Description and retry once with a new token if the token has been rejected.
+        :param request_body: The serialized Self Description
+        :return: The response of the Federated Catalogue
+        """
+        response = await self._post_self_description(request_body)
+        if response.status_code == 401:
+            # The cached token might have been revoked, so a new one is requested and the request is retried once
+            logger.info("Federated Catalogue rejected token, retrying with new token")
+            self._invalidate_keycloak_token()
+            response = await self._post_self_description(request_body)
+        return response
+
+    async def _post_self_description(self, request_body: str) -> httpx.Response:
+        """
+        Post a serialized Self Description to the GXFS Federated Catalogue.
+        :param request_body: The serialized Self Description
+        :return: The response of the Federated Catalogue
+        """
+        token = await self._get_keycloak_token()
+        headers = {"Content-Type": "application/json",
+                   "Authorization": "Bearer {}".format(token["access_token"])}
+        start = time.perf_counter()
+        response = await self.__http_client.post(self.__federated_catalogue_url + "/self-descriptions",
+                                                 headers=headers, content=request_body.encode("utf-8"))
+        FEDERATED_CATALOGUE_POST_SECONDS.labels(str(response.status_code)).observe(time.perf_counter() - start)
+        return response
+
+    async def _get_keycloak_token(self) -> dict:
+        """
+        Retrieve JWT from Keycloak. The token is cached and refreshed shortly before it expires, using the refresh
+        token if it is still valid.
+        :return: The retrieved JWT
+        """
+        token = self.__token_cache.get_valid_token()
+        if token is not None:
+            return token
+        async with self.__token_lock:
+            # Another task might have fetched a new token in the meantime
+            token = self.__token_cache.get_valid_token()
+            if token is not None:
+                return token
+            started = time.monotonic()
+            refresh_token = self.__token_cache.get_refresh_token(started)
+            grant_type = "password"
+            try:
+                if refresh_token is not None:
+                    try:
+                        token = await self._request_keycloak_token({"grant_type": "refresh_token",
+                                                                    "refresh_token": refresh_token})
+                        grant_type = "refresh_token"
+                    except Exception as e:
+                        logger.info("Refreshing Keycloak token failed, requesting new token [error: {error}]"
+                                    .format(error=e.args))
+                if token is None:
+                    token = await self._request_keycloak_token({"grant_type": "password",
+                                                                "username": self.__federated_catalogue_user_name,
+                                                                "password": self.__federated_catalogue_user_password})
+            except Exception:
+                self.__token_cache.put_failure(grant_type, started)
+                raise
+            self.__token_cache.put(token, grant_type, started)
+            return token
+
+    async def _request_keycloak_token(self, grant: dict) -> dict:
+        """
+        Send a request to the token endpoint of Keycloak.
+        :param grant: The grant specific form parameters
+        :return: The token response
+        """
+        data = dict(grant, client_id=KEYCLOAK_CLIENT_ID, client_secret=self.__keycloak_client_secret)
+        response = await self.__http_client.post(self.__token_url, data=data)
+        if not response.is_success:
+            raise IOError("Keycloak token request failed [status_code: {}, response_body: {}]"
+                          .format(response.status_code, response.text))
+        return response.json()
+
+    def _invalidate_keycloak_token(self):
+        """
+        Discard the cached JWT, so that a new one is requested on the next call of `_get_keycloak_token`.
+        """
+        self.__token_cache.invalidate()
+
+    def get_token_statistics(self) -> dict:
+        """
+        :return: Counters and latencies of the token requests sent to Keycloak
+        """
+        return self.__token_cache.get_statistics()
+
+    async def close(self):
+        """
+        Close the pooled connections.
+        """
+        await self.__http_client.aclose()
+
+
+class AsyncAdaptiveConcurrencyLimiter:
+    """
+    Asyncio variant of `AdaptiveConcurrencyLimiter`, limiting the number of concurrent requests of tasks to an
+    `AIMDConcurrencyLimit`.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, decrease_factor: float = 0.5):
+        """
+
+        See `AIMDConcurrencyLimit`.
+        """
+        self.__limit = AIMDConcurrencyLimit(max_limit, min_limit, decrease_factor)
+        self.__condition = asyncio.Condition()
+
+    @property
+    def limit(self) -> float:
+        return self.__limit.limit
+
+    async def acquire(self) -> float:
+        """
+        Wait until a request may be started.
+        :return: The time the request has been started, to be passed to `release`
+        """
+        async with self.__condition:
+            while True:
+                pause_sec = self.__limit.get_pause_sec(time.monotonic())
+                if pause_sec > 0:
+                    try:
+                        await asyncio.wait_for(self.__condition.wait(), pause_sec)
+                    except asyncio.TimeoutError:
+                        pass
+                elif self.__limit.is_full():
+                    await self.__condition.wait()
+                else:
+                    break
+            return self.__limit.start(time.monotonic())
+
+    async def release(self, started: float, throttled: bool = False, retry_after_sec: float | None = None,
+                      failed: bool = False):
+        """
+        Mark a request as finished and adapt the limit.
+        :param started: The time returned by `acquire`
+        :param throttled: Whether the request has been rejected due to overload
+        :param retry_after_sec: Delay requested by the server, all requests are paused until it has passed
+        :param failed: Whether the request failed without response, see `AIMDConcurrencyLimit.finish`
+        """
+        async with self.__condition:
+            self.__limit.finish(started, time.monotonic(), throttled, retry_after_sec, failed)
+            self.__condition.notify_all()
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Class can be used as a thread-safe, size-bounded LRU cache whose entries optionally expire after a given time.
+    """
+
+    def __init__(self, max_size: int, ttl_sec: float = 0):
+        """
+
+        :param max_size: Maximum number of entries kept in the cache. The least recently used entry is evicted first.
+        :param ttl_sec: Time in seconds after which an entry expires. A value <= 0 means entries never expire.
+        """
+        self.__max_size = max_size
+        self.__ttl_sec = ttl_sec
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for a key and mark it as recently used.
+        :param key: The key to look up
+        :param default: Value returned in case the key is not cached or has expired
+        :return: The cached value or `default`
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.__entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """
+        Add a value to the cache, evicting the least recently used entry if the cache is full.
+        :param key: The key of the value
+        :param value: The value to be cached
+        """
+        if self.__max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.__ttl_sec if self.__ttl_sec > 0 else None
+        with self.__lock:
+            self.__entries[key] = (value, expires_at)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """
+        Remove a key from the cache if present.
+        :param key: The key to be removed
+        """
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get_statistics(self) -> dict:
+        """
+        :return: Hit/miss counters and the current number of cached entries
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.__entries)}
@@ -0,0 +1,233 @@
+"""
+Canonicalization engine producing the same canonical N-Quads as `pyld.jsonld.normalize` (URDNA2015) with less CPU time.
+
+* Expansion: PyLD processes the contexts of every document again, since each type- or property-scoped context is
+  applied to a fresh copy of the active context. Processed contexts are cached, so the contexts of the credential
+  wrappers are only processed once.
+* Labeling: Most documents only contain blank nodes whose first degree hashes are unique, e.g. the nodes of the VC/VP
+  wrappers. In this case, the canonical labels follow from the sorted hashes and the Hash N-Degree Quads algorithm is
+  skipped. Documents with ties are labeled by PyLD.
+
+N-Quads input (`inputFormat` "application/n-quads") skips the expansion and is labeled the same way. Everything else
+(other algorithms or formats) is passed to PyLD as is.
+
+PyLD keeps resolved contexts in module-level LRU caches without locking. Threads normalizing at the same time corrupt
+them (e.g. "OrderedDict mutated during iteration", surfacing as "invalid scoped context"), so all normalizations of a
+process are serialized by `PYLD_LOCK`. Normalization holds the GIL anyway, so this costs little throughput; use a
+signing pool to normalize in parallel.
+"""
+from __future__ import annotations  # used for linting (type annotations)
+import json
+import threading
+import uuid
+from hashlib import sha256
+
+from pyld import jsonld
+from pyld.jsonld import JsonLdError, JsonLdProcessor, URDNA2015
+
+from cache import TTLCache
+from metrics import CANONICALIZATION_LABELING
+
+RDF_LANGSTRING = "http://www.w3.org/1999/02/22-rdf-syntax-ns#langString"
+XSD_STRING = "http://www.w3.org/2001/XMLSchema#string"
+# Serializes the use of PyLD within a process, see module description
+PYLD_LOCK = threading.Lock()
+
+
+def normalize_with_pyld(input_, options: dict) -> str:
+    """
+    `pyld.jsonld.normalize` serialized by `PYLD_LOCK`.
+    :param input_: The JSON-LD document
+    :param options: The normalization options
+    :return: The canonical N-Quads
+    """
+    with PYLD_LOCK:
+        return jsonld.normalize(input_, options)
+
+
+class CanonicalizationEngine:
+    """
+    Class can be used as a drop-in replacement of `pyld.jsonld.normalize`, see module description.
+    """
+
+    def __init__(self, context_cache_size: int, context_cache_ttl_sec: float) -> None:
+        """
+
+        :param context_cache_size: Maximum number of processed contexts kept in memory
+        :param context_cache_ttl_sec: Time in seconds after which a context is processed again, so that changes of
+        remote contexts are picked up like by the document loader
+        """
+        self.__context_cache = TTLCache(max_size=context_cache_size, ttl_sec=context_cache_ttl_sec)
+
+    def normalize(self, input_, options: dict) -> str:
+        """
+        Normalize a JSON-LD document. The signature matches `pyld.jsonld.normalize`.
+        :param input_: The JSON-LD document
+        :param options: The normalization options
+        :return: The canonical N-Quads
+        """
+        if (options.get("algorithm") != "URDNA2015" or options.get("format") != "application/n-quads"
+                or options.get("inputFormat") not in (None, "application/n-quads", "application/nquads")):
+            return normalize_with_pyld(input_, options)
+        if "inputFormat" in options:
+            # Parsing doesn't use the caches of PyLD, so it doesn't need the lock
+            dataset = JsonLdProcessor.parse_nquads(input_)
+        else:
+            to_rdf_options = {key: value for key, value in options.items() if key != "format"}
+            to_rdf_options["produceGeneralizedRdf"] = False
+            with PYLD_LOCK:
+                try:
+                    dataset = _ContextCachingJsonLdProcessor(self.__context_cache).to_rdf(input_, to_rdf_options)
+                except JsonLdError as cause:
+                    raise JsonLdError(
+                        "Could not convert input to RDF dataset before normalization.",
+                        "jsonld.NormalizeError", cause=cause)
+        # The dataset belongs to this call, so the labeling doesn't need the lock
+        canonical_nquads = canonicalize_dataset(dataset)
+        if canonical_nquads is not None:
+            CANONICALIZATION_LABELING.labels("first_degree").inc()
+            return canonical_nquads
+        CANONICALIZATION_LABELING.labels("pyld").inc()
+        return URDNA2015().main(dataset, options)
+
+
+class _ContextCachingJsonLdProcessor(JsonLdProcessor):
+    """
+    PyLD processor reusing processed contexts. Active contexts are never modified after processing (PyLD caches them
+    itself), so they can be shared across documents.
+    """
+
+    def __init__(self, context_cache: TTLCache) -> None:
+        super().__init__()
+        self.__context_cache = context_cache
+
+    def _process_context(self, active_ctx, local_ctx, options, override_protected=False, propagate=True,
+                         validate_scoped=True, cycles=None):
+        if cycles is None:
+            cycles = set()
+        if "_uuid" not in active_ctx:
+            # Context has been cloned by PyLD and is only valid for the current document
+            return super()._process_context(active_ctx, local_ctx, options, override_protected, propagate,
+                                            validate_scoped, cycles)
+        try:
+            cache_key = (active_ctx["_uuid"], json.dumps(local_ctx, sort_keys=True), override_protected, propagate,
+                         validate_scoped, options.get("base"), options.get("processingMode"))
+        except (TypeError, ValueError):
+            return super()._process_context(active_ctx, local_ctx, options, override_protected, propagate,
+                                            validate_scoped, cycles)
+        processed_ctx = self.__context_cache.get(cache_key)
+        if processed_ctx is None:
+            processed_ctx = super()._process_context(active_ctx, local_ctx, options, override_protected, propagate,
+                                                     validate_scoped, cycles)
+            # The ID is used as cache key of contexts processed on top of this one
+            processed_ctx.setdefault("_uuid", str(uuid.uuid4()))
+            self.__context_cache.put(cache_key, processed_ctx)
+        return processed_ctx
+
+
+def canonicalize_dataset(dataset: dict) -> str | None:
+    """
+    Label the blank nodes of an RDF dataset by their first degree hashes (URDNA2015 steps 1-5) and serialize it as
+    canonical N-Quads.
+    :param dataset: RDF dataset as returned by `pyld.jsonld.to_rdf`, which is not modified
+    :return: The canonical N-Quads or `None` if several blank nodes share a hash and the Hash N-Degree Quads algorithm
+    is required
+    """
+    # Terms are serialized once, blank nodes are recognizable by their prefix since IRIs and literals are quoted
+    serialized_terms = {}
+    quads = []
+    blank_node_quads = {}
+    for graph_name, triples in dataset.items():
+        if graph_name == "@default":
+            graph = None
+        elif graph_name.startswith("_:"):
+            graph = graph_name
+        else:
+            graph = "<" + graph_name + ">"
+        for triple in triples:
+            quad = (_serialize_term(triple["subject"], serialized_terms),
+                    _serialize_term(triple["predicate"], serialized_terms),
+                    _serialize_term(triple["object"], serialized_terms),
+                    graph)
+            quads.append(quad)
+            # Like PyLD, a quad is referenced once per position the blank node occurs in
+            for position in (0, 2, 3):
+                term = quad[position]
+                if term is not None and term.startswith("_:"):
+                    blank_node_quads.setdefault(term, []).append(quad)
+
+    blank_nodes_by_hash = {}
+    for blank_node, referencing_quads in blank_node_quads.items():
+        first_degree_hash = _hash_first_degree_quads(blank_node, referencing_quads)
+        if first_degree_hash in blank_nodes_by_hash:
+            return None
+        blank_nodes_by_hash[first_degree_hash] = blank_node
+    canonical_labels = {blank_node: "_:c14n" + str(index)
+                        for index, (_, blank_node) in enumerate(sorted(blank_nodes_by_hash.items()))}
+
+    nquads = [_serialize_quad(quad, canonical_labels.get) for quad in quads]
+    nquads.sort()
+    return "".join(nquads)
+
+
+def _hash_first_degree_quads(blank_node: str, quads: list[tuple]) -> str:
+    def replace(term):
+        return "_:a" if term == blank_node else "_:z"
+
+    nquads = [_serialize_quad(quad, replace) for quad in quads]
+    nquads.sort()
+    return sha256("".join(nquads).encode("utf-8")).hexdigest()
+
+
+def _serialize_quad(quad: tuple, replace_blank_node) -> str:
+    """
+    :param quad: Tuple of the serialized subject, predicate, object and graph (`None` for the default graph)
+    :param replace_blank_node: Function returning the label of a blank node, blank nodes are kept if it returns `None`
+    :return: The N-Quad as serialized by PyLD
+    """
+    subject, predicate, object_, graph = quad
+    if subject.startswith("_:"):
+        subject = replace_blank_node(subject) or subject
+    if object_.startswith("_:"):
+        object_ = replace_blank_node(object_) or object_
+    if graph is None:
+        return subject + " " + predicate + " " + object_ + " .\n"
+    if graph.startswith("_:"):
+        graph = replace_blank_node(graph) or graph
+    return subject + " " + predicate + " " + object_ + " " + graph + " .\n"
+
+
+def _serialize_term(component: dict, serialized_terms: dict) -> str:
+    """
+    Serialize an RDF term like `pyld.jsonld.JsonLdProcessor.to_nquad`.
+    :param component: The term as returned by `pyld.jsonld.to_rdf`
+    :param serialized_terms: Terms that have already been serialized for the current dataset
+    :return: The serialized term
+    """
+    term_type = component["type"]
+    if term_type == "blank node":
+        return component["value"]
+    if term_type == "IRI":
+        cache_key = component["value"]
+    else:
+        cache_key = (component["value"], component["datatype"], component.get("language"))
+    serialized_term = serialized_terms.get(cache_key)
+    if serialized_term is not None:
+        return serialized_term
+    if term_type == "IRI":
+        serialized_term = "<" + component["value"] + ">"
+    else:
+        escaped = (component["value"]
+                   .replace("\\", "\\\\")
+                   .replace("\t", "\\t")
+                   .replace("\n", "\\n")
+                   .replace("\r", "\\r")
+                   .replace("\"", "\\\""))
+        serialized_term = "\"" + escaped + "\""
+        if component["datatype"] == RDF_LANGSTRING:
+            if component.get("language"):
+                serialized_term += "@" + component["language"]
+        elif component["datatype"] != XSD_STRING:
+            serialized_term += "^^<" + component["datatype"] + ">"
+    serialized_terms[cache_key] = serialized_term
+    return serialized_term
@@ -1,10 +1,17 @@
+from __future__ import annotations  # used for linting (type annotations)
+import itertools
 import json
 import logging
 import os
 import shutil
+import threading
 import time
+from collections.abc import Iterable, Iterator
 
+from claim_file_leases import ClaimFileLeases
+from claim_file_reader import detect_claim_file_format, FILE_FORMAT_OBJECT, is_claim_file_name, iter_claim_records
 from federated_catalogue_client import FederatedCatalogueClient
+from metrics import CLAIM_FILES_FAILED, CLAIM_FILES_PROCESSED, CLAIM_RECORDS_PROCESSED, CLAIM_RECORDS_REJECTED
 from self_description_processor import SelfDescriptionProcessor
 
 logger = logging.getLogger()
@@ -36,7 +43,11 @@ class ClaimFileHandler:
                  claim_files_dir: str,
                  claim_files_cleanup_max_file_age_days: int,
                  self_description_processor: SelfDescriptionProcessor,
-                 federated_catalogue_client: FederatedCatalogueClient):
+                 federated_catalogue_client: FederatedCatalogueClient,
+                 upload_concurrency: int = 1,
+                 upload_queue_size: int = 0,
+                 checkpoint_interval: int = 100,
+                 claim_file_leases: ClaimFileLeases | None = None):
         """
 
         :param claim_files_dir: Folder where Claim files should be read from
@@ -46,35 +57,244 @@ class ClaimFileHandler:
         used to create Self Descriptions from Claim files
         :param federated_catalogue_client: An instance of `FederatedCatalogueClient` that will be
         used to send Self Descriptions to an instance of the Federated Catalogue
+        :param upload_concurrency: Maximum number of Self Descriptions sent to the Federated Catalogue concurrently. If
+        greater than 1, creating Self Descriptions and sending them are pipelined, otherwise files are processed one at
+        a time. Records of bulk files are always sent using the bulk upload of the client.
+        :param upload_queue_size: Maximum number of created Self Descriptions waiting to be sent. Creating further Self
+        Descriptions is blocked until a slot becomes available.
+        :param checkpoint_interval: Number of records of a bulk Claim file after which the progress is saved, so that
+        processing continues from there after a restart
+        :param claim_file_leases: Optional leases used to process every file by a single replica if several replicas
+        share the Claim files folder. Files are processed in place if not set.
         """
         self.__claim_files_dir = claim_files_dir
         self.__processed_files_dir = os.path.join(claim_files_dir, "processed")
         self.__failed_files_dir = os.path.join(claim_files_dir, "failed")
+        self.__checkpoints_dir = os.path.join(claim_files_dir, "checkpoints")
         self.__claim_files_cleanup_max_file_age_days = claim_files_cleanup_max_file_age_days
         self.__self_description_processor = self_description_processor
         self.__federated_catalogue_client = federated_catalogue_client
+        self.__upload_concurrency = upload_concurrency
+        self.__upload_queue_size = upload_queue_size
+        self.__checkpoint_interval = max(checkpoint_interval, 1)
+        self.__claim_file_leases = claim_file_leases
 
-    def process_claim_files(self):
+    def process_claim_files(self, file_names: list[str] | None = None):
         """
         Read Claim files from file system and create Self Descriptions for them. File content must contain
-        JSON-LD based Claims.
+        JSON-LD based Claims, either a single Claims object per file or many records in bulk files (NDJSON or a
+        top-level JSON array).
+        :param file_names: Names of the files to be processed. All files in the folder are processed if not set.
         """
-        file_list = os.listdir(self.__claim_files_dir)
-        for file_name in file_list:
-            file_path = os.path.join(self.__claim_files_dir, file_name)
-            if file_path.endswith("json"):
+        file_paths = self._lease_claim_files(self._list_claim_files(file_names))
+        if self.__upload_concurrency > 1:
+            self._process_claim_files_pipelined(file_paths)
+            return
+        for file_path in file_paths:
+            try:
+                self_description = self._create_self_description_from_file(file_path)
+                self._send_self_description(file_path, self_description)
+            except Exception as e:
+                self._handle_failed_file(file_path, e)
+
+    def _process_claim_files_pipelined(self, file_paths: Iterable[str]):
+        """
+        Create Self Descriptions from Claim files while previously created Self Descriptions are sent to the Federated
+        Catalogue by the bulk upload of the client. The number of pending uploads is bounded, so that Self Descriptions
+        are not created faster than they can be sent.
+        :param file_paths: Leased paths of Claim files containing a single Claims object, see `_lease_claim_files`
+        """
+        # File paths by the index of their Self Description within the bulk upload
+        uploaded_files = {}
+        upload_indexes = itertools.count()
+
+        def create_self_descriptions():
+            for file_path in file_paths:
+                try:
+                    self_description = self._create_self_description_from_file(file_path)
+                except Exception as e:
+                    self._handle_failed_file(file_path, e)
+                    continue
+                uploaded_files[next(upload_indexes)] = file_path
+                yield self_description
+
+        def handle_result(result: dict):
+            file_path = uploaded_files.pop(result["index"])
+            if result["status"] == "success":
+                self._handle_processed_file(file_path)
+            else:
+                self._handle_failed_file(file_path, IOError(result["error"]))
+
+        self.__federated_catalogue_client.send_many_to_federated_catalogue(
+            create_self_descriptions(), on_result=handle_result, max_in_flight=self.__upload_concurrency,
+            max_queued=self.__upload_queue_size)
+
+    def _process_bulk_claim_file(self, file_path: str, file_format: str):
+        """
+        Create and send a Self Description for every record of a bulk Claim file. Records are read incrementally, so
+        the file is never loaded completely. Records that fail are written to the reject file
+        `failed/<file name>.rejected.ndjson`, the file itself is moved to the folder of processed files once all
+        records have been handled. The progress is checkpointed, so after a restart processing continues after the
+        last checkpoint instead of starting from the beginning. Records after the checkpoint might be sent twice.
+        :param file_path: Path of the Claim file
+        :param file_format: Format of the file as returned by `detect_claim_file_format`
+        """
+        file_name = os.path.basename(file_path)
+        try:
+            progress = _BulkClaimFileProgress(
+                file_path=file_path,
+                checkpoint_path=os.path.join(self.__checkpoints_dir, file_name + ".checkpoint"),
+                reject_file_path=os.path.join(self.__failed_files_dir, file_name + ".rejected.ndjson"),
+                checkpoint_interval=self.__checkpoint_interval)
+        except Exception as e:
+            self._handle_failed_file(file_path, e)
+            return
+        logger.info("Start processing bulk file [file: {file_path}, format: {file_format}, offset: {offset}, "
+                    "record: {record}]".format(file_path=file_path, file_format=file_format,
+                                               offset=progress.offset, record=progress.next_record))
+        # Record numbers and Claims by the index of their Self Description within the bulk upload
+        uploaded_records = {}
+        upload_indexes = itertools.count()
+
+        def create_self_descriptions():
+            records = iter_claim_records(file_path, file_format, progress.offset)
+            for record, (claims, start_offset, end_offset) in enumerate(records, start=progress.next_record):
+                progress.start(record, start_offset, end_offset)
                 try:
-                    logger.info("Start processing file [file: {file_path}]".format(file_path=file_path))
-                    with open(file_path, "r") as file_content:
-                        claims = json.load(file_content)
+                    if isinstance(claims, Exception):
+                        raise claims
                     self_description = self.__self_description_processor.create_self_description(claims=claims)
-                    self.__federated_catalogue_client.send_to_federated_catalogue(self_description)
-                    move_file(file_path, self.__processed_files_dir)
-                    logger.info("File has been processed successfully [file: {file}]".format(file=file_path))
                 except Exception as e:
-                    logger.warning("An error occurred while processing file [file: {file}, error: {error}]"
-                                   .format(file=file_path, error=e.args))
-                    move_file(file_path, self.__failed_files_dir)
+                    progress.complete(record, claims, e)
+                    continue
+                uploaded_records[next(upload_indexes)] = (record, claims)
+                yield self_description
+
+        def handle_result(result: dict):
+            record, claims = uploaded_records.pop(result["index"])
+            if result["status"] == "success":
+                progress.complete(record)
+            else:
+                progress.complete(record, claims, IOError(result["error"]))
+
+        try:
+            self.__federated_catalogue_client.send_many_to_federated_catalogue(
+                create_self_descriptions(), on_result=handle_result, max_in_flight=self.__upload_concurrency,
+                max_queued=self.__upload_queue_size)
+        except BaseException as e:
+            # The progress is saved, so the file is continued in the next run (also on shutdown)
+            progress.close()
+            if not isinstance(e, Exception):
+                raise
+            logger.error("An error occurred while processing bulk file [file: {file}, error: {error}]"
+                         .format(file=file_path, error=e.args))
+            return
+        progress.finish()
+        move_file(file_path, self.__processed_files_dir)
+        CLAIM_FILES_PROCESSED.inc()
+        logger.info("Bulk file has been processed [file: {file}, processed_records: {processed}, "
+                    "rejected_records: {rejected}]".format(file=file_path, processed=progress.processed_records,
+                                                           rejected=progress.rejected_records))
+
+    def _list_claim_files(self, file_names: list[str] | None = None) -> list[str]:
+        """
+        :param file_names: Names of the files to be checked. All files in the folder are checked if not set.
+        :return: Paths of the Claim files that are waiting to be processed
+        """
+        if file_names is None:
+            file_names = os.listdir(self.__claim_files_dir)
+        file_paths = [os.path.join(self.__claim_files_dir, file_name) for file_name in file_names
+                      if is_claim_file_name(file_name)]
+        # Files might have been moved or processed in the meantime
+        return [file_path for file_path in file_paths if os.path.isfile(file_path)]
+
+    def _lease_claim_file(self, file_path: str) -> str | None:
+        """
+        :param file_path: Path of a Claim file in the Claim files folder
+        :return: The path the file is processed at or `None` if the file is processed by another replica
+        """
+        if self.__claim_file_leases is None:
+            return file_path
+        return self.__claim_file_leases.lease(file_path)
+
+    def _lease_claim_files(self, file_paths: list[str]) -> Iterator[str]:
+        """
+        Lease Claim files one at a time right before they are processed, so that files are spread across the replicas
+        instead of being leased by the first replica listing them. The format of a file is only detected once it has
+        been leased, so files are never read by replicas that don't process them. Bulk files are processed right away,
+        files that can't be read are moved to the folder of failed files.
+        :param file_paths: Paths of Claim files in the Claim files folder
+        :return: The paths the files containing a single Claims object are processed at, files processed by other
+        replicas are skipped
+        """
+        for file_path in file_paths:
+            leased_file_path = self._lease_claim_file(file_path)
+            if leased_file_path is None:
+                continue
+            try:
+                file_format = detect_claim_file_format(leased_file_path)
+            except FileNotFoundError:
+                # Removed in the meantime, e.g. recovered from the lease folder of a replica that has been paused
+                continue
+            except Exception as e:
+                self._handle_failed_file(leased_file_path, e)
+                continue
+            if file_format == FILE_FORMAT_OBJECT:
+                yield leased_file_path
+            else:
+                self._process_bulk_claim_file(leased_file_path, file_format)
+
+    def recover_stale_leases(self):
+        """
+        Move the files leased by replicas that have stopped back into the Claim files folder, see `ClaimFileLeases`.
+        """
+        if self.__claim_file_leases is None:
+            return
+        try:
+            self.__claim_file_leases.recover_stale_leases()
+        except Exception as e:
+            logger.error("An error occurred while recovering stale leases [error: {error}]".format(error=e.args))
+
+    def _create_self_description_from_file(self, file_path: str) -> dict:
+        """
+        Create a Self Description for the Claims contained in a file.
+        :param file_path: Path of the Claim file
+        :return: The created Self Description
+        """
+        logger.info("Start processing file [file: {file_path}]".format(file_path=file_path))
+        with open(file_path, "r") as file_content:
+            claims = json.load(file_content)
+        return self.__self_description_processor.create_self_description(claims=claims)
+
+    def _send_self_description(self, file_path: str, self_description: dict):
+        """
+        Send the Self Description created for a Claim file to the Federated Catalogue and move the file to the folder
+        of processed files.
+        :param file_path: Path of the Claim file
+        :param self_description: The Self Description created for the file
+        """
+        self.__federated_catalogue_client.send_to_federated_catalogue(self_description)
+        self._handle_processed_file(file_path)
+
+    def _handle_processed_file(self, file_path: str):
+        """
+        Move a Claim file whose Self Description has been sent to the folder of processed files.
+        :param file_path: Path of the Claim file
+        """
+        move_file(file_path, self.__processed_files_dir)
+        CLAIM_FILES_PROCESSED.inc()
+        logger.info("File has been processed successfully [file: {file}]".format(file=file_path))
+
+    def _handle_failed_file(self, file_path: str, error: Exception):
+        """
+        Log the error that occurred while processing a Claim file and move the file to the folder of failed files.
+        :param file_path: Path of the Claim file
+        :param error: The error that occurred
+        """
+        logger.warning("An error occurred while processing file [file: {file}, error: {error}]"
+                       .format(file=file_path, error=error.args))
+        move_file(file_path, self.__failed_files_dir)
+        CLAIM_FILES_FAILED.inc()
 
     def cleanup_old_files(self):
         """
@@ -93,3 +313,161 @@ class ClaimFileHandler:
                 # Check if file is older than specified age
                 if os.stat(file.path).st_mtime < now - max_file_age_sec:
                     os.remove(file.path)
+
+        if os.path.exists(self.__checkpoints_dir):
+            for file in os.scandir(self.__checkpoints_dir):
+                # Checkpoints of files that are still waiting to be processed are kept regardless of their age
+                claim_file_name = file.name.removesuffix(".checkpoint")
+                if (not os.path.exists(os.path.join(self.__claim_files_dir, claim_file_name))
+                        and not (self.__claim_file_leases is not None
+                                 and self.__claim_file_leases.is_leased(claim_file_name))
+                        and os.stat(file.path).st_mtime < now - max_file_age_sec):
+                    os.remove(file.path)
+
+
+class _BulkClaimFileProgress:
+    """
+    Keeps track of the records of a bulk Claim file. Records might be completed out of order if they are sent
+    concurrently, so the checkpoint only covers the records up to the first one that is still pending. Rejected
+    records are written to the reject file in the same order, which keeps the reject file consistent with the
+    checkpoint.
+    """
+
+    def __init__(self, file_path: str, checkpoint_path: str, reject_file_path: str, checkpoint_interval: int):
+        """
+
+        :param file_path: Path of the bulk Claim file
+        :param checkpoint_path: Path of the file the progress is saved to
+        :param reject_file_path: Path of the NDJSON file failed records are written to
+        :param checkpoint_interval: Number of completed records after which the progress is saved
+        """
+        self.__checkpoint_path = checkpoint_path
+        self.__reject_file_path = reject_file_path
+        self.__checkpoint_interval = checkpoint_interval
+        file_stat = os.stat(file_path)
+        # A checkpoint only applies to the file it has been written for, not to a new file with the same name
+        self.__file_identity = {"file_size": file_stat.st_size, "file_mtime_ns": file_stat.st_mtime_ns}
+        checkpoint = self._read_checkpoint()
+        self.offset = checkpoint.get("offset", 0)
+        self.next_record = checkpoint.get("next_record", 0)
+        self.processed_records = checkpoint.get("processed_records", 0)
+        self.rejected_records = checkpoint.get("rejected_records", 0)
+        self.__reject_file_size = checkpoint.get("reject_file_size", 0)
+        self.__reject_file = None
+        self.__completed_since_checkpoint = 0
+        # Records that have been started but are not covered by the checkpoint yet by record number
+        self.__records = {}
+        self.__lock = threading.Lock()
+        if os.path.exists(reject_file_path):
+            # Rejected records after the checkpoint are processed again
+            if self.__reject_file_size == 0:
+                os.remove(reject_file_path)
+            else:
+                with open(reject_file_path, "r+b") as reject_file:
+                    reject_file.truncate(self.__reject_file_size)
+
+    def _read_checkpoint(self) -> dict:
+        try:
+            with open(self.__checkpoint_path, "r") as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning("Ignoring invalid checkpoint [file: {file}, error: {error}]"
+                           .format(file=self.__checkpoint_path, error=e.args))
+            return {}
+        if any(checkpoint.get(key) != value for key, value in self.__file_identity.items()):
+            logger.warning("Ignoring checkpoint of a different file [file: {file}]".format(file=self.__checkpoint_path))
+            return {}
+        return checkpoint
+
+    def start(self, record: int, start_offset: int, end_offset: int):
+        """
+        Register a record that is about to be processed.
+        :param record: Number of the record within the file
+        :param start_offset: Byte offset where the record starts
+        :param end_offset: Byte offset where the record ends
+        """
+        with self.__lock:
+            self.__records[record] = {"start_offset": start_offset, "end_offset": end_offset, "completed": False}
+
+    def complete(self, record: int, claims=None, error: Exception | None = None):
+        """
+        Mark a record as completed and save the progress if due.
+        :param record: Number of the record within the file
+        :param claims: The Claims of a failed record, written to the reject file
+        :param error: The error that occurred, `None` if the record has been processed successfully
+        """
+        with self.__lock:
+            if error is None:
+                self.processed_records += 1
+                CLAIM_RECORDS_PROCESSED.inc()
+            else:
+                self.rejected_records += 1
+                CLAIM_RECORDS_REJECTED.inc()
+                logger.warning("An error occurred while processing record [record: {record}, error: {error}]"
+                               .format(record=record, error=error.args))
+            self.__records[record].update(completed=True, claims=claims, error=error)
+            while self.next_record in self.__records and self.__records[self.next_record]["completed"]:
+                entry = self.__records.pop(self.next_record)
+                if entry["error"] is not None:
+                    self._write_reject(self.next_record, entry)
+                self.offset = entry["end_offset"]
+                self.next_record += 1
+                self.__completed_since_checkpoint += 1
+            if self.__completed_since_checkpoint >= self.__checkpoint_interval:
+                self._write_checkpoint()
+
+    def _write_reject(self, record: int, entry: dict):
+        if self.__reject_file is None:
+            os.makedirs(os.path.dirname(self.__reject_file_path), exist_ok=True)
+            self.__reject_file = open(self.__reject_file_path, "ab")
+        reject = {"record": record,
+                  "offset": entry["start_offset"],
+                  "error": str(entry["error"])}
+        if not isinstance(entry["claims"], Exception):
+            reject["claims"] = entry["claims"]
+        self.__reject_file.write(json.dumps(reject).encode("utf-8") + b"\n")
+
+    def _write_checkpoint(self):
+        if self.__reject_file is not None:
+            # Rejects covered by the checkpoint must not get lost
+            self.__reject_file.flush()
+            os.fsync(self.__reject_file.fileno())
+            self.__reject_file_size = self.__reject_file.tell()
+        checkpoint = dict(self.__file_identity,
+                          offset=self.offset,
+                          next_record=self.next_record,
+                          processed_records=self.processed_records,
+                          rejected_records=self.rejected_records,
+                          reject_file_size=self.__reject_file_size)
+        os.makedirs(os.path.dirname(self.__checkpoint_path), exist_ok=True)
+        temp_path = self.__checkpoint_path + ".tmp"
+        with open(temp_path, "w") as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, self.__checkpoint_path)
+        self.__completed_since_checkpoint = 0
+
+    def finish(self):
+        """
+        Close the reject file and remove the checkpoint after all records have been processed.
+        """
+        with self.__lock:
+            self._close_reject_file()
+        if os.path.exists(self.__checkpoint_path):
+            os.remove(self.__checkpoint_path)
+
+    def close(self):
+        """
+        Save the progress and close the reject file if processing is interrupted.
+        """
+        with self.__lock:
+            self._write_checkpoint()
+            self._close_reject_file()
+
+    def _close_reject_file(self):
+        if self.__reject_file is not None:
+            self.__reject_file.close()
+            self.__reject_file = None
@@ -0,0 +1,165 @@
+from __future__ import annotations  # used for linting (type annotations)
+import logging
+import os
+import threading
+import time
+import uuid
+
+from claim_file_reader import is_claim_file_name
+from metrics import CLAIM_FILE_LEASES
+
+logger = logging.getLogger()
+
+# Prefix of lease folders that are being recovered, replica IDs must not start with it
+RECOVERY_FOLDER_PREFIX = ".recovering-"
+
+
+class ClaimFileLeases:
+    """
+    Class can be used by several replicas sharing the Claim files folder to make sure that every Claim file is processed
+    by a single replica. Before processing a file, a replica moves it into its lease folder
+    `in-progress/<replica ID>` by an atomic rename, which only succeeds for one of the replicas. The replica keeps the
+    modification time of its lease folder up to date while it is running. Lease folders that haven't been updated for
+    `lease_timeout_sec` belong to replicas that have crashed or been removed, so their files are moved back into the
+    Claim files folder to be processed by any replica.
+    """
+
+    def __init__(self, claim_files_dir: str, replica_id: str, lease_timeout_sec: float) -> None:
+        """
+
+        :param claim_files_dir: Folder where Claim files are read from, the lease folders must be on the same file
+        system to be able to rename files atomically
+        :param replica_id: Unique and stable ID of the replica, e.g. the name of the Pod
+        :param lease_timeout_sec: Time after which the leases of a replica that hasn't updated its lease folder are
+        recovered. Must be well above the clock skew between the replicas.
+        """
+        if not replica_id or "/" in replica_id or replica_id.startswith(".") or replica_id != replica_id.strip():
+            raise ValueError("Replica ID ({}) must be a valid folder name.".format(replica_id))
+        self.__claim_files_dir = claim_files_dir
+        self.__leases_dir = os.path.join(claim_files_dir, "in-progress")
+        self.__replica_id = replica_id
+        self.__replica_leases_dir = os.path.join(self.__leases_dir, replica_id)
+        self.__lease_timeout_sec = lease_timeout_sec
+        self.__heartbeat_stopped = threading.Event()
+        self.__heartbeat_thread = None
+
+    def start(self):
+        """
+        Return the files leased by a previous run of this replica and start updating the lease folder. Must be called
+        before the first file is leased.
+        """
+        # A restarted replica with the same ID doesn't need to wait for the timeout to pick up its files again
+        if os.path.isdir(self.__replica_leases_dir):
+            self._recover(self.__replica_id)
+        self.renew()
+        self.__heartbeat_thread = threading.Thread(target=self._run_heartbeat, name="claim-file-lease-heartbeat",
+                                                   daemon=True)
+        self.__heartbeat_thread.start()
+        logger.info("Claim file leases started [replica_id: {replica_id}, lease_timeout_sec: {timeout}]"
+                    .format(replica_id=self.__replica_id, timeout=self.__lease_timeout_sec))
+
+    def stop(self):
+        """
+        Stop updating the lease folder. Leased files are recovered by other replicas after the timeout.
+        """
+        self.__heartbeat_stopped.set()
+        if self.__heartbeat_thread is not None:
+            self.__heartbeat_thread.join()
+
+    def _run_heartbeat(self):
+        while not self.__heartbeat_stopped.wait(self.__lease_timeout_sec / 3):
+            try:
+                self.renew()
+            except Exception as e:
+                logger.warning("Lease folder could not be updated [folder: {folder}, error: {error}]"
+                               .format(folder=self.__replica_leases_dir, error=e.args))
+
+    def renew(self):
+        """
+        Update the modification time of the lease folder, so other replicas don't recover its files.
+        """
+        os.makedirs(self.__replica_leases_dir, exist_ok=True)
+        os.utime(self.__replica_leases_dir)
+
+    def lease(self, file_path: str) -> str | None:
+        """
+        Lease a Claim file by moving it into the lease folder of this replica.
+        :param file_path: Path of a Claim file in the Claim files folder
+        :return: The path of the leased file or `None` if another replica has leased the file first
+        """
+        leased_file_path = os.path.join(self.__replica_leases_dir, os.path.basename(file_path))
+        # The folder might have been recovered by another replica, e.g. after a long pause of this one
+        os.makedirs(self.__replica_leases_dir, exist_ok=True)
+        try:
+            os.rename(file_path, leased_file_path)
+        except FileNotFoundError:
+            CLAIM_FILE_LEASES.labels("lost").inc()
+            return None
+        CLAIM_FILE_LEASES.labels("acquired").inc()
+        return leased_file_path
+
+    def is_leased(self, file_name: str) -> bool:
+        """
+        :param file_name: Name of a Claim file
+        :return: Whether the file is leased by any replica
+        """
+        if not os.path.isdir(self.__leases_dir):
+            return False
+        return any(os.path.exists(os.path.join(entry.path, file_name))
+                   for entry in os.scandir(self.__leases_dir) if entry.is_dir())
+
+    def recover_stale_leases(self) -> int:
+        """
+        Move the files of lease folders that haven't been updated within the lease timeout back into the Claim files
+        folder.
+        :return: The number of recovered files
+        """
+        if not os.path.isdir(self.__leases_dir):
+            return 0
+        recovered_files = 0
+        now = time.time()
+        for entry in os.scandir(self.__leases_dir):
+            if entry.name == self.__replica_id or not entry.is_dir():
+                continue
+            try:
+                if entry.stat().st_mtime >= now - self.__lease_timeout_sec:
+                    continue
+            except FileNotFoundError:
+                continue
+            recovered_files += self._recover(entry.name)
+        return recovered_files
+
+    def _recover(self, lease_folder_name: str) -> int:
+        """
+        Move the files of a lease folder back into the Claim files folder. The folder is renamed first, which only
+        succeeds for one replica, so concurrent recoveries don't interfere and the previous owner can't move the files
+        anymore.
+        :param lease_folder_name: Name of the lease folder
+        :return: The number of recovered files
+        """
+        recovery_dir = os.path.join(self.__leases_dir, RECOVERY_FOLDER_PREFIX + uuid.uuid4().hex)
+        try:
+            os.rename(os.path.join(self.__leases_dir, lease_folder_name), recovery_dir)
+        except FileNotFoundError:
+            # Recovered by another replica
+            return 0
+        recovered_files = 0
+        for entry in os.scandir(recovery_dir):
+            if not is_claim_file_name(entry.name):
+                continue
+            claim_file_path = os.path.join(self.__claim_files_dir, entry.name)
+            if os.path.exists(claim_file_path):
+                logger.warning("Leased file could not be recovered since a file with the same name exists "
+                               "[file: {file}]".format(file=entry.path))
+                continue
+            os.rename(entry.path, claim_file_path)
+            recovered_files += 1
+            CLAIM_FILE_LEASES.labels("recovered").inc()
+        try:
+            os.rmdir(recovery_dir)
+        except OSError:
+            # Files that could not be recovered are retried once the folder is stale
+            pass
+        logger.info("Leases have been recovered [lease_folder: {folder}, files: {files}]"
+                    .format(folder=lease_folder_name, files=recovered_files))
+        return recovered_files
@@ -0,0 +1,139 @@
+"""
+Incremental readers for Claim files. Besides files containing a single Claims object, bulk files containing many records
+are supported, either as NDJSON (one JSON document per line, `.ndjson` or `.jsonl`) or as a JSON file with a top-level
+array. Bulk files are read in chunks, so only the record that is currently parsed is held in memory.
+"""
+from __future__ import annotations  # used for linting (type annotations)
+import codecs
+import json
+from collections.abc import Iterator
+
+FILE_FORMAT_OBJECT = "object"
+FILE_FORMAT_ARRAY = "array"
+FILE_FORMAT_NDJSON = "ndjson"
+
+NDJSON_FILE_EXTENSIONS = (".ndjson", ".jsonl")
+READ_CHUNK_SIZE = 64 * 1024
+# A broken record in a JSON array can't be told apart from an incomplete one, so the buffer is limited
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+
+def is_claim_file_name(file_name: str) -> bool:
+    """
+    :param file_name: Name of a file in the Claim files folder
+    :return: Whether the file is supposed to contain Claims
+    """
+    return file_name.endswith("json") or file_name.endswith(NDJSON_FILE_EXTENSIONS)
+
+
+def detect_claim_file_format(file_path: str) -> str:
+    """
+    Determine the format of a Claim file. NDJSON files are detected by their extension, JSON files by their first
+    character.
+    :param file_path: Path of the Claim file
+    :return: One of `FILE_FORMAT_OBJECT`, `FILE_FORMAT_ARRAY` or `FILE_FORMAT_NDJSON`
+    """
+    if file_path.endswith(NDJSON_FILE_EXTENSIONS):
+        return FILE_FORMAT_NDJSON
+    with open(file_path, "rb") as file:
+        while True:
+            chunk = file.read(4096)
+            if not chunk:
+                return FILE_FORMAT_OBJECT
+            content = chunk.lstrip(b" \t\n\r")
+            if content:
+                return FILE_FORMAT_ARRAY if content.startswith(b"[") else FILE_FORMAT_OBJECT
+
+
+def iter_claim_records(file_path: str, file_format: str, offset: int = 0) -> Iterator[tuple[object, int, int]]:
+    """
+    Read the records of a bulk Claim file one after another. Records that can't be parsed are returned as exception
+    instead of raising it, so that the caller can reject them and continue with the next record. If the structure of a
+    JSON array is broken, the error is returned and reading stops since the following records can't be located.
+    :param file_path: Path of the Claim file
+    :param file_format: Either `FILE_FORMAT_ARRAY` or `FILE_FORMAT_NDJSON`
+    :param offset: Byte offset to continue reading from, as returned as end offset of a previous record
+    :return: Iterator of tuples (record or exception, start offset, end offset)
+    """
+    with open(file_path, "rb") as file:
+        file.seek(offset)
+        if file_format == FILE_FORMAT_NDJSON:
+            yield from _iter_ndjson_records(file, offset)
+        elif file_format == FILE_FORMAT_ARRAY:
+            yield from _iter_array_records(file, offset)
+        else:
+            raise ValueError("Unsupported bulk file format [format: {file_format}]".format(file_format=file_format))
+
+
+def _iter_ndjson_records(file, offset: int) -> Iterator[tuple[object, int, int]]:
+    for line in file:
+        start = offset
+        offset += len(line)
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), start, offset
+        except ValueError as e:
+            yield e, start, offset
+
+
+def _iter_array_records(file, offset: int) -> Iterator[tuple[object, int, int]]:
+    decoder = json.JSONDecoder()
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+    # Reading starts before the opening bracket or right after a previously read record
+    expected = "[" if offset == 0 else ",]"
+    buffer = ""
+    end_of_file = False
+    read_size = READ_CHUNK_SIZE
+    while True:
+        # Skip whitespace, which is always a single byte in UTF-8
+        stripped = buffer.lstrip(_WHITESPACE)
+        offset += len(buffer) - len(stripped)
+        buffer = stripped
+        if buffer:
+            char = buffer[0]
+            if expected in ("[", ",]"):
+                if char not in expected:
+                    yield ValueError("Expected one of '{expected}' but found '{char}' [offset: {offset}]"
+                                     .format(expected=expected, char=char, offset=offset)), offset, offset
+                    return
+                if char == "]":
+                    return
+                # After the opening bracket the array might be empty, after a comma another record must follow
+                expected = "record or ]" if char == "[" else "record"
+                offset += 1
+                buffer = buffer[1:]
+                continue
+            if expected == "record or ]" and char == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+                # A value ending at the end of the buffer might continue in the next chunk
+                complete = end < len(buffer) or end_of_file
+            except ValueError as e:
+                if end_of_file:
+                    yield e, offset, offset
+                    return
+                complete = False
+            if complete:
+                size = len(buffer[:end].encode("utf-8"))
+                yield record, offset, offset + size
+                offset += size
+                buffer = buffer[end:]
+                expected = ",]"
+                read_size = READ_CHUNK_SIZE
+                continue
+            if len(buffer) > MAX_RECORD_SIZE:
+                yield ValueError("Record exceeds the maximum size of {max_size} characters [offset: {offset}]"
+                                 .format(max_size=MAX_RECORD_SIZE, offset=offset)), offset, offset
+                return
+            # Grow the chunks, so that large records are not parsed again for every small chunk
+            read_size *= 2
+        elif end_of_file:
+            yield ValueError("Unexpected end of file, the JSON array is not closed"), offset, offset
+            return
+        chunk = file.read(read_size)
+        end_of_file = not chunk
+        buffer += utf8_decoder.decode(chunk, final=end_of_file)
@@ -0,0 +1,54 @@
+import logging
+import os
+
+try:
+    from inotify_simple import INotify, flags
+except (ImportError, OSError):
+    # inotify is only available on Linux
+    INotify = None
+
+from claim_file_reader import is_claim_file_name
+
+logger = logging.getLogger()
+
+
+def is_inotify_available() -> bool:
+    return INotify is not None
+
+
+class ClaimFileWatcher:
+    """
+    Class can be used to get notified about new Claim files via inotify instead of polling the Claim files folder.
+    Files are only reported once they have been completely written, i.e. after they have been closed by the writer or
+    atomically moved into the folder.
+    """
+
+    def __init__(self, claim_files_dir: str):
+        """
+
+        :param claim_files_dir: Folder where Claim files are written to
+        """
+        if INotify is None:
+            raise OSError("inotify is not available on this system")
+        self.__inotify = INotify()
+        self.__inotify.add_watch(claim_files_dir, flags.CLOSE_WRITE | flags.MOVED_TO)
+        logger.info("Watching folder for Claim files [folder: {folder}]".format(folder=claim_files_dir))
+
+    def wait_for_files(self, timeout_sec: float) -> list[str] | None:
+        """
+        Wait until Claim files have been written to the folder.
+        :param timeout_sec: Maximum time to wait
+        :return: Names of the written files, an empty list if no file has been written within the timeout or `None` if
+        events have been lost and the whole folder needs to be checked
+        """
+        file_names = []
+        for event in self.__inotify.read(timeout=int(timeout_sec * 1000)):
+            if event.mask & flags.Q_OVERFLOW:
+                logger.warning("inotify event queue overflowed, checking the whole folder")
+                return None
+            if is_claim_file_name(event.name) and event.name not in file_names:
+                file_names.append(event.name)
+        return file_names
+
+    def close(self):
+        self.__inotify.close()
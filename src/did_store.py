@@ -1,25 +1,77 @@
 from __future__ import annotations  # used for linting (type annotations)
+from bisect import bisect_right, insort
 from collections.abc import Iterator
-import uuid
+from contextlib import contextmanager
+import gzip
+import hashlib
 import os
-import glob
+import tempfile
+import threading
+import time
+import uuid
 import json
 import logging
 
+import brotli
+
+try:
+    import fcntl
+except ImportError:
+    # File locks are only available on Unix, the index is then built by each process opening an unindexed storage
+    fcntl = None
+
+from did_store_backends import DIDStoreBackend, create_did_store_backend
+from did_store_write_queue import DIDStoreWriteQueue
+from metrics import DID_STORE_IO_SECONDS
+
 logger = logging.getLogger()
 
+# File extensions of the precompressed variants of stored objects per content encoding
+PRECOMPRESSED_FILE_EXTENSIONS = {"gzip": ".gz", "br": ".br"}
+
+
+class DIDStoreObjectNotFoundError(ValueError):
+    """
+    Raised in case no object has been saved under the requested UUID.
+    """
+
+
 class DIDStore:
     """
     Class can be used to create a local did store and create did documents and did:web IDs.
     """
 
-    def __init__(self, storage_type: str, storage_path: str, vp_vc_id_prefix) -> None:
+    def __init__(self, storage_type: str, storage_path: str, vp_vc_id_prefix, storage_layout: str = "flat",
+                 precompress: bool = False, s3_endpoint_url: str | None = None, build_index: bool = True) -> None:
+        """
+        :param storage_type: "local" stores the objects as files, "sqlite" in an embedded database and "cloud" in an
+        S3-compatible object storage
+        :param storage_path: Folder (local), database file (sqlite) or `s3://<bucket>/<prefix>` URL (cloud)
+        :param vp_vc_id_prefix:
+        :param storage_layout: "flat" stores all objects in `storage_path`, "sharded" stores them in subfolders named
+        after the first characters of the UUID (e.g. `ab/cd/abcd....json`) to limit the size of each folder. Only used
+        by storage type "local".
+        :param precompress: If `True`, gzip and brotli compressed variants are stored alongside each object
+        :param s3_endpoint_url: Endpoint of the S3-compatible service (e.g. MinIO) used by storage type "cloud"
+        :param build_index: If `False`, a missing index is not built from the stored objects, so the storage isn't
+        modified by opening it (e.g. to migrate it)
+        """
+        self._write_queue = None
         self._storage_path = storage_path
-        if storage_type in ("local", "cloud"):
-            self._storage_type = storage_type
+        self._storage_type = storage_type
+        if storage_layout in ("flat", "sharded"):
+            self._storage_layout = storage_layout
         else:
-            raise ValueError(f"Storage Type ({storage_type}) for DIDStore is not supported.")
+            raise ValueError(f"Storage Layout ({storage_layout}) for DIDStore is not supported.")
+        self._backend = create_did_store_backend(storage_type, storage_path, storage_layout, s3_endpoint_url)
         self._vp_vc_id_prefix = vp_vc_id_prefix
+        self._precompress = precompress
+        self._index = DIDStoreIndex(self._backend)
+        if build_index and not self._backend.has_index():
+            # The Gunicorn workers open the storage concurrently, only the first one builds the index
+            with lock_index_build(storage_type, storage_path):
+                if not self._backend.has_index():
+                    self.rebuild_index()
 
     def get_type(self) -> str:
         return self._storage_type
@@ -27,15 +79,109 @@ class DIDStore:
     def get_path(self) -> str:
         return self._storage_path
 
+    def enable_write_behind(self, max_batch_size: int, max_delay_sec: float, max_queue_size: int,
+                            durable: bool) -> None:
+        """
+        Save objects in the background in batches instead of synchronously, see `DIDStoreWriteQueue`.
+        """
+        self._write_queue = DIDStoreWriteQueue(save_function=lambda objects: self.save_objects_into_storage(objects,
+                                                                                                          sync=True),
+                                               max_batch_size=max_batch_size,
+                                               max_delay_sec=max_delay_sec,
+                                               max_queue_size=max_queue_size,
+                                               durable=durable)
+
+    def get_statistics(self) -> dict:
+        """
+        :return: Statistics of the write queue, empty if write-behind is not enabled
+        """
+        return self._write_queue.get_statistics() if self._write_queue is not None else {}
+
+    def close(self) -> None:
+        """
+        Save pending objects of the write queue and release the backend.
+        """
+        if self._write_queue is not None:
+            self._write_queue.close()
+        self._backend.close()
+
+    def is_object_pending(self, id: str) -> bool:
+        """
+        :param id: UUID of the object
+        :return: Whether the object is still queued for saving, it might then never be written if its batch fails
+        """
+        return self._write_queue is not None and \
+            self._write_queue.get_pending_object(get_object_key(id)[:-5]) is not None
+
     def get_saved_object(self, id: str) -> str:
-        matches = glob.glob(self.get_path() + '/' + "*" + id + "*")
-        if matches:
-            return open_file_and_get_file_content(matches[0])
-        raise ValueError("UUID has not been found")
+        object_key = get_object_key(id)
+        if self._write_queue is not None:
+            # Objects that are still queued are served from memory so they can be read immediately after creation
+            pending_object = self._write_queue.get_pending_object(object_key[:-5])
+            if pending_object is not None:
+                return json.dumps(pending_object.get_object_content())
+        with DID_STORE_IO_SECONDS.labels("read", self._storage_type).time():
+            content = self._backend.read_object(object_key)
+        if content is None:
+            raise DIDStoreObjectNotFoundError("UUID has not been found")
+        return content.decode("utf-8")
+
+    def get_saved_object_variant(self, id: str, content_encoding: str) -> bytes | None:
+        """
+        Return the precompressed variant of a saved object.
+        :param id: UUID of the object
+        :param content_encoding: The content encoding of the variant ("gzip" or "br")
+        :return: The compressed object or `None` if no such variant has been stored
+        """
+        with DID_STORE_IO_SECONDS.labels("read", self._storage_type).time():
+            return self._backend.read_object(get_object_key(id) + PRECOMPRESSED_FILE_EXTENSIONS[content_encoding])
 
     def get_saved_uuids(self) -> Iterator[str]:
-        for entry in os.scandir(self._storage_path):
-            yield entry.name[:-5]
+        for key in self._backend.iter_keys():
+            if key.endswith(".json"):
+                yield key[:-5]
+
+    def list_saved_uuids(self, limit: int, cursor: tuple[int, str] | None = None, created_after: int | None = None,
+                         object_type: str | None = None) -> tuple[list[str], tuple[int, str] | None]:
+        """
+        List the UUIDs of the saved objects ordered by their creation time.
+        :param limit: Maximum number of UUIDs returned
+        :param cursor: Cursor returned by a previous call to continue the listing
+        :param created_after: Only list objects created after this time (microseconds since epoch)
+        :param object_type: Only list objects of this type ("VC" or "VP")
+        :return: The UUIDs and the cursor for the next page, which is `None` if there are no further objects
+        """
+        return self._index.list(limit=limit, cursor=cursor, created_after=created_after, object_type=object_type)
+
+    def get_last_created(self, object_type: str | None = None) -> int | None:
+        """
+        :param object_type: Only consider objects of this type ("VC" or "VP")
+        :return: Creation time (microseconds since epoch) of the most recently saved object
+        """
+        return self._index.get_last_created(object_type)
+
+    def rebuild_index(self) -> None:
+        """
+        Rebuild the index of saved objects from the objects in the storage.
+        """
+        logger.info("Rebuilding DIDStore index [path: {path}]".format(path=self._storage_path))
+        self._index.rebuild(self._read_index_entries_from_objects())
+
+    def _read_index_entries_from_objects(self) -> list[tuple[int, str, str]]:
+        """
+        :return: Tuples of creation time, UUID and type of the stored objects ordered by creation time
+        """
+        entries = []
+        for object_uuid in self.get_saved_uuids():
+            object_key = object_uuid + ".json"
+            try:
+                object_type = get_object_type(json.loads(self._backend.read_object(object_key)))
+                entries.append((self._backend.get_created(object_key), object_uuid, object_type))
+            except Exception as e:
+                logger.warning("Could not add object to DIDStore index [path: {path}, error: {error}]"
+                               .format(path=self._backend.get_location(object_key), error=e.args))
+        entries.sort()
+        return entries
 
     def create_transient_did_store_object(self, object_content: dict[str, str]) -> DIDStoreObject:
         object_uuid = uuid.uuid4().hex
@@ -49,19 +195,153 @@ class DIDStore:
         return did_store_object
 
     def save_object_into_storage(self, did_store_object_to_save: DIDStoreObject) -> None:
+        if self._write_queue is not None:
+            self._write_queue.put(did_store_object_to_save)
+        else:
+            self.save_objects_into_storage([did_store_object_to_save])
+
+    def save_objects_into_storage(self, did_store_objects_to_save: list[DIDStoreObject], sync: bool = False) -> bool:
+        """
+        Save a batch of objects. The backend writes the batch at once (storage type "sqlite" in a single transaction),
+        which is considerably faster than saving the objects one by one. If the batch can't be saved, the storage path
+        of all its objects is reset.
+        :param did_store_objects_to_save: The objects to be saved
+        :param sync: If `True`, the batch is flushed to stable storage before returning
+        :return: Whether the batch has been saved
+        """
         try:
-            if self._storage_type == "local":
-                with open(did_store_object_to_save.get_storage_path(), "w") as did_file:
-                    json.dump(did_store_object_to_save.get_object_content(), did_file)
-            else:
-                raise ValueError(
-                    f"Storage type {self._storage_type} is not implemented yet")
+            objects = []
+            index_records = []
+            for did_store_object in did_store_objects_to_save:
+                object_key = did_store_object.get_uuid() + ".json"
+                content = json.dumps(did_store_object.get_object_content()).encode("utf-8")
+                objects.append((object_key, content))
+                if self._precompress:
+                    objects.append((object_key + PRECOMPRESSED_FILE_EXTENSIONS["gzip"],
+                                    gzip.compress(content, compresslevel=9)))
+                    objects.append((object_key + PRECOMPRESSED_FILE_EXTENSIONS["br"], brotli.compress(content)))
+                index_records.append([time.time_ns() // 1000, did_store_object.get_uuid(),
+                                      get_object_type(did_store_object.get_object_content())])
+            with DID_STORE_IO_SECONDS.labels("write", self._storage_type).time():
+                self._backend.write_batch(objects, index_records, sync=sync)
+            return True
         except Exception as e:
-            did_store_object_to_save.set_storage_path(None)
+            for did_store_object in did_store_objects_to_save:
+                did_store_object.set_storage_path(None)
             logger.error("Could not save DIDStoreObject: " + str(e.args))
+            return False
+
+    def migrate_to(self, target_did_store: DIDStore, batch_size: int = 500) -> int:
+        """
+        Copy all saved objects (including precompressed variants) and the index into another DIDStore, e.g. to move
+        from storage type "local" to "sqlite". Objects keep their UUIDs and creation times.
+        :param target_did_store: The DIDStore the objects are copied to
+        :param batch_size: Number of objects written at once
+        :return: The number of copied objects
+        """
+        target_backend = target_did_store._backend
+        batch = []
+        count = 0
+        for key in self._backend.iter_keys():
+            batch.append((key, self._backend.read_object(key)))
+            if len(batch) >= batch_size:
+                target_backend.write_objects(batch)
+                count += len(batch)
+                batch = []
+                logger.info("Migrating DIDStore [objects: {count}]".format(count=count))
+        if batch:
+            target_backend.write_objects(batch)
+            count += len(batch)
+        if self._backend.has_index():
+            records, _ = self._backend.read_index_records(None)
+        else:
+            records = [list(entry) for entry in self._read_index_entries_from_objects()]
+        target_backend.replace_index_records(records)
+        return count
 
     def determine_storage_path(self, uuid: str) -> str:
-        return os.path.join(self._storage_path, uuid + ".json")
+        return self._backend.get_location(uuid + ".json")
+
+
+class DIDStoreIndex:
+    """
+    Class can be used to keep an index of the objects saved in a DIDStore ordered by their creation time. The index is
+    persisted append-only by the storage backend, which allows several processes to share it: Each process reads the
+    entries that have been appended by other processes before answering queries.
+    """
+
+    def __init__(self, backend: DIDStoreBackend) -> None:
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._read_position = None
+        # Sorted lists of (created, uuid) per object type, key None contains all objects
+        self._entries: dict[str | None, list[tuple[int, str]]] = {None: [], "VC": [], "VP": []}
+        # Backends may return records again, see `DIDStoreBackend.read_index_records`
+        self._uuids: set[str] = set()
+
+    def rebuild(self, entries: list[tuple[int, str, str]]) -> None:
+        """
+        Replace the persisted index by the given entries.
+        :param entries: Tuples of creation time, UUID and type of the objects
+        """
+        self._backend.replace_index_records([list(entry) for entry in entries])
+        with self._lock:
+            self._read_position = None
+            self._entries = {None: [], "VC": [], "VP": []}
+            self._uuids = set()
+
+    def add(self, created: int, object_uuid: str, object_type: str) -> None:
+        """
+        Add an object to the index.
+        :param created: Creation time of the object (microseconds since epoch)
+        :param object_uuid: UUID of the object
+        :param object_type: Type of the object ("VC", "VP" or "other")
+        """
+        self.add_many([[created, object_uuid, object_type]])
+
+    def add_many(self, records: list[list], sync: bool = False) -> None:
+        """
+        Add several objects to the index at once.
+        :param records: Records of `[created, uuid, type]`, see `add`
+        :param sync: If `True`, the records are flushed to stable storage before returning
+        """
+        self._backend.append_index_records(records, sync=sync)
+
+    def list(self, limit: int, cursor: tuple[int, str] | None, created_after: int | None,
+             object_type: str | None) -> tuple[list[str], tuple[int, str] | None]:
+        """
+        See `DIDStore.list_saved_uuids`.
+        """
+        with self._lock:
+            self._read_new_entries()
+            entries = self._entries.get(object_type, [])
+            start_key = cursor
+            if created_after is not None and (start_key is None or (created_after, "\uffff") > start_key):
+                start_key = (created_after, "\uffff")
+            start = bisect_right(entries, start_key) if start_key is not None else 0
+            page = entries[start:start + limit]
+            next_cursor = page[-1] if page and start + limit < len(entries) else None
+            return [object_uuid for _, object_uuid in page], next_cursor
+
+    def get_last_created(self, object_type: str | None) -> int | None:
+        with self._lock:
+            self._read_new_entries()
+            entries = self._entries.get(object_type, [])
+            return entries[-1][0] if entries else None
+
+    def _read_new_entries(self) -> None:
+        """
+        Read the entries that have been appended to the persisted index since the last call.
+        """
+        records, self._read_position = self._backend.read_index_records(self._read_position)
+        for created, object_uuid, object_type in records:
+            if object_uuid in self._uuids:
+                continue
+            self._uuids.add(object_uuid)
+            key = (created, object_uuid)
+            insort(self._entries[None], key)
+            if object_type in self._entries:
+                insort(self._entries[object_type], key)
 
 
 class DIDStoreObject:
@@ -98,8 +378,48 @@ class DIDStoreObject:
         return self._stored_path
 
 
-def open_file_and_get_file_content(filepath: str) -> str:
-    f = open(filepath, "r")
-    document_content = f.read()
-    f.close()
-    return document_content
+def get_object_type(object_content: dict) -> str:
+    """
+    :param object_content: Content of a DIDStore object
+    :return: "VP" for Verifiable Presentations, "VC" for Verifiable Credentials and "other" for anything else
+    """
+    object_types = object_content.get("type", [])
+    if "VerifiablePresentation" in object_types:
+        return "VP"
+    if "VerifiableCredential" in object_types:
+        return "VC"
+    return "other"
+
+
+@contextmanager
+def lock_index_build(storage_type: str, storage_path: str):
+    """
+    Lock the building of the index of a storage against other processes on the same host. The lock file is kept in
+    the temporary folder, since remote storages have no folder of their own.
+    :param storage_type: The storage type of the DIDStore
+    :param storage_path: The storage path of the DIDStore
+    """
+    if fcntl is None:
+        yield
+        return
+    storage_hash = hashlib.sha256("{}:{}".format(storage_type, os.path.abspath(storage_path)
+                                                 if storage_type != "cloud" else storage_path).encode("utf-8"))
+    lock_path = os.path.join(tempfile.gettempdir(), "did-store-index-{}.lock".format(storage_hash.hexdigest()[:16]))
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_object_key(id: str) -> str:
+    """
+    :param id: UUID of an object in any of the formats accepted by `uuid.UUID`
+    :return: The key the object is stored under in the backend
+    """
+    try:
+        # Normalizes the UUID and ensures that it can't be used to access other objects
+        return uuid.UUID(id).hex + ".json"
+    except ValueError:
+        raise DIDStoreObjectNotFoundError("UUID has not been found")
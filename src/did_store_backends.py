@@ -0,0 +1,460 @@
+from __future__ import annotations  # used for linting (type annotations)
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from urllib.parse import urlparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Name of the index within the storage, it is never returned as object key
+INDEX_NAME = "index.jsonl"
+# Objects are written to temporary files first, which are left behind if the process is killed while writing
+TEMP_FILE_EXTENSION = ".tmp"
+# Statement of the SQLite backend appending a record of `[created, uuid, type]` to the index
+INSERT_INDEX_RECORD_STATEMENT = "INSERT INTO did_index (created, uuid, type) VALUES (?, ?, ?)"
+# Maximum time between computing the creation time of an index record and writing its marker to the object storage,
+# including the clock skew between processes. Index markers are re-listed within this window, see
+# `S3Backend.read_index_records`.
+S3_INDEX_SKEW_WINDOW_SEC = 60
+
+
+class DIDStoreBackend(ABC):
+    """
+    Base class of the storage backends of a DIDStore. A backend stores opaque objects under keys (e.g.
+    `<uuid>.json` or `<uuid>.json.gz`) and persists the index records of the DIDStore, which are lists of
+    `[created, uuid, type]`.
+    """
+
+    @abstractmethod
+    def get_location(self, key: str) -> str:
+        """
+        :param key: Key of an object
+        :return: Human-readable location of the object, e.g. a file path or URL
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def write_objects(self, objects: list[tuple[str, bytes]], sync: bool = False) -> None:
+        """
+        Write a batch of objects. Backends that support transactions write the whole batch or nothing.
+        :param objects: Tuples of key and content
+        :param sync: If `True`, the objects are flushed to stable storage before returning
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_object(self, key: str) -> bytes | None:
+        """
+        :param key: Key of the object
+        :return: The content of the object or `None` if it doesn't exist
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_keys(self) -> Iterator[str]:
+        """
+        :return: The keys of all stored objects
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_created(self, key: str) -> int:
+        """
+        :param key: Key of an existing object
+        :return: Time the object has been written (microseconds since epoch)
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def has_index(self) -> bool:
+        """
+        :return: Whether the index has been persisted, otherwise it must be rebuilt from the stored objects
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_index_records(self, records: list[list], sync: bool = False) -> None:
+        """
+        Append records to the persisted index. Appends of several processes must not interfere with each other.
+        :param records: Records of `[created, uuid, type]`
+        :param sync: If `True`, the records are flushed to stable storage before returning
+        """
+        raise NotImplementedError
+
+    def write_batch(self, objects: list[tuple[str, bytes]], records: list[list], sync: bool = False) -> None:
+        """
+        Write a batch of objects together with their index records. The objects are written first, so that the index
+        never lists objects that don't exist. Backends that support transactions write objects and records at once.
+        :param objects: Tuples of key and content
+        :param records: Records of `[created, uuid, type]`
+        :param sync: If `True`, objects and records are flushed to stable storage before returning
+        """
+        self.write_objects(objects, sync=sync)
+        self.append_index_records(records, sync=sync)
+
+    @abstractmethod
+    def read_index_records(self, position) -> tuple[list[list], object]:
+        """
+        Read the index records that have been appended since the given position. Backends may return records that
+        have already been read before, so callers must skip records whose UUID they already know.
+        :param position: Position returned by the previous call or `None` to read from the start
+        :return: The records and the position to continue reading from
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def replace_index_records(self, records: list[list]) -> None:
+        """
+        Replace the persisted index by the given records.
+        :param records: Records of `[created, uuid, type]`
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class LocalFileBackend(DIDStoreBackend):
+    """
+    Stores each object as file in a local folder. The index is kept in an append-only JSON lines file.
+    """
+
+    def __init__(self, storage_path: str, storage_layout: str) -> None:
+        """
+        :param storage_path: Folder containing the objects
+        :param storage_layout: "flat" or "sharded", see `DIDStore`
+        """
+        self._storage_path = storage_path
+        self._storage_layout = storage_layout
+        self._index_path = os.path.join(storage_path, INDEX_NAME)
+
+    def get_location(self, key: str) -> str:
+        if self._storage_layout == "sharded":
+            return os.path.join(self._storage_path, key[0:2], key[2:4], key)
+        return os.path.join(self._storage_path, key)
+
+    def write_objects(self, objects: list[tuple[str, bytes]], sync: bool = False) -> None:
+        folders = set()
+        for key, content in objects:
+            path = self.get_location(key)
+            if self._storage_layout == "sharded":
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Readers must never see a partially written object, so it is renamed into place once complete
+            temp_path = "{}.{}.{}{}".format(path, os.getpid(), threading.get_ident(), TEMP_FILE_EXTENSION)
+            with open(temp_path, "wb") as object_file:
+                object_file.write(content)
+                if sync:
+                    object_file.flush()
+                    os.fsync(object_file.fileno())
+            os.replace(temp_path, path)
+            folders.add(os.path.dirname(path))
+        if sync:
+            # The new directory entries must be persisted as well, but only once per folder and batch
+            for folder in folders:
+                fsync_folder(folder)
+
+    def _find_path(self, key: str) -> str | None:
+        path = self.get_location(key)
+        if not os.path.isfile(path) and self._storage_layout == "sharded":
+            # Objects saved before the sharded layout has been enabled
+            path = os.path.join(self._storage_path, key)
+        return path if os.path.isfile(path) else None
+
+    def read_object(self, key: str) -> bytes | None:
+        path = self._find_path(key)
+        if path is None:
+            return None
+        with open(path, "rb") as object_file:
+            return object_file.read()
+
+    def iter_keys(self) -> Iterator[str]:
+        for entry in os.scandir(self._storage_path):
+            if entry.is_file() and not entry.name.startswith(INDEX_NAME) and \
+                    not entry.name.endswith(TEMP_FILE_EXTENSION):
+                yield entry.name
+            elif entry.is_dir() and self._storage_layout == "sharded":
+                for shard in os.scandir(entry.path):
+                    if shard.is_dir():
+                        for shard_entry in os.scandir(shard.path):
+                            if not shard_entry.name.endswith(TEMP_FILE_EXTENSION):
+                                yield shard_entry.name
+
+    def get_created(self, key: str) -> int:
+        return int(os.stat(self._find_path(key)).st_mtime * 1_000_000)
+
+    def has_index(self) -> bool:
+        # Without storage folder there are no objects, so the index will be created by the first write
+        return os.path.isfile(self._index_path) or not os.path.isdir(self._storage_path)
+
+    def append_index_records(self, records: list[list], sync: bool = False) -> None:
+        data = "".join(json.dumps(record) + "\n" for record in records)
+        # A single write to a file opened in append mode is not interleaved with writes of other processes
+        fd = os.open(self._index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data.encode("utf-8"))
+            if sync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def read_index_records(self, position: int | None) -> tuple[list[list], int]:
+        position = position or 0
+        if not os.path.isfile(self._index_path):
+            return [], position
+        with open(self._index_path, "rb") as index_file:
+            index_file.seek(position)
+            data = index_file.read()
+        # A trailing line without line break might still be written by another process
+        complete_data_length = data.rfind(b"\n") + 1
+        records = [json.loads(line) for line in data[:complete_data_length].splitlines() if line.strip()]
+        return records, position + complete_data_length
+
+    def replace_index_records(self, records: list[list]) -> None:
+        os.makedirs(self._storage_path, exist_ok=True)
+        temp_path = "{}.{}{}".format(self._index_path, os.getpid(), TEMP_FILE_EXTENSION)
+        with open(temp_path, "w") as index_file:
+            for record in records:
+                index_file.write(json.dumps(record) + "\n")
+        os.replace(temp_path, self._index_path)
+
+
+class SQLiteBackend(DIDStoreBackend):
+    """
+    Stores the objects and the index in an embedded SQLite database. Each batch of objects is written in a single
+    transaction, which avoids the per-file overhead of the local file backend. The database runs in WAL mode, so
+    several processes can read while one of them writes.
+    """
+
+    def __init__(self, database_path: str) -> None:
+        """
+        :param database_path: Path of the database file, which is created if it doesn't exist
+        """
+        self._database_path = database_path
+        database_dir = os.path.dirname(os.path.abspath(database_path))
+        os.makedirs(database_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_path, timeout=30, check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS did_objects "
+                                 "(key TEXT PRIMARY KEY, content BLOB NOT NULL, created INTEGER NOT NULL)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS did_index "
+                                 "(position INTEGER PRIMARY KEY AUTOINCREMENT, created INTEGER NOT NULL, "
+                                 "uuid TEXT NOT NULL, type TEXT NOT NULL)")
+
+    def get_location(self, key: str) -> str:
+        return "{}#{}".format(self._database_path, key)
+
+    def _execute_in_transaction(self, statements: list[tuple[str, list]], sync: bool) -> None:
+        """
+        :param statements: Tuples of statement and the parameters it is executed with
+        :param sync: If `True`, the transaction is flushed to disk on commit
+        """
+        with self._lock:
+            if sync:
+                # In WAL mode, commits are only flushed to disk on checkpoints unless synchronous is FULL
+                self._connection.execute("PRAGMA synchronous=FULL")
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                for statement, parameters in statements:
+                    self._connection.executemany(statement, parameters)
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            finally:
+                if sync:
+                    self._connection.execute("PRAGMA synchronous=NORMAL")
+
+    def _get_write_objects_statement(self, objects: list[tuple[str, bytes]]) -> tuple[str, list]:
+        created = time.time_ns() // 1000
+        return ("INSERT OR REPLACE INTO did_objects (key, content, created) VALUES (?, ?, ?)",
+                [(key, content, created) for key, content in objects])
+
+    def write_objects(self, objects: list[tuple[str, bytes]], sync: bool = False) -> None:
+        self._execute_in_transaction([self._get_write_objects_statement(objects)], sync)
+
+    def write_batch(self, objects: list[tuple[str, bytes]], records: list[list], sync: bool = False) -> None:
+        # A single transaction halves the number of commits and never leaves objects without index records
+        self._execute_in_transaction([self._get_write_objects_statement(objects),
+                                      (INSERT_INDEX_RECORD_STATEMENT, records)], sync)
+
+    def read_object(self, key: str) -> bytes | None:
+        with self._lock:
+            row = self._connection.execute("SELECT content FROM did_objects WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def iter_keys(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._connection.execute("SELECT key FROM did_objects").fetchall()
+        for row in rows:
+            yield row[0]
+
+    def get_created(self, key: str) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT created FROM did_objects WHERE key = ?", (key,)).fetchone()[0]
+
+    def has_index(self) -> bool:
+        with self._lock:
+            has_objects = self._connection.execute("SELECT 1 FROM did_objects LIMIT 1").fetchone() is not None
+            has_records = self._connection.execute("SELECT 1 FROM did_index LIMIT 1").fetchone() is not None
+        return has_records or not has_objects
+
+    def append_index_records(self, records: list[list], sync: bool = False) -> None:
+        self._execute_in_transaction([(INSERT_INDEX_RECORD_STATEMENT, records)], sync)
+
+    def read_index_records(self, position: int | None) -> tuple[list[list], int]:
+        position = position or 0
+        with self._lock:
+            rows = self._connection.execute("SELECT position, created, uuid, type FROM did_index "
+                                            "WHERE position > ? ORDER BY position", (position,)).fetchall()
+        if rows:
+            position = rows[-1][0]
+        return [list(row[1:]) for row in rows], position
+
+    def replace_index_records(self, records: list[list]) -> None:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute("DELETE FROM did_index")
+                self._connection.executemany(INSERT_INDEX_RECORD_STATEMENT, records)
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class S3Backend(DIDStoreBackend):
+    """
+    Stores the objects in an S3-compatible object storage (e.g. AWS S3 or MinIO). Credentials are read by boto3 from
+    the usual sources (`AWS_ACCESS_KEY_ID`, `AWS_SECRET_ACCESS_KEY`, ...). Since objects can't be appended to, each
+    index record is stored as an empty marker object whose key sorts by creation time
+    (`index/<created>-<uuid>-<type>`), so new records can be listed incrementally.
+    """
+
+    def __init__(self, storage_url: str, endpoint_url: str | None = None,
+                 index_skew_window_sec: float = S3_INDEX_SKEW_WINDOW_SEC) -> None:
+        """
+        :param storage_url: Bucket and key prefix of the storage in the form `s3://<bucket>/<prefix>`
+        :param endpoint_url: Endpoint of the S3-compatible service, uses AWS if not set
+        :param index_skew_window_sec: Maximum delay between the creation time of an index record and its marker
+        becoming visible, markers that are delayed even longer are only read after a restart
+        """
+        try:
+            # Importing boto3 takes longer than starting the rest of the application, so it is only imported if used
+            import boto3
+        except ImportError:
+            raise ValueError("Storage type cloud requires the package boto3")
+        parsed_url = urlparse(storage_url)
+        if parsed_url.scheme != "s3" or not parsed_url.netloc:
+            raise ValueError(f"Storage path ({storage_url}) must have the form s3://<bucket>/<prefix>")
+        self._bucket = parsed_url.netloc
+        prefix = parsed_url.path.strip("/")
+        self._prefix = prefix + "/" if prefix else ""
+        self._index_skew_window = int(index_skew_window_sec * 1_000_000)
+        # boto3 clients are thread-safe and pool their connections
+        self._client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def get_location(self, key: str) -> str:
+        return "s3://{}/{}objects/{}".format(self._bucket, self._prefix, key)
+
+    def write_objects(self, objects: list[tuple[str, bytes]], sync: bool = False) -> None:
+        # Objects are durable as soon as put_object returns, so `sync` doesn't need any handling
+        for key, content in objects:
+            self._client.put_object(Bucket=self._bucket, Key=self._prefix + "objects/" + key, Body=content)
+
+    def read_object(self, key: str) -> bytes | None:
+        try:
+            response = self._client.get_object(Bucket=self._bucket, Key=self._prefix + "objects/" + key)
+        except self._client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return response["Body"].read()
+
+    def _iter_object_keys(self, prefix: str, start_after: str | None = None) -> Iterator[str]:
+        kwargs = {"Bucket": self._bucket, "Prefix": prefix}
+        if start_after is not None:
+            kwargs["StartAfter"] = start_after
+        for page in self._client.get_paginator("list_objects_v2").paginate(**kwargs):
+            for content in page.get("Contents", []):
+                yield content["Key"]
+
+    def iter_keys(self) -> Iterator[str]:
+        prefix = self._prefix + "objects/"
+        for key in self._iter_object_keys(prefix):
+            yield key[len(prefix):]
+
+    def get_created(self, key: str) -> int:
+        response = self._client.head_object(Bucket=self._bucket, Key=self._prefix + "objects/" + key)
+        return int(response["LastModified"].timestamp() * 1_000_000)
+
+    def has_index(self) -> bool:
+        has_records = next(self._iter_object_keys(self._prefix + "index/"), None) is not None
+        return has_records or next(self._iter_object_keys(self._prefix + "objects/"), None) is None
+
+    def _get_index_key(self, record: list) -> str:
+        created, object_uuid, object_type = record
+        return "{}index/{:020d}-{}-{}".format(self._prefix, created, object_uuid, object_type)
+
+    def append_index_records(self, records: list[list], sync: bool = False) -> None:
+        for record in records:
+            self._client.put_object(Bucket=self._bucket, Key=self._get_index_key(record), Body=b"")
+
+    def read_index_records(self, position: int | None) -> tuple[list[list], int | None]:
+        # Markers of other processes and threads may become visible after markers with a later creation time, so the
+        # listing restarts before the latest creation time read and the records of the skew window are read again
+        start_after = None
+        if position is not None:
+            start_after = "{}index/{:020d}".format(self._prefix, max(0, position - self._index_skew_window))
+        records = []
+        for key in self._iter_object_keys(self._prefix + "index/", start_after=start_after):
+            created, object_uuid, object_type = key.rsplit("/", 1)[1].split("-")
+            records.append([int(created), object_uuid, object_type])
+            position = max(position or 0, int(created))
+        return records, position
+
+    def replace_index_records(self, records: list[list]) -> None:
+        existing_keys = list(self._iter_object_keys(self._prefix + "index/"))
+        for start in range(0, len(existing_keys), 1000):
+            self._client.delete_objects(Bucket=self._bucket, Delete={
+                "Objects": [{"Key": key} for key in existing_keys[start:start + 1000]], "Quiet": True})
+        self.append_index_records(records)
+
+
+def fsync_folder(folder: str) -> None:
+    """
+    Flush the directory entries of a folder to stable storage.
+    :param folder: Path of the folder
+    """
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def create_did_store_backend(storage_type: str, storage_path: str, storage_layout: str = "flat",
+                             s3_endpoint_url: str | None = None) -> DIDStoreBackend:
+    """
+    Create the backend for a storage type.
+    :param storage_type: "local" (files), "sqlite" (embedded database) or "cloud" (S3-compatible object storage)
+    :param storage_path: Folder, database file or `s3://<bucket>/<prefix>` URL depending on the storage type
+    :param storage_layout: Layout of the local file backend ("flat" or "sharded")
+    :param s3_endpoint_url: Endpoint of the S3-compatible service used by storage type "cloud"
+    :return: The backend
+    """
+    if storage_type == "local":
+        return LocalFileBackend(storage_path, storage_layout)
+    if storage_type == "sqlite":
+        return SQLiteBackend(storage_path)
+    if storage_type == "cloud":
+        return S3Backend(storage_path, s3_endpoint_url)
+    raise ValueError(f"Storage Type ({storage_type}) for DIDStore is not supported.")
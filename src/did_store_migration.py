@@ -0,0 +1,47 @@
+"""
+Command line tool to copy the content of a DIDStore into a DIDStore with a different storage type or layout, e.g.
+
+    python did_store_migration.py --source-type local --source-path ../did --target-type sqlite \
+        --target-path ../did.sqlite
+
+The source store is not modified. The service should be stopped during the migration, objects saved in the meantime
+are not copied.
+"""
+import argparse
+import logging
+import os
+import sys
+
+from did_store import DIDStore
+
+
+def parse_arguments(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Copy all objects of a DIDStore into another DIDStore.")
+    parser.add_argument("--source-type", required=True, choices=["local", "sqlite", "cloud"])
+    parser.add_argument("--source-path", required=True)
+    parser.add_argument("--source-layout", default="flat", choices=["flat", "sharded"])
+    parser.add_argument("--target-type", required=True, choices=["local", "sqlite", "cloud"])
+    parser.add_argument("--target-path", required=True)
+    parser.add_argument("--target-layout", default="flat", choices=["flat", "sharded"])
+    parser.add_argument("--s3-endpoint-url", default=os.environ.get("DID_STORAGE_S3_ENDPOINT_URL"),
+                        help="Endpoint of the S3-compatible service used by storage type cloud")
+    parser.add_argument("--batch-size", type=int, default=500, help="Number of objects written at once")
+    return parser.parse_args(args)
+
+
+def main(args: list[str]) -> None:
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s: %(message)s")
+    arguments = parse_arguments(args)
+    source_did_store = DIDStore(storage_type=arguments.source_type, storage_path=arguments.source_path,
+                                vp_vc_id_prefix="", storage_layout=arguments.source_layout,
+                                s3_endpoint_url=arguments.s3_endpoint_url, build_index=False)
+    target_did_store = DIDStore(storage_type=arguments.target_type, storage_path=arguments.target_path,
+                                vp_vc_id_prefix="", storage_layout=arguments.target_layout,
+                                s3_endpoint_url=arguments.s3_endpoint_url)
+    count = source_did_store.migrate_to(target_did_store, batch_size=arguments.batch_size)
+    logging.info("DIDStore has been migrated [objects: {count}, source: {source}, target: {target}]"
+                 .format(count=count, source=arguments.source_path, target=arguments.target_path))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,118 @@
+"""
+Command line tool to verify the Proofs of all VCs and VPs of a DIDStore, e.g.
+
+    python did_store_verification.py --type local --path ../did --credential-issuer did:web:example.com \
+        --private-key-pem ../key.pem --report failed.ndjson
+
+The keys of verification methods that don't belong to the own issuer are resolved via `did:web`. The results of all
+documents that could not be verified are written to the report as NDJSON.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from canonicalization import CanonicalizationEngine
+from did_store import DIDStore
+from document_loader import CachingDocumentLoader, DEFAULT_CONTEXT_BUNDLE_DIR
+from proof_verifier import ProofVerifier, VerificationKeyResolver
+from self_description_processor import SelfDescriptionProcessor
+from signature_suites import read_signing_keys
+from signing_pool import SigningPool
+
+
+def parse_arguments(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Verify the Proofs of all objects of a DIDStore.")
+    parser.add_argument("--type", required=True, choices=["local", "sqlite", "cloud"])
+    parser.add_argument("--path", required=True)
+    parser.add_argument("--layout", default="flat", choices=["flat", "sharded"])
+    parser.add_argument("--s3-endpoint-url", default=os.environ.get("DID_STORAGE_S3_ENDPOINT_URL"),
+                        help="Endpoint of the S3-compatible service used by storage type cloud")
+    parser.add_argument("--object-type", choices=["VC", "VP"], help="Only verify objects of this type")
+    parser.add_argument("--credential-issuer", default=os.environ.get("CREDENTIAL_ISSUER", ""))
+    parser.add_argument("--private-key-pem", default=os.environ.get("CREDENTIAL_ISSUER_PRIVATE_KEY_PEM_PATH", ""),
+                        help="Comma-separated signing keys of the credential issuer (see "
+                             "CREDENTIAL_ISSUER_PRIVATE_KEY_PEM_PATH), their public parts are used as local keys")
+    parser.add_argument("--legacy-catalogue-signature", action="store_true",
+                        help="Try the payload of the legacy catalogue first")
+    parser.add_argument("--offline", action="store_true",
+                        help="Only use the bundled JSON-LD contexts")
+    parser.add_argument("--canonicalization-engine", default="optimized", choices=["optimized", "pyld"],
+                        help="Engine used to canonicalize the documents, see JSONLD_CANONICALIZATION_ENGINE")
+    parser.add_argument("--pool-size", type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes, 0 verifies in the calling process")
+    parser.add_argument("--batch-size", type=int, default=500, help="Number of objects verified at once")
+    parser.add_argument("--report", help="NDJSON file receiving the results of failed objects, default is stdout")
+    return parser.parse_args(args)
+
+
+def main(args: list[str]) -> int:
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s: %(message)s")
+    arguments = parse_arguments(args)
+    signing_keys = read_signing_keys(arguments.private_key_pem)
+    signature_jwk = signing_keys[0][0]
+    did_store = DIDStore(storage_type=arguments.type, storage_path=arguments.path, vp_vc_id_prefix="",
+                         storage_layout=arguments.layout, s3_endpoint_url=arguments.s3_endpoint_url)
+    document_loader_kwargs = {"bundle_dir": DEFAULT_CONTEXT_BUNDLE_DIR, "cache_size": 100, "cache_ttl_sec": 3600.0,
+                              "offline": arguments.offline}
+    processor_kwargs = {"credential_issuer": arguments.credential_issuer,
+                        "use_legacy_catalogue_signature": arguments.legacy_catalogue_signature,
+                        "verification_method_fragment": signing_keys[0][1]}
+    canonicalization_kwargs = None
+    if arguments.canonicalization_engine == "optimized":
+        canonicalization_kwargs = {"context_cache_size": 100, "context_cache_ttl_sec": 0}
+    self_description_processor = SelfDescriptionProcessor(
+        signature_jwk=signature_jwk, did_store=None, document_loader=CachingDocumentLoader(**document_loader_kwargs),
+        canonicalization_engine=CanonicalizationEngine(**canonicalization_kwargs) if canonicalization_kwargs else None,
+        **processor_kwargs)
+    signing_pool = None
+    if arguments.pool_size > 0:
+        signing_pool = SigningPool(pool_size=arguments.pool_size, queue_size=0, queue_timeout_sec=0,
+                                   signature_jwk=signature_jwk, processor_kwargs=processor_kwargs,
+                                   document_loader_kwargs=document_loader_kwargs,
+                                   canonicalization_kwargs=canonicalization_kwargs)
+    key_resolver = VerificationKeyResolver(
+        local_verification_keys={arguments.credential_issuer + "#" + verification_method_fragment: key
+                                 for key, verification_method_fragment in signing_keys},
+        cache_size=1000, cache_ttl_sec=0)
+    proof_verifier = ProofVerifier(self_description_processor=self_description_processor,
+                                   key_resolver=key_resolver,
+                                   signing_pool=signing_pool)
+
+    report = open(arguments.report, "w") if arguments.report else sys.stdout
+    verified = 0
+    failed = 0
+    cursor = None
+    try:
+        while True:
+            object_uuids, cursor = did_store.list_saved_uuids(limit=arguments.batch_size, cursor=cursor,
+                                                              object_type=arguments.object_type)
+            documents = []
+            for object_uuid in object_uuids:
+                try:
+                    documents.append(json.loads(did_store.get_saved_object(object_uuid)))
+                except Exception as e:
+                    failed += 1
+                    report.write(json.dumps({"uuid": object_uuid, "verified": False, "error": str(e)}) + "\n")
+            for document, result in zip(documents, proof_verifier.verify_many(documents)):
+                if result["verified"]:
+                    verified += 1
+                else:
+                    failed += 1
+                    report.write(json.dumps(dict(result, id=document.get("id"))) + "\n")
+            logging.info("Objects have been verified [verified: {verified}, failed: {failed}]"
+                         .format(verified=verified, failed=failed))
+            if cursor is None:
+                break
+    finally:
+        if report is not sys.stdout:
+            report.close()
+        if signing_pool is not None:
+            signing_pool.shutdown()
+        did_store.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,148 @@
+from __future__ import annotations  # used for linting (type annotations)
+from collections import deque
+from collections.abc import Callable
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+class DIDStoreWriteQueue:
+    """
+    Class can be used to save DIDStore objects in the background (write-behind). Objects are collected and written in
+    batches, each batch is flushed to stable storage (fsync) once. Compared to saving every object synchronously, the
+    request thread doesn't wait for the storage and the cost of flushing is shared by all objects of a batch.
+    """
+
+    def __init__(self, save_function: Callable[[list], bool], max_batch_size: int, max_delay_sec: float,
+                 max_queue_size: int, durable: bool) -> None:
+        """
+
+        :param save_function: Function that saves a batch of objects durably and returns whether it has succeeded
+        :param max_batch_size: A batch is written as soon as this number of objects is queued
+        :param max_delay_sec: A batch is written at the latest this time after its first object has been queued
+        :param max_queue_size: Maximum number of queued objects. Further objects are blocked until the queue has been
+        flushed.
+        :param durable: If `True`, `put` only returns after the object has been written, so a successful response
+        implies that the object has been persisted. Concurrent requests are still written in a common batch.
+        """
+        self.__save_function = save_function
+        self.__max_batch_size = max(max_batch_size, 1)
+        self.__max_delay_sec = max_delay_sec
+        self.__max_queue_size = max(max_queue_size, self.__max_batch_size)
+        self.__durable = durable
+        # Entries of (object, enqueue time, completion or None), the completion is only used in durable mode
+        self.__queue = deque()
+        # Objects that have been queued but not yet written by UUID, so they can already be read
+        self.__pending_objects = {}
+        self.__condition = threading.Condition()
+        self.__closed = False
+        self.__statistics = {"flushes": 0,
+                             "flushed_objects": 0,
+                             "failed_objects": 0,
+                             "flush_latency_sec_last": 0.0,
+                             "flush_latency_sec_max": 0.0,
+                             "flush_latency_sec_total": 0.0}
+        self.__flush_thread = threading.Thread(target=self._run, name="did-store-write-queue", daemon=True)
+        self.__flush_thread.start()
+        logger.info("DIDStore write queue initialized [max_batch_size: {max_batch_size}, max_delay_sec: {max_delay_sec}, "
+                    "durable: {durable}]".format(max_batch_size=max_batch_size, max_delay_sec=max_delay_sec,
+                                                 durable=durable))
+
+    def put(self, did_store_object) -> None:
+        """
+        Queue an object for saving. Blocks while the queue is full and, in durable mode, until the object has been
+        written.
+        :param did_store_object: The DIDStoreObject to be saved
+        """
+        completion = {"event": threading.Event(), "succeeded": False} if self.__durable else None
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError("DIDStore write queue has been closed")
+            while len(self.__queue) >= self.__max_queue_size:
+                self.__condition.wait()
+            self.__queue.append((did_store_object, time.monotonic(), completion))
+            self.__pending_objects[did_store_object.get_uuid()] = did_store_object
+            self.__condition.notify_all()
+        if completion is not None:
+            completion["event"].wait()
+            if not completion["succeeded"]:
+                raise IOError("Could not save DIDStoreObject [uuid: {uuid}]".format(uuid=did_store_object.get_uuid()))
+
+    def get_pending_object(self, object_uuid: str):
+        """
+        :param object_uuid: UUID of the object (hex representation)
+        :return: The queued object that has not been written yet or `None`
+        """
+        with self.__condition:
+            return self.__pending_objects.get(object_uuid)
+
+    def _run(self) -> None:
+        while True:
+            with self.__condition:
+                while True:
+                    if self.__queue:
+                        if self.__closed or len(self.__queue) >= self.__max_batch_size:
+                            break
+                        remaining_sec = self.__queue[0][1] + self.__max_delay_sec - time.monotonic()
+                        if remaining_sec <= 0:
+                            break
+                        self.__condition.wait(remaining_sec)
+                    elif self.__closed:
+                        return
+                    else:
+                        self.__condition.wait()
+                batch = [self.__queue.popleft() for _ in range(min(len(self.__queue), self.__max_batch_size))]
+                # Blocked producers can continue while the batch is written
+                self.__condition.notify_all()
+            self._flush(batch)
+
+    def _flush(self, batch: list) -> None:
+        started = time.monotonic()
+        try:
+            succeeded = self.__save_function([did_store_object for did_store_object, _, _ in batch])
+        except Exception as e:
+            logger.error("Could not flush DIDStore write queue [error: {error}]".format(error=e.args))
+            succeeded = False
+        latency_sec = time.monotonic() - started
+        with self.__condition:
+            for did_store_object, _, _ in batch:
+                self.__pending_objects.pop(did_store_object.get_uuid(), None)
+            self.__statistics["flushes"] += 1
+            self.__statistics["flushed_objects" if succeeded else "failed_objects"] += len(batch)
+            self.__statistics["flush_latency_sec_last"] = latency_sec
+            self.__statistics["flush_latency_sec_total"] += latency_sec
+            self.__statistics["flush_latency_sec_max"] = max(self.__statistics["flush_latency_sec_max"], latency_sec)
+        if not succeeded:
+            logger.error("DIDStore write queue batch has not been written [uuids: {uuids}]".format(
+                uuids=[did_store_object.get_uuid() for did_store_object, _, _ in batch]))
+        for did_store_object, _, completion in batch:
+            if not succeeded:
+                did_store_object.set_storage_path(None)
+            if completion is not None:
+                completion["succeeded"] = succeeded
+                completion["event"].set()
+
+    def get_statistics(self) -> dict:
+        """
+        :return: Current queue depth as well as counters and latencies of the flushes
+        """
+        with self.__condition:
+            statistics = dict(self.__statistics)
+            statistics["queue_depth"] = len(self.__queue)
+        return statistics
+
+    def close(self, timeout_sec: float | None = None) -> None:
+        """
+        Write all queued objects and stop the background thread. Objects queued afterwards are rejected.
+        :param timeout_sec: Maximum time to wait for the queue to drain
+        """
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__closed = True
+            pending_count = len(self.__queue)
+            self.__condition.notify_all()
+        logger.info("Draining DIDStore write queue [queue_depth: {count}]".format(count=pending_count))
+        self.__flush_thread.join(timeout_sec)
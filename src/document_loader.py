@@ -0,0 +1,91 @@
+import copy
+import json
+import logging
+import os
+
+from pyld import jsonld
+from pyld.jsonld import JsonLdError
+
+from cache import TTLCache
+
+logger = logging.getLogger()
+
+DEFAULT_CONTEXT_BUNDLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "contexts")
+
+
+def load_context_bundle(bundle_dir: str) -> dict:
+    """
+    Load a bundle of JSON-LD documents from disk. The bundle directory must contain a file `index.json` that maps
+    document URLs to file names relative to the bundle directory.
+    :param bundle_dir: Directory containing the bundle
+    :return: Mapping of document URL to the parsed document
+    """
+    with open(os.path.join(bundle_dir, "index.json"), "r") as index_file:
+        index = json.load(index_file)
+    documents = {}
+    for url, file_name in index.items():
+        with open(os.path.join(bundle_dir, file_name), "r") as document_file:
+            documents[url] = json.load(document_file)
+    return documents
+
+
+class CachingDocumentLoader:
+    """
+    Class can be used as a PyLD document loader that serves well-known JSON-LD contexts from a preloaded bundle and
+    keeps remotely fetched documents in an in-process LRU/TTL cache. This way, normalization does not have to wait for
+    HTTP requests in the hot path.
+    """
+
+    def __init__(self, bundle_dir: str | None, cache_size: int, cache_ttl_sec: float, offline: bool):
+        """
+
+        :param bundle_dir: Directory of the preloaded context bundle (see `load_context_bundle`). No bundle is loaded
+        if not set.
+        :param cache_size: Maximum number of remotely fetched documents kept in memory
+        :param cache_ttl_sec: Time in seconds after which remotely fetched documents are fetched again
+        :param offline: If `True`, documents that are not part of the bundle are never fetched via network
+        """
+        self.__bundled_documents = load_context_bundle(bundle_dir) if bundle_dir else {}
+        self.__cache = TTLCache(max_size=cache_size, ttl_sec=cache_ttl_sec)
+        self.__offline = offline
+        self.__remote_loader = jsonld.requests_document_loader(timeout=10)
+        self.bundle_hits = 0
+        logger.info("JSON-LD document loader initialized [bundled_documents: {count}, offline: {offline}]"
+                    .format(count=len(self.__bundled_documents), offline=offline))
+
+    def __call__(self, url: str, options: dict | None = None) -> dict:
+        """
+        Retrieve the JSON-LD document for the given URL. The signature matches the one expected by PyLD.
+        :param url: URL of the document
+        :param options: Options passed by PyLD
+        :return: A PyLD RemoteDocument
+        """
+        bundled_document = self.__bundled_documents.get(url)
+        if bundled_document is not None:
+            self.bundle_hits += 1
+            # The tag 'static' allows PyLD to keep the resolved context in its own cache
+            return {"contentType": "application/ld+json",
+                    "contextUrl": None,
+                    "documentUrl": url,
+                    "document": copy.deepcopy(bundled_document),
+                    "tag": "static"}
+
+        remote_document = self.__cache.get(url)
+        if remote_document is None:
+            if self.__offline:
+                raise JsonLdError("Document is not part of the context bundle and offline mode is enabled",
+                                  "jsonld.LoadDocumentError", {"url": url}, code="loading document failed")
+            remote_document = self.__remote_loader(url, options or {})
+            self.__cache.put(url, remote_document)
+        # PyLD may modify the returned document, so the cached one is never handed out directly
+        return copy.deepcopy(remote_document)
+
+    def get_statistics(self) -> dict:
+        """
+        :return: Hit/miss counters of the loader
+        """
+        cache_statistics = self.__cache.get_statistics()
+        return {"bundle_hits": self.bundle_hits,
+                "cache_hits": cache_statistics["hits"],
+                "cache_misses": cache_statistics["misses"],
+                "cache_size": cache_statistics["size"]}
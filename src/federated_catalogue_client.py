@@ -1,11 +1,28 @@
+from __future__ import annotations  # used for linting (type annotations)
 import json
 import logging
+import random
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 
 import requests
 from keycloak import KeycloakOpenID
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import FEDERATED_CATALOGUE_POST_SECONDS, FEDERATED_CATALOGUE_THROTTLED_RESPONSES, \
+    KEYCLOAK_TOKEN_FETCH_SECONDS
 
 logger = logging.getLogger()
 
+# Responses signalling that the Federated Catalogue is overloaded, the request can be retried later
+THROTTLING_STATUS_CODES = (429, 503)
+# Upper bound for delays requested via Retry-After, so that a misconfigured server can't stall an upload forever
+MAX_RETRY_AFTER_SEC = 300.0
+
 
 class FederatedCatalogueClient:
     """
@@ -13,7 +30,10 @@ class FederatedCatalogueClient:
     """
 
     def __init__(self, federated_catalogue_url: str, keycloak_server_url: str, federated_catalogue_user_name: str,
-                 federated_catalogue_user_password: str, keycloak_client_secret: str):
+                 federated_catalogue_user_password: str, keycloak_client_secret: str,
+                 keycloak_token_refresh_margin_sec: float = 30.0, connection_pool_size: int = 10,
+                 connect_timeout_sec: float = 5.0, read_timeout_sec: float = 60.0, max_retries: int = 3,
+                 retry_backoff_factor: float = 0.5, bulk_max_in_flight: int = 8, bulk_max_attempts: int = 5):
         """
 
         :param federated_catalogue_url:
@@ -21,6 +41,17 @@ class FederatedCatalogueClient:
         :param federated_catalogue_user_name:
         :param federated_catalogue_user_password:
         :param keycloak_client_secret:
+        :param keycloak_token_refresh_margin_sec: Cached tokens are refreshed this many seconds before they expire
+        :param connection_pool_size: Maximum number of keep-alive connections to the Federated Catalogue
+        :param connect_timeout_sec: Timeout for establishing a connection to the Federated Catalogue
+        :param read_timeout_sec: Timeout for waiting on the response of the Federated Catalogue
+        :param max_retries: Number of retries for failed requests. Requests that might have reached the Federated
+        Catalogue are only retried if they are idempotent.
+        :param retry_backoff_factor: Factor of the exponential backoff between retries
+        :param bulk_max_in_flight: Maximum number of Self Descriptions sent concurrently by
+        `send_many_to_federated_catalogue`
+        :param bulk_max_attempts: Maximum number of attempts per Self Description in `send_many_to_federated_catalogue`
+        if the Federated Catalogue responds with 429 or 503
         """
         if not federated_catalogue_url or \
                 not keycloak_server_url or \
@@ -35,19 +66,35 @@ class FederatedCatalogueClient:
         self.__federated_catalogue_user_name = federated_catalogue_user_name
         self.__federated_catalogue_user_password = federated_catalogue_user_password
         self.__keycloak_client_secret = keycloak_client_secret
+        self.__timeout = (connect_timeout_sec, read_timeout_sec)
+        self.__bulk_max_in_flight = max(bulk_max_in_flight, 1)
+        self.__bulk_retry_policy = BulkUploadRetryPolicy(max_attempts=bulk_max_attempts,
+                                                         backoff_factor=retry_backoff_factor)
+        # The session keeps connections to the Federated Catalogue alive, so that TCP and TLS handshakes are not
+        # performed for every request
+        retry = Retry(total=max_retries,
+                      backoff_factor=retry_backoff_factor,
+                      status_forcelist=(502, 503, 504),
+                      allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connection_pool_size, max_retries=retry)
+        self.__session = requests.Session()
+        self.__session.mount("http://", adapter)
+        self.__session.mount("https://", adapter)
+        self.__keycloak_openid = KeycloakOpenID(server_url=self.__keycloak_server_url,
+                                                client_id="federated-catalogue",
+                                                realm_name="gaia-x",
+                                                client_secret_key=self.__keycloak_client_secret)
+        self.__token_cache = KeycloakTokenCache(refresh_margin_sec=keycloak_token_refresh_margin_sec)
+        # Ensures that concurrent requests share a single token fetch
+        self.__token_lock = threading.Lock()
 
     def send_to_federated_catalogue(self, self_description: dict):
         """
         Send Self Description to GXFS Federated Catalogue.
         :param self_description: Self Description to be send
         """
-        headers = {"Content-Type": "application/json"}
-        self._add_federated_catalogue_auth_header(headers)
-        request_body = json.dumps(self_description)
-        # Request body is passed via parameter `data` instead of `json` to avoid issues because
-        # of the encoding of the request body
-        response = requests.post(self.__federated_catalogue_url + "/self-descriptions", headers=headers,
-                                 data=request_body)
+        response = self._send_self_description(json.dumps(self_description))
         if response.ok:
             logger.debug("SD successfully sent to Federated Catalogue")
         else:
@@ -55,6 +102,123 @@ class FederatedCatalogueClient:
                         "[status_code: {}, response_body: {}".format(response.status_code, response.text)
             raise IOError(error_msg)
 
+    def send_many_to_federated_catalogue(self, self_descriptions: Iterable[dict],
+                                         on_result: Callable[[dict], None] | None = None,
+                                         max_in_flight: int | None = None, max_queued: int = 0) -> list[dict]:
+        """
+        Send many Self Descriptions to GXFS Federated Catalogue concurrently. The number of requests in flight adapts
+        to the load of the Catalogue (AIMD): it grows by one per round trip of successful requests and is halved if the
+        Catalogue responds with 429 or 503. Throttled requests are retried after the delay requested via
+        `Retry-After`, which pauses all requests, or after an exponential backoff otherwise.
+        Self Descriptions are taken from the iterable only when they can be sent soon, so it can be a generator that
+        creates them lazily.
+        :param self_descriptions: Self Descriptions to be sent
+        :param on_result: Function that is called with the result of each Self Description as soon as it is known,
+        results are not collected if it is set
+        :param max_in_flight: Maximum number of concurrent requests, defaults to `bulk_max_in_flight`
+        :param max_queued: Number of Self Descriptions taken from the iterable in advance while all request slots are
+        in use
+        :return: Results in the order of the Self Descriptions, each containing its index, status ("success" or
+        "failed"), the last status code, the number of attempts and an error message for failed ones
+        """
+        max_in_flight = max(max_in_flight or self.__bulk_max_in_flight, 1)
+        limiter = AdaptiveConcurrencyLimiter(max_limit=max_in_flight)
+        results = []
+        pending_slots = threading.BoundedSemaphore(max_in_flight + max(max_queued, 0))
+
+        def send(index: int, self_description: dict):
+            try:
+                try:
+                    result = self._send_with_rate_control(index, self_description, limiter)
+                except Exception as e:
+                    # Every Self Description must be reported, otherwise the caller would miss its result
+                    logger.error("An error occurred while sending Self Description of a bulk upload [index: {index}, "
+                                 "error: {error}]".format(index=index, error=e.args))
+                    result = {"index": index, "status": "failed", "status_code": None, "attempts": 0,
+                              "error": "An error occurred while sending Self Description to Federated Catalogue "
+                                       "[error: {error}]".format(error=e.args)}
+                if on_result is not None:
+                    on_result(result)
+                else:
+                    results.append(result)
+            except Exception as e:
+                logger.error("An error occurred while handling the result of a bulk upload [index: {index}, "
+                             "error: {error}]".format(index=index, error=e.args))
+            finally:
+                pending_slots.release()
+
+        with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="catalogue-upload") as executor:
+            for index, self_description in enumerate(self_descriptions):
+                pending_slots.acquire()
+                executor.submit(send, index, self_description)
+        logger.debug("Bulk upload finished [concurrency_limit: {limit:.1f}]".format(limit=limiter.limit))
+        results.sort(key=lambda result: result["index"])
+        return results
+
+    def _send_with_rate_control(self, index: int, self_description: dict,
+                                limiter: AdaptiveConcurrencyLimiter) -> dict:
+        """
+        Send a single Self Description of a bulk upload, retrying it as long as the Catalogue is throttling.
+        :param index: Index of the Self Description within the bulk upload
+        :param self_description: Self Description to be sent
+        :param limiter: The limiter shared by all requests of the bulk upload
+        :return: The result of the Self Description
+        """
+        result = {"index": index, "id": self_description.get("id"), "status": "failed", "status_code": None,
+                  "attempts": 0}
+        try:
+            request_body = json.dumps(self_description)
+        except Exception as e:
+            result["error"] = "Self Description can't be serialized [error: {error}]".format(error=e.args)
+            return result
+        while True:
+            result["attempts"] += 1
+            started = limiter.acquire()
+            try:
+                response = self._send_self_description(request_body)
+            except Exception as e:
+                # Without a response there is no sign of overload, so the limit is neither decreased nor increased
+                limiter.release(started, failed=True)
+                self.__bulk_retry_policy.handle_error(result, e)
+                return result
+            throttled, retry_after_sec = get_throttling(response)
+            limiter.release(started, throttled=throttled, retry_after_sec=retry_after_sec)
+            retry_delay_sec = self.__bulk_retry_policy.handle_response(result, response.status_code, response.ok,
+                                                                       response.text, retry_after_sec)
+            if retry_delay_sec is None:
+                return result
+            time.sleep(retry_delay_sec)
+
+    def _send_self_description(self, request_body: str) -> requests.Response:
+        """
+        Post a serialized Self Description and retry once with a new token if the token has been rejected.
+        :param request_body: The serialized Self Description
+        :return: The response of the Federated Catalogue
+        """
+        response = self._post_self_description(request_body)
+        if response.status_code == 401:
+            # The cached token might have been revoked, so a new one is requested and the request is retried once
+            logger.info("Federated Catalogue rejected token, retrying with new token")
+            self._invalidate_keycloak_token()
+            response = self._post_self_description(request_body)
+        return response
+
+    def _post_self_description(self, request_body: str) -> requests.Response:
+        """
+        Post a serialized Self Description to the GXFS Federated Catalogue.
+        :param request_body: The serialized Self Description
+        :return: The response of the Federated Catalogue
+        """
+        headers = {"Content-Type": "application/json"}
+        self._add_federated_catalogue_auth_header(headers)
+        # Request body is passed via parameter `data` instead of `json` to avoid issues because
+        # of the encoding of the request body
+        start = time.perf_counter()
+        response = self.__session.post(self.__federated_catalogue_url + "/self-descriptions", headers=headers,
+                                       data=request_body, timeout=self.__timeout)
+        FEDERATED_CATALOGUE_POST_SECONDS.labels(str(response.status_code)).observe(time.perf_counter() - start)
+        return response
+
     def _add_federated_catalogue_auth_header(self, header: dict):
         """
         Add auth header for authorization against GXFS Federated Catalogue.
@@ -65,12 +229,334 @@ class FederatedCatalogueClient:
 
     def _get_keycloak_token(self):
         """
-        Retrieve JWT from Keycloak.
+        Retrieve JWT from Keycloak. The token is cached and refreshed shortly before it expires, using the refresh
+        token if it is still valid.
         :return: The retrieved JWT
         """
-        keycloak_openid = KeycloakOpenID(server_url=self.__keycloak_server_url,
-                                         client_id="federated-catalogue",
-                                         realm_name="gaia-x",
-                                         client_secret_key=self.__keycloak_client_secret)
-        token = keycloak_openid.token(self.__federated_catalogue_user_name, self.__federated_catalogue_user_password)
-        return token
+        token = self.__token_cache.get_valid_token()
+        if token is not None:
+            return token
+        with self.__token_lock:
+            # Another thread might have fetched a new token in the meantime
+            token = self.__token_cache.get_valid_token()
+            if token is not None:
+                return token
+            started = time.monotonic()
+            refresh_token = self.__token_cache.get_refresh_token(started)
+            grant_type = "password"
+            try:
+                if refresh_token is not None:
+                    try:
+                        token = self.__keycloak_openid.refresh_token(refresh_token)
+                        grant_type = "refresh_token"
+                    except Exception as e:
+                        logger.info("Refreshing Keycloak token failed, requesting new token [error: {error}]"
+                                    .format(error=e.args))
+                if token is None:
+                    token = self.__keycloak_openid.token(self.__federated_catalogue_user_name,
+                                                         self.__federated_catalogue_user_password)
+            except Exception:
+                self.__token_cache.put_failure(grant_type, started)
+                raise
+            self.__token_cache.put(token, grant_type, started)
+            return token
+
+    def _invalidate_keycloak_token(self):
+        """
+        Discard the cached JWT, so that a new one is requested on the next call of `_get_keycloak_token`.
+        """
+        with self.__token_lock:
+            self.__token_cache.invalidate()
+
+    def get_token_statistics(self) -> dict:
+        """
+        :return: Counters and latencies of the token requests sent to Keycloak
+        """
+        return self.__token_cache.get_statistics()
+
+
+class KeycloakTokenCache:
+    """
+    Keeps the Keycloak token of a Federated Catalogue client together with the expiry of the token and its refresh
+    token and the statistics of the token requests. The requests themselves and the locking are left to the sync and
+    async clients, so both follow the same rules.
+    """
+
+    def __init__(self, refresh_margin_sec: float):
+        """
+
+        :param refresh_margin_sec: Cached tokens are refreshed this many seconds before they expire
+        """
+        self.__refresh_margin_sec = refresh_margin_sec
+        self.__token = None
+        self.__token_expires_at = 0.0
+        self.__refresh_token_expires_at = 0.0
+        self.__statistics = {"password_grants": 0,
+                             "refresh_grants": 0,
+                             "failures": 0,
+                             "latency_sec_total": 0.0,
+                             "latency_sec_max": 0.0}
+
+    def get_valid_token(self) -> dict | None:
+        """
+        :return: The cached token or `None` if there is none or it is about to expire
+        """
+        token = self.__token
+        if token is not None and time.monotonic() < self.__token_expires_at:
+            return token
+        return None
+
+    def get_refresh_token(self, now: float) -> str | None:
+        """
+        :param now: Current time of `time.monotonic`
+        :return: The refresh token of the cached token or `None` if it is about to expire
+        """
+        if self.__token is not None and now < self.__refresh_token_expires_at:
+            return self.__token["refresh_token"]
+        return None
+
+    def put(self, token: dict, grant_type: str, started: float):
+        """
+        Cache a token received from Keycloak.
+        :param token: The token response
+        :param grant_type: "password" or "refresh_token"
+        :param started: Time of `time.monotonic` the token has been requested, the expiry is relative to it
+        """
+        self.__statistics["refresh_grants" if grant_type == "refresh_token" else "password_grants"] += 1
+        self._observe_latency(grant_type, started)
+        self.__token_expires_at = started + token.get("expires_in", 0) - self.__refresh_margin_sec
+        self.__refresh_token_expires_at = started + token.get("refresh_expires_in", 0) - self.__refresh_margin_sec
+        self.__token = token
+
+    def put_failure(self, grant_type: str, started: float):
+        """
+        Count a failed token request.
+        :param grant_type: The grant type of the last attempt
+        :param started: Time of `time.monotonic` the token has been requested
+        """
+        self.__statistics["failures"] += 1
+        self._observe_latency(grant_type, started)
+
+    def _observe_latency(self, grant_type: str, started: float):
+        latency_sec = time.monotonic() - started
+        KEYCLOAK_TOKEN_FETCH_SECONDS.labels(grant_type).observe(latency_sec)
+        self.__statistics["latency_sec_total"] += latency_sec
+        self.__statistics["latency_sec_max"] = max(self.__statistics["latency_sec_max"], latency_sec)
+
+    def invalidate(self):
+        """
+        Discard the cached token, so that a new one is requested.
+        """
+        self.__token = None
+        self.__token_expires_at = 0.0
+        self.__refresh_token_expires_at = 0.0
+
+    def get_statistics(self) -> dict:
+        """
+        :return: Counters and latencies of the token requests
+        """
+        return dict(self.__statistics)
+
+
+class BulkUploadRetryPolicy:
+    """
+    Decides whether a Self Description of a bulk upload is sent again. Only throttled requests (429 or 503) are retried,
+    after the delay requested via `Retry-After` (which the limiter enforces for all requests) or after an exponential
+    backoff with full jitter otherwise. Shared by the sync and async clients, which only perform the requests and wait.
+    """
+
+    def __init__(self, max_attempts: int, backoff_factor: float):
+        """
+
+        :param max_attempts: Maximum number of attempts per Self Description
+        :param backoff_factor: Factor of the exponential backoff between attempts
+        """
+        self.__max_attempts = max(max_attempts, 1)
+        self.__backoff_factor = backoff_factor
+
+    def handle_error(self, result: dict, error: Exception):
+        """
+        Record a request that failed without response. Timeouts and connection errors are not retried since the Self
+        Description might have been received.
+        :param result: The result of the Self Description
+        :param error: The error raised by the request
+        """
+        result["error"] = "An error occurred while sending Self Description to Federated Catalogue " \
+                          "[error: {error}]".format(error=error.args)
+
+    def handle_response(self, result: dict, status_code: int, success: bool, response_text: str,
+                        retry_after_sec: float | None) -> float | None:
+        """
+        Record the response of the Federated Catalogue in the result of a Self Description.
+        :param result: The result of the Self Description, `attempts` must include the current attempt
+        :param status_code: The status code of the response
+        :param success: Whether the Self Description has been accepted
+        :param response_text: The body of the response
+        :param retry_after_sec: The delay requested via `Retry-After`, see `get_throttling`
+        :return: Seconds to wait before the next attempt or `None` if the result is final
+        """
+        result["status_code"] = status_code
+        if success:
+            result["status"] = "success"
+            result.pop("error", None)
+            return None
+        result["error"] = "An error occurred while sending Self Description to Federated Catalogue " \
+                          "[status_code: {}, response_body: {}]".format(status_code, response_text)
+        if status_code not in THROTTLING_STATUS_CODES:
+            return None
+        FEDERATED_CATALOGUE_THROTTLED_RESPONSES.labels(str(status_code)).inc()
+        if result["attempts"] >= self.__max_attempts:
+            return None
+        if retry_after_sec is not None:
+            # The limiter pauses all requests until the requested delay has passed
+            return 0.0
+        # Full jitter spreads the retries of concurrent requests
+        return random.uniform(0, self.__backoff_factor * 2 ** (result["attempts"] - 1))
+
+
+class AIMDConcurrencyLimit:
+    """
+    Concurrency limit adapted by additive increase and multiplicative decrease (AIMD). Every successful request raises
+    the limit by `1 / limit`, i.e. by one per round trip of all requests in flight, and a throttled request halves it.
+    Requests that have been started before the last decrease don't decrease the limit again, so that a burst of
+    throttled responses counts as a single congestion signal. The limit isn't synchronized, the limiters of the sync
+    and async clients guard it with their condition.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, decrease_factor: float = 0.5):
+        """
+
+        :param max_limit: Upper bound of the limit, which is also the initial limit
+        :param min_limit: Lower bound of the limit
+        :param decrease_factor: Factor the limit is multiplied with if a request has been throttled
+        """
+        self.__max_limit = max_limit
+        self.__min_limit = min(min_limit, max_limit)
+        self.__decrease_factor = decrease_factor
+        self.__limit = float(max_limit)
+        self.__in_flight = 0
+        self.__paused_until = 0.0
+        self.__last_decrease = 0.0
+
+    @property
+    def limit(self) -> float:
+        return self.__limit
+
+    def get_pause_sec(self, now: float) -> float:
+        """
+        :param now: Current time of `time.monotonic`
+        :return: Remaining time of the pause requested via `Retry-After`, 0 or negative if there is no pause
+        """
+        return self.__paused_until - now
+
+    def is_full(self) -> bool:
+        """
+        :return: Whether the limit is reached, so that a request must wait for another one to finish
+        """
+        return self.__in_flight >= int(self.__limit)
+
+    def start(self, now: float) -> float:
+        """
+        Count a started request.
+        :param now: Current time of `time.monotonic`
+        :return: The time the request has been started, to be passed to `finish`
+        """
+        self.__in_flight += 1
+        return now
+
+    def finish(self, started: float, now: float, throttled: bool, retry_after_sec: float | None,
+               failed: bool = False):
+        """
+        Count a finished request and adapt the limit.
+        :param started: The time returned by `start`
+        :param now: Current time of `time.monotonic`
+        :param throttled: Whether the request has been rejected due to overload
+        :param retry_after_sec: Delay requested by the server, all requests are paused until it has passed
+        :param failed: Whether the request failed without response (e.g. connection error), the limit is kept then
+        """
+        self.__in_flight -= 1
+        if failed:
+            return
+        if throttled:
+            if started >= self.__last_decrease:
+                self.__limit = max(self.__limit * self.__decrease_factor, self.__min_limit)
+                self.__last_decrease = now
+            if retry_after_sec is not None:
+                self.__paused_until = max(self.__paused_until, now + retry_after_sec)
+        else:
+            self.__limit = min(self.__limit + 1 / self.__limit, self.__max_limit)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of concurrent requests of threads to an `AIMDConcurrencyLimit`.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, decrease_factor: float = 0.5):
+        """
+
+        See `AIMDConcurrencyLimit`.
+        """
+        self.__limit = AIMDConcurrencyLimit(max_limit, min_limit, decrease_factor)
+        self.__condition = threading.Condition()
+
+    @property
+    def limit(self) -> float:
+        return self.__limit.limit
+
+    def acquire(self) -> float:
+        """
+        Wait until a request may be started.
+        :return: The time the request has been started, to be passed to `release`
+        """
+        with self.__condition:
+            while True:
+                pause_sec = self.__limit.get_pause_sec(time.monotonic())
+                if pause_sec > 0:
+                    self.__condition.wait(pause_sec)
+                elif self.__limit.is_full():
+                    self.__condition.wait()
+                else:
+                    break
+            return self.__limit.start(time.monotonic())
+
+    def release(self, started: float, throttled: bool = False, retry_after_sec: float | None = None,
+                failed: bool = False):
+        """
+        Mark a request as finished and adapt the limit.
+        :param started: The time returned by `acquire`
+        :param throttled: Whether the request has been rejected due to overload
+        :param retry_after_sec: Delay requested by the server, all requests are paused until it has passed
+        :param failed: Whether the request failed without response, see `AIMDConcurrencyLimit.finish`
+        """
+        with self.__condition:
+            self.__limit.finish(started, time.monotonic(), throttled, retry_after_sec, failed)
+            self.__condition.notify_all()
+
+
+def get_throttling(response) -> tuple[bool, float | None]:
+    """
+    :param response: A response of the Federated Catalogue (`requests` or `httpx`)
+    :return: Whether the Catalogue is overloaded and the delay requested via `Retry-After`
+    """
+    throttled = response.status_code in THROTTLING_STATUS_CODES
+    return throttled, get_retry_after_sec(response) if throttled else None
+
+
+def get_retry_after_sec(response) -> float | None:
+    """
+    Parse the `Retry-After` header, which contains either a number of seconds or an HTTP date.
+    :param response: The response of the server (`requests` or `httpx`)
+    :return: The requested delay in seconds or `None` if the header is missing or invalid
+    """
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        retry_after_sec = float(value)
+    except ValueError:
+        try:
+            retry_after_sec = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(retry_after_sec, 0.0), MAX_RETRY_AFTER_SEC)
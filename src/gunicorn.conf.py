@@ -0,0 +1,110 @@
+# Configuration of the production server, e.g. `gunicorn --config gunicorn.conf.py`
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from threading import Event, Thread
+
+from prometheus_client import multiprocess
+
+# -- Environment variables --
+SERVER_PORT = os.environ.get("SERVER_PORT", default="8080")
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", default=2))
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", default=4))
+SERVER_KEEPALIVE_SEC = int(os.environ.get("SERVER_KEEPALIVE_SEC", default=5))
+SERVER_TIMEOUT_SEC = int(os.environ.get("SERVER_TIMEOUT_SEC", default=60))
+SERVER_GRACEFUL_TIMEOUT_SEC = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT_SEC", default=30))
+OPERATING_MODE = os.environ.get("OPERATING_MODE", default="API")
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR", default="")
+SERVER_INTERFACE = os.environ.get("SERVER_INTERFACE", default="wsgi")  # Can be either wsgi | asgi
+BACKGROUND_TASK_RESTART_MAX_DELAY_SEC = float(os.environ.get("BACKGROUND_TASK_RESTART_MAX_DELAY_SEC", default=60.0))
+
+bind = "0.0.0.0:" + SERVER_PORT
+if SERVER_INTERFACE == "asgi":
+    # Uploads to the Federated Catalogue are served by async handlers, the number of threads doesn't apply
+    wsgi_app = "asgi_app:app"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "self_description_creator:app"
+workers = SERVER_WORKERS
+threads = SERVER_THREADS
+keepalive = SERVER_KEEPALIVE_SEC
+timeout = SERVER_TIMEOUT_SEC
+graceful_timeout = SERVER_GRACEFUL_TIMEOUT_SEC
+
+BACKGROUND_TASK_COMMAND = [sys.executable, "-c",
+                           "from self_description_creator import background_task; background_task()"]
+# The delay before the first restart of the background task, doubled with each further restart
+BACKGROUND_TASK_RESTART_MIN_DELAY_SEC = 1.0
+if OPERATING_MODE == "HYBRID":
+    # The file exists while the background task is running, the workers inherit the variable and report the state via
+    # `/health/ready`
+    os.environ.setdefault("BACKGROUND_TASK_STATUS_FILE",
+                          os.path.join(tempfile.mkdtemp(prefix="self-description-creator-"), "background-task"))
+
+background_process = None
+background_task_stopping = Event()
+
+
+def on_starting(server):
+    # Metrics of processes of a previous run must not be aggregated
+    if PROMETHEUS_MULTIPROC_DIR:
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+        for file_name in os.listdir(PROMETHEUS_MULTIPROC_DIR):
+            if file_name.endswith(".db"):
+                os.remove(os.path.join(PROMETHEUS_MULTIPROC_DIR, file_name))
+
+
+def when_ready(server):
+    """
+    The file-based SD creation must run exactly once, independent of the number of workers. Therefore, it is started
+    in a dedicated process by the arbiter instead of inside the workers. A fresh interpreter is used, since a process
+    forked from the arbiter would inherit its signal handling.
+    """
+    if OPERATING_MODE == "HYBRID":
+        Thread(target=supervise_background_task, args=(server,), name="background-task-supervisor",
+               daemon=True).start()
+
+
+def supervise_background_task(server):
+    """
+    Run the background task until the arbiter exits. If the process terminates unexpectedly (e.g. killed due to
+    memory limits), it is restarted with an exponential backoff up to `BACKGROUND_TASK_RESTART_MAX_DELAY_SEC`. The
+    backoff is reset once a process has been running for longer than the maximum delay.
+    """
+    global background_process
+    status_file = os.environ["BACKGROUND_TASK_STATUS_FILE"]
+    restart_delay_sec = BACKGROUND_TASK_RESTART_MIN_DELAY_SEC
+    while not background_task_stopping.is_set():
+        server.log.info("Starting background task for operating mode = 'HYBRID'")
+        background_process = subprocess.Popen(BACKGROUND_TASK_COMMAND)
+        started = time.monotonic()
+        with open(status_file, "w") as file:
+            file.write(str(background_process.pid))
+        exit_code = background_process.wait()
+        os.remove(status_file)
+        if background_task_stopping.is_set():
+            break
+        if time.monotonic() - started > BACKGROUND_TASK_RESTART_MAX_DELAY_SEC:
+            restart_delay_sec = BACKGROUND_TASK_RESTART_MIN_DELAY_SEC
+        server.log.error("Background task terminated unexpectedly, restarting it [exit_code: {exit_code}, "
+                         "delay_sec: {delay}]".format(exit_code=exit_code, delay=restart_delay_sec))
+        background_task_stopping.wait(restart_delay_sec)
+        restart_delay_sec = min(restart_delay_sec * 2, BACKGROUND_TASK_RESTART_MAX_DELAY_SEC)
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    background_task_stopping.set()
+    if background_process is not None and background_process.poll() is None:
+        server.log.info("Stopping background task")
+        background_process.terminate()
+        try:
+            background_process.wait(timeout=SERVER_GRACEFUL_TIMEOUT_SEC)
+        except subprocess.TimeoutExpired:
+            background_process.kill()
@@ -0,0 +1,121 @@
+"""
+Prometheus metrics of the hot paths. Observing a metric only updates an in-memory value, so the instrumentation can stay
+enabled in production. If the environment variable `PROMETHEUS_MULTIPROC_DIR` is set, the metrics of all processes
+(Gunicorn workers, the background task and signing pool workers) are aggregated by `generate_metrics`.
+"""
+import os
+
+from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest, \
+    multiprocess, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+
+from claim_file_reader import is_claim_file_name
+
+# Buckets for operations that usually take between a fraction of a millisecond and a few seconds
+FAST_OPERATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets for the startup of a process, which takes between a few milliseconds and a minute
+STARTUP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+JSONLD_NORMALIZATION_SECONDS = Histogram("sd_creator_jsonld_normalization_seconds",
+                                         "Time spent normalizing JSON-LD documents (URDNA2015)",
+                                         ["document"], buckets=FAST_OPERATION_BUCKETS)
+CANONICALIZATION_LABELING = Counter("sd_creator_canonicalization_labeling",
+                                    "Number of documents canonicalized by the optimized engine by the algorithm used to "
+                                    "label blank nodes",
+                                    ["algorithm"])
+SIGNING_SECONDS = Histogram("sd_creator_signing_seconds",
+                            "Time spent creating JWS signatures",
+                            ["algorithm"], buckets=FAST_OPERATION_BUCKETS)
+DID_STORE_IO_SECONDS = Histogram("sd_creator_did_store_io_seconds",
+                                 "Time spent reading and writing documents of the did store",
+                                 ["operation", "storage_type"], buckets=FAST_OPERATION_BUCKETS)
+KEYCLOAK_TOKEN_FETCH_SECONDS = Histogram("sd_creator_keycloak_token_fetch_seconds",
+                                         "Time spent requesting tokens from Keycloak",
+                                         ["grant_type"], buckets=FAST_OPERATION_BUCKETS)
+FEDERATED_CATALOGUE_POST_SECONDS = Histogram("sd_creator_federated_catalogue_post_seconds",
+                                             "Time spent sending Self Descriptions to the Federated Catalogue",
+                                             ["status_code"], buckets=FAST_OPERATION_BUCKETS)
+FEDERATED_CATALOGUE_THROTTLED_RESPONSES = Counter("sd_creator_federated_catalogue_throttled_responses",
+                                                  "Number of uploads to the Federated Catalogue that have been "
+                                                  "throttled (429 or 503)",
+                                                  ["status_code"])
+SIGNING_CACHE_REQUESTS = Counter("sd_creator_signing_cache_requests",
+                                 "Number of lookups in the signing cache",
+                                 ["result"])
+PROOF_VERIFICATIONS = Counter("sd_creator_proof_verifications",
+                              "Number of VCs and VPs whose Proofs have been verified",
+                              ["result"])
+VERIFICATION_KEY_CACHE_REQUESTS = Counter("sd_creator_verification_key_cache_requests",
+                                          "Number of lookups of DID documents in the verification key cache",
+                                          ["result"])
+CLAIM_FILES_PROCESSED = Counter("sd_creator_claim_files_processed",
+                                "Number of Claim files that have been processed successfully")
+CLAIM_FILES_FAILED = Counter("sd_creator_claim_files_failed",
+                             "Number of Claim files whose processing has failed")
+CLAIM_FILE_LEASES = Counter("sd_creator_claim_file_leases",
+                            "Number of Claim files leased by this replica (acquired), leased by another replica first "
+                            "(lost) or moved back from the lease folder of a stale replica (recovered)",
+                            ["result"])
+CLAIM_RECORDS_PROCESSED = Counter("sd_creator_claim_records_processed",
+                                  "Number of records of bulk Claim files that have been processed successfully")
+CLAIM_RECORDS_REJECTED = Counter("sd_creator_claim_records_rejected",
+                                 "Number of records of bulk Claim files that have been written to a reject file")
+STARTUP_SECONDS = Histogram("sd_creator_startup_seconds",
+                            "Time spent starting a process of the application",
+                            ["phase"], buckets=STARTUP_BUCKETS)
+HTTP_REQUEST_SECONDS = Histogram("sd_creator_http_request_seconds",
+                                 "Time spent handling HTTP requests",
+                                 ["method", "route", "status_code"], buckets=FAST_OPERATION_BUCKETS)
+
+
+class ClaimFilesBacklogCollector:
+    """
+    Collector reporting the number of Claim files that are waiting to be processed. The folder is only listed when the
+    metrics are scraped, so the gauge doesn't cost anything in the hot path.
+    """
+
+    def __init__(self, claim_files_dir: str) -> None:
+        self.__claim_files_dir = claim_files_dir
+
+    def describe(self):
+        # Avoids that the folder is listed when the collector is registered
+        return []
+
+    def collect(self):
+        backlog = GaugeMetricFamily("sd_creator_claim_files_backlog",
+                                    "Number of Claim files waiting to be processed")
+        if os.path.isdir(self.__claim_files_dir):
+            backlog.add_metric([], sum(1 for entry in os.scandir(self.__claim_files_dir)
+                                       if is_claim_file_name(entry.name) and entry.is_file()))
+            yield backlog
+
+
+def generate_metrics(additional_collectors: list) -> tuple[bytes, str]:
+    """
+    Render the metrics in the Prometheus text format.
+    :param additional_collectors: Collectors that are evaluated in the calling process only, like the backlog gauge
+    :return: The rendered metrics and their content type
+    """
+    registry = CollectorRegistry()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(_RegistryCollector(REGISTRY))
+    for collector in additional_collectors:
+        registry.register(collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class _RegistryCollector:
+    """
+    Exposes the metrics of an existing registry as a collector, so they can be combined with other collectors.
+    """
+
+    def __init__(self, registry: CollectorRegistry) -> None:
+        self.__registry = registry
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        return self.__registry.collect()
@@ -0,0 +1,206 @@
+"""
+Verification of the `JSON Web Signature 2020` Proofs of VCs and VPs. The public keys of the verification methods are
+resolved concurrently and kept in a TTL cache, so that a batch of documents signed by the same issuers only requires a
+single DID resolution per issuer. Canonicalization and signature checks are CPU-bound and are spread across the worker
+processes of the signing pool, if configured.
+"""
+from __future__ import annotations  # used for linting (type annotations)
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Iterable
+from urllib.parse import unquote
+
+import requests
+from requests.adapters import HTTPAdapter
+from jwcrypto.jwk import JWK
+
+from cache import TTLCache
+from metrics import PROOF_VERIFICATIONS, VERIFICATION_KEY_CACHE_REQUESTS
+from self_description_processor import SelfDescriptionProcessor
+from signing_pool import SigningPool
+
+logger = logging.getLogger()
+
+
+def get_did_web_document_url(did: str) -> str:
+    """
+    Determine the URL of the DID document of a `did:web` DID (see https://w3c-ccg.github.io/did-method-web/).
+    :param did: The DID, e.g. `did:web:example.com:users:alice`
+    :return: The URL of the DID document, e.g. `https://example.com/users/alice/did.json`
+    """
+    if not did.startswith("did:web:"):
+        raise ValueError("Unsupported DID method [did: {did}]".format(did=did))
+    path_segments = [unquote(segment) for segment in did[len("did:web:"):].split(":")]
+    if not path_segments[0]:
+        raise ValueError("DID doesn't contain a domain [did: {did}]".format(did=did))
+    if len(path_segments) == 1:
+        path_segments.append(".well-known")
+    return "https://" + "/".join(path_segments) + "/did.json"
+
+
+def collect_verification_methods(document: dict) -> set[str]:
+    """
+    :param document: A VC or VP
+    :return: The verification methods referenced by the Proof of the document and the Proofs of embedded VCs
+    """
+    credentials = document.get("verifiableCredential", [])
+    if isinstance(credentials, dict):
+        credentials = [credentials]
+    verification_methods = set()
+    for credential in [document] + list(credentials):
+        if isinstance(credential, dict) and isinstance(credential.get("proof"), dict):
+            verification_method = credential["proof"].get("verificationMethod")
+            if isinstance(verification_method, str):
+                verification_methods.add(verification_method)
+    return verification_methods
+
+
+class VerificationKeyResolver:
+    """
+    Class can be used to resolve the public keys of verification methods. Keys of the own issuer are known locally,
+    the keys of `did:web` DIDs are read from their DID document, which is cached until the TTL expires.
+    """
+
+    def __init__(self, local_verification_keys: dict[str, JWK], cache_size: int, cache_ttl_sec: float,
+                 timeout_sec: float = 10, max_workers: int = 8) -> None:
+        """
+
+        :param local_verification_keys: Keys by the ID of their verification method, which are never resolved via
+        network. Private keys are reduced to their public part.
+        :param cache_size: Maximum number of DID documents kept in memory
+        :param cache_ttl_sec: Time in seconds after which DID documents are resolved again
+        :param timeout_sec: Timeout of the requests for DID documents
+        :param max_workers: Maximum number of DID documents that are resolved concurrently
+        """
+        self.__local_verification_keys = {verification_method: JWK.from_json(key.export_public())
+                                          for verification_method, key in local_verification_keys.items()}
+        self.__cache = TTLCache(max_size=cache_size, ttl_sec=cache_ttl_sec)
+        self.__timeout_sec = timeout_sec
+        self.__max_workers = max_workers
+        self.__session = requests.Session()
+        self.__session.mount("https://", HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers))
+
+    def resolve(self, verification_method: str) -> JWK:
+        """
+        :param verification_method: ID of the verification method, e.g. `did:web:example.com#key-1`
+        :return: The public key of the verification method
+        """
+        local_key = self.__local_verification_keys.get(verification_method)
+        if local_key is not None:
+            return local_key
+        did = verification_method.split("#")[0]
+        verification_keys = self.__cache.get(did)
+        if verification_keys is None:
+            VERIFICATION_KEY_CACHE_REQUESTS.labels("miss").inc()
+            verification_keys = self._resolve_did_web(did)
+            self.__cache.put(did, verification_keys)
+        else:
+            VERIFICATION_KEY_CACHE_REQUESTS.labels("hit").inc()
+        verification_key = verification_keys.get(verification_method)
+        if verification_key is None:
+            raise ValueError("DID document doesn't contain the verification method [verification_method: {method}]"
+                             .format(method=verification_method))
+        return verification_key
+
+    def resolve_many(self, verification_methods: Iterable[str]) -> dict[str, JWK]:
+        """
+        Resolve several verification methods concurrently. Verification methods that can't be resolved are logged and
+        left out of the result.
+        :param verification_methods: IDs of the verification methods
+        :return: The public keys by the ID of their verification method
+        """
+        # Verification methods of the same DID are resolved by the same task, so its DID document is fetched once
+        verification_methods_by_did = {}
+        for verification_method in verification_methods:
+            verification_methods_by_did.setdefault(verification_method.split("#")[0], []).append(verification_method)
+        verification_keys = {}
+        if not verification_methods_by_did:
+            return verification_keys
+        with ThreadPoolExecutor(max_workers=min(self.__max_workers, len(verification_methods_by_did)),
+                                thread_name_prefix="verification-key-resolver") as executor:
+            for did_verification_keys in executor.map(self._resolve_all, verification_methods_by_did.values()):
+                verification_keys.update(did_verification_keys)
+        return verification_keys
+
+    def _resolve_all(self, verification_methods: list[str]) -> dict[str, JWK]:
+        verification_keys = {}
+        for verification_method in verification_methods:
+            try:
+                verification_keys[verification_method] = self.resolve(verification_method)
+            except Exception as e:
+                logger.warning("Verification method could not be resolved [verification_method: {method}, "
+                               "error: {error}]".format(method=verification_method, error=e.args))
+        return verification_keys
+
+    def _resolve_did_web(self, did: str) -> dict[str, JWK]:
+        """
+        Read the keys of all verification methods from the DID document of a `did:web` DID.
+        :param did: The DID
+        :return: The public keys by the ID of their verification method
+        """
+        response = self.__session.get(get_did_web_document_url(did), timeout=self.__timeout_sec)
+        response.raise_for_status()
+        did_document = response.json()
+        if did_document.get("id") != did:
+            raise ValueError("ID of the DID document doesn't match the DID [did: {did}]".format(did=did))
+        verification_keys = {}
+        # Verification methods might also be embedded into the verification relationship
+        for verification_method in did_document.get("verificationMethod", []) + did_document.get("assertionMethod", []):
+            if not isinstance(verification_method, dict) or "publicKeyJwk" not in verification_method:
+                continue
+            verification_method_id = verification_method.get("id", "")
+            if verification_method_id.startswith("#"):
+                verification_method_id = did + verification_method_id
+            verification_keys[verification_method_id] = JWK(**verification_method["publicKeyJwk"])
+        return verification_keys
+
+    def get_statistics(self) -> dict:
+        """
+        :return: Hit/miss counters of the DID document cache
+        """
+        return self.__cache.get_statistics()
+
+
+class ProofVerifier:
+    """
+    Class can be used to verify the Proofs of VCs and VPs, see `SelfDescriptionProcessor.verify_proofs`.
+    """
+
+    def __init__(self, self_description_processor: SelfDescriptionProcessor, key_resolver: VerificationKeyResolver,
+                 signing_pool: SigningPool | None = None) -> None:
+        """
+
+        :param self_description_processor: Processor used to verify the Proofs in the calling thread
+        :param key_resolver: Resolver of the keys of the verification methods
+        :param signing_pool: Optional pool of worker processes used to verify the Proofs of several documents in
+        parallel. Proofs are verified one after another in the calling thread if not set.
+        """
+        self.__self_description_processor = self_description_processor
+        self.__key_resolver = key_resolver
+        self.__signing_pool = signing_pool
+
+    def verify(self, document: dict) -> dict:
+        """
+        :param document: The VC or VP to be verified
+        :return: The overall result and the result of every Proof
+        """
+        return self.verify_many([document])[0]
+
+    def verify_many(self, documents: list[dict]) -> list[dict]:
+        """
+        Verify the Proofs of several documents. The keys of all verification methods are resolved up front.
+        :param documents: The VCs or VPs to be verified
+        :return: The results in the order of the documents
+        """
+        verification_methods = set()
+        for document in documents:
+            verification_methods.update(collect_verification_methods(document))
+        verification_keys = self.__key_resolver.resolve_many(verification_methods)
+        if self.__signing_pool is not None and len(documents) > 1:
+            results = self.__signing_pool.verify_proofs(documents, verification_keys)
+        else:
+            results = [self.__self_description_processor.verify_proofs(document, verification_keys)
+                       for document in documents]
+        for result in results:
+            PROOF_VERIFICATIONS.labels("verified" if result["verified"] else "failed").inc()
+        return results
@@ -1,20 +1,36 @@
 from __future__ import annotations  # used for linting (type annotations)
 
+import atexit
+import base64
+import hashlib
+import json
 import logging
 import os
+import signal
+import socket
+import sys
 import time
 from logging.config import dictConfig
-from threading import Thread
+from datetime import datetime, timezone
+from threading import Event, Lock, Thread, current_thread, main_thread
 
-from flask import Flask, redirect, Request, request
+from flask import Flask, g, redirect, Request, request, Response, stream_with_context, url_for
 from flasgger import Swagger
-from jwcrypto import jwk
 from jwcrypto.jwk import JWK
 
+from cache import TTLCache
+from canonicalization import CanonicalizationEngine
 from claim_file_handler import ClaimFileHandler
+from claim_file_leases import ClaimFileLeases
+from claim_file_watcher import ClaimFileWatcher, is_inotify_available
 from federated_catalogue_client import FederatedCatalogueClient
-from self_description_processor import SelfDescriptionProcessor
-from did_store import DIDStore
+from metrics import ClaimFilesBacklogCollector, generate_metrics, HTTP_REQUEST_SECONDS, STARTUP_SECONDS
+from proof_verifier import ProofVerifier, VerificationKeyResolver
+from self_description_processor import IdempotencyKeyConflictError, SelfDescriptionProcessor
+from signature_suites import get_signature_suite, read_signing_keys
+from did_store import DIDStore, DIDStoreObjectNotFoundError
+from document_loader import CachingDocumentLoader, DEFAULT_CONTEXT_BUNDLE_DIR
+from signing_pool import SigningPool
 
 # -- Environment variables --
 KEYCLOAK_SERVER_URL = os.environ.get("KEYCLOAK_SERVER_URL", default="")
@@ -23,33 +39,128 @@ FEDERATED_CATALOGUE_USER_PASSWORD = os.environ.get("FEDERATED_CATALOGUE_USER_PAS
 USE_LEGACY_CATALOGUE_SIGNATURE = os.environ.get("USE_LEGACY_CATALOGUE_SIGNATURE", default="").lower() in ("true", "1")
 KEYCLOAK_CLIENT_SECRET = os.environ.get("KEYCLOAK_CLIENT_SECRET", default="")
 FEDERATED_CATALOGUE_URL = os.environ.get("FEDERATED_CATALOGUE_URL", default="")
+KEYCLOAK_TOKEN_REFRESH_MARGIN_SEC = float(os.environ.get("KEYCLOAK_TOKEN_REFRESH_MARGIN_SEC", default=30.0))
+FEDERATED_CATALOGUE_CONNECTION_POOL_SIZE = int(os.environ.get("FEDERATED_CATALOGUE_CONNECTION_POOL_SIZE", default=10))
+FEDERATED_CATALOGUE_CONNECT_TIMEOUT_SEC = float(os.environ.get("FEDERATED_CATALOGUE_CONNECT_TIMEOUT_SEC", default=5.0))
+FEDERATED_CATALOGUE_READ_TIMEOUT_SEC = float(os.environ.get("FEDERATED_CATALOGUE_READ_TIMEOUT_SEC", default=60.0))
+FEDERATED_CATALOGUE_MAX_RETRIES = int(os.environ.get("FEDERATED_CATALOGUE_MAX_RETRIES", default=3))
+FEDERATED_CATALOGUE_RETRY_BACKOFF_FACTOR = float(os.environ.get("FEDERATED_CATALOGUE_RETRY_BACKOFF_FACTOR", default=0.5))
+FEDERATED_CATALOGUE_BULK_MAX_IN_FLIGHT = int(os.environ.get("FEDERATED_CATALOGUE_BULK_MAX_IN_FLIGHT", default=8))
+FEDERATED_CATALOGUE_BULK_MAX_ATTEMPTS = int(os.environ.get("FEDERATED_CATALOGUE_BULK_MAX_ATTEMPTS", default=5))
+ASYNC_FEDERATED_CATALOGUE_CONNECTION_POOL_SIZE = int(os.environ.get("ASYNC_FEDERATED_CATALOGUE_CONNECTION_POOL_SIZE",
+                                                                    default=100))
+ASYNC_SIGNING_THREADS = int(os.environ.get("ASYNC_SIGNING_THREADS", default=1))
 CREDENTIAL_ISSUER = os.environ.get("CREDENTIAL_ISSUER", default="")
 VP_VC_ID_PREFIX = os.environ.get("VP_VC_ID_PREFIX", default="https://localhost:8080")
 CREDENTIAL_ISSUER_PRIVATE_KEY_PEM_PATH = os.environ.get("CREDENTIAL_ISSUER_PRIVATE_KEY_PEM_PATH", default="")
 CLAIM_FILES_DIR = os.environ.get("CLAIM_FILES_DIR", default=os.path.join("..", "data"))
 CLAIM_FILES_POLL_INTERVAL_SEC = float(os.environ.get("CLAIM_FILES_POLL_INTERVAL_SEC", default=2.0))
 CLAIM_FILES_CLEANUP_MAX_FILE_AGE_DAYS = os.environ.get("CLAIM_FILES_CLEANUP_MAX_FILE_AGE_DAYS", default=1)
+CLAIM_FILES_WATCH_MODE = os.environ.get("CLAIM_FILES_WATCH_MODE", default="poll")  # Can be either poll | inotify
+CLAIM_FILES_WATCH_CLEANUP_INTERVAL_SEC = float(os.environ.get("CLAIM_FILES_WATCH_CLEANUP_INTERVAL_SEC", default=60.0))
+CLAIM_FILES_WATCH_RESCAN_INTERVAL_SEC = float(os.environ.get("CLAIM_FILES_WATCH_RESCAN_INTERVAL_SEC", default=600.0))
+CLAIM_FILES_UPLOAD_CONCURRENCY = int(os.environ.get("CLAIM_FILES_UPLOAD_CONCURRENCY", default=1))
+CLAIM_FILES_UPLOAD_QUEUE_SIZE = int(os.environ.get("CLAIM_FILES_UPLOAD_QUEUE_SIZE", default=10))
+CLAIM_FILES_CHECKPOINT_INTERVAL = int(os.environ.get("CLAIM_FILES_CHECKPOINT_INTERVAL", default=100))
+CLAIM_FILES_LEASING_ENABLED = os.environ.get("CLAIM_FILES_LEASING_ENABLED", default="").lower() in ("true", "1")
+CLAIM_FILES_REPLICA_ID = os.environ.get("CLAIM_FILES_REPLICA_ID", default=socket.gethostname())
+CLAIM_FILES_LEASE_TIMEOUT_SEC = float(os.environ.get("CLAIM_FILES_LEASE_TIMEOUT_SEC", default=300.0))
 DID_STORAGE_TYPE = os.environ.get("DID_STORAGE_TYPE", default="None")
 DID_STORAGE_PATH = os.environ.get("DID_STORAGE_PATH", default="")
+DID_STORAGE_S3_ENDPOINT_URL = os.environ.get("DID_STORAGE_S3_ENDPOINT_URL", default=None)
+DID_STORAGE_LAYOUT = os.environ.get("DID_STORAGE_LAYOUT", default="flat")  # Can be either flat | sharded
+DID_STORAGE_PRECOMPRESS = os.environ.get("DID_STORAGE_PRECOMPRESS", default="").lower() in ("true", "1")
+DID_STORAGE_WRITE_BEHIND = os.environ.get("DID_STORAGE_WRITE_BEHIND", default="").lower() in ("true", "1")
+DID_STORAGE_WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("DID_STORAGE_WRITE_BEHIND_BATCH_SIZE", default=100))
+DID_STORAGE_WRITE_BEHIND_MAX_DELAY_SEC = float(os.environ.get("DID_STORAGE_WRITE_BEHIND_MAX_DELAY_SEC", default=0.05))
+DID_STORAGE_WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get("DID_STORAGE_WRITE_BEHIND_QUEUE_SIZE", default=10000))
+DID_STORAGE_WRITE_BEHIND_DURABLE = os.environ.get("DID_STORAGE_WRITE_BEHIND_DURABLE", default="").lower() in ("true", "1")
+DID_DOCUMENT_CACHE_SIZE = int(os.environ.get("DID_DOCUMENT_CACHE_SIZE", default=1000))
+JSONLD_CONTEXT_BUNDLE_DIR = os.environ.get("JSONLD_CONTEXT_BUNDLE_DIR", default=DEFAULT_CONTEXT_BUNDLE_DIR)
+JSONLD_CONTEXT_CACHE_SIZE = int(os.environ.get("JSONLD_CONTEXT_CACHE_SIZE", default=100))
+JSONLD_CONTEXT_CACHE_TTL_SEC = float(os.environ.get("JSONLD_CONTEXT_CACHE_TTL_SEC", default=3600.0))
+JSONLD_OFFLINE_MODE = os.environ.get("JSONLD_OFFLINE_MODE", default="").lower() in ("true", "1")
+JSONLD_CANONICALIZATION_ENGINE = os.environ.get("JSONLD_CANONICALIZATION_ENGINE",
+                                                default="optimized")  # Can be either optimized | pyld
+SIGNING_POOL_SIZE = int(os.environ.get("SIGNING_POOL_SIZE", default=0))
+SIGNING_POOL_QUEUE_SIZE = int(os.environ.get("SIGNING_POOL_QUEUE_SIZE", default=100))
+SIGNING_POOL_QUEUE_TIMEOUT_SEC = float(os.environ.get("SIGNING_POOL_QUEUE_TIMEOUT_SEC", default=30.0))
+SIGNING_CACHE_ENABLED = os.environ.get("SIGNING_CACHE_ENABLED", default="").lower() in ("true", "1")
+SIGNING_CACHE_SIZE = int(os.environ.get("SIGNING_CACHE_SIZE", default=10000))
+SIGNING_CACHE_TTL_SEC = float(os.environ.get("SIGNING_CACHE_TTL_SEC", default=3600.0))
+VERIFICATION_KEY_CACHE_SIZE = int(os.environ.get("VERIFICATION_KEY_CACHE_SIZE", default=1000))
+VERIFICATION_KEY_CACHE_TTL_SEC = float(os.environ.get("VERIFICATION_KEY_CACHE_TTL_SEC", default=300.0))
+VERIFICATION_KEY_RESOLVER_THREADS = int(os.environ.get("VERIFICATION_KEY_RESOLVER_THREADS", default=8))
+VERIFICATION_KEY_RESOLVE_TIMEOUT_SEC = float(os.environ.get("VERIFICATION_KEY_RESOLVE_TIMEOUT_SEC", default=10.0))
+ID_DOCUMENTS_DEFAULT_PAGE_SIZE = int(os.environ.get("ID_DOCUMENTS_DEFAULT_PAGE_SIZE", default=500))
+ID_DOCUMENTS_MAX_PAGE_SIZE = int(os.environ.get("ID_DOCUMENTS_MAX_PAGE_SIZE", default=5000))
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", default=1000))
+BATCH_MAX_BODY_BYTES = int(os.environ.get("BATCH_MAX_BODY_BYTES", default=64 * 1024 * 1024))
+STARTUP_WARM_UP_ENABLED = os.environ.get("STARTUP_WARM_UP_ENABLED", default="true").lower() in ("true", "1")
+STARTUP_WARM_UP_JSONLD_CONTEXTS = [url.strip() for url in os.environ.get("STARTUP_WARM_UP_JSONLD_CONTEXTS",
+                                                                         default="").split(",") if url.strip()]
+STARTUP_WARM_UP_TIMEOUT_SEC = float(os.environ.get("STARTUP_WARM_UP_TIMEOUT_SEC", default=60.0))
 
 # -- Global variables --
 OPERATING_MODE = os.environ.get("OPERATING_MODE", default="API")  # Can be either API | HYBRID
+# Set by `gunicorn.conf.py` in operating mode HYBRID, the file exists while its background task is running
+BACKGROUND_TASK_STATUS_FILE = os.environ.get("BACKGROUND_TASK_STATUS_FILE", default="")
 ERROR_MESSAGE_TEMPLATE = "An error occurred while processing the request [error: {error_details}]"
+# Start of the initialization, used to report the startup time
+initialization_started = time.perf_counter()
+# Set as soon as the warm-up has been finished, see warm_up()
+warm_up_finished = Event()
+# Runs the background task if the development server is started in operating mode HYBRID
+background_thread: Thread | None = None
 
 # Variable will be initialized in method init_app() on application startup
 signature_jwk: JWK | None = None
+# All keys of the credential issuer and the fragments of their verification methods, starting with `signature_jwk`
+signing_keys: list[tuple[JWK, str]] = []
+# Variable will be initialized on first use by get_federated_catalogue_client(), the client is shared by the API and
+# the background task
+federated_catalogue_client: FederatedCatalogueClient | None = None
+federated_catalogue_client_lock = Lock()
 
 
 def read_signature_private_key() -> JWK:
     """
-    Read a private key from PEM file that is used to create a JWK which is utilized to sign VCs and VPs.
+    Read the private keys from the PEM files of `CREDENTIAL_ISSUER_PRIVATE_KEY_PEM_PATH`. The first key is utilized to
+    sign VCs and VPs, further keys are kept in `signing_keys` to verify Proofs created before a key rotation.
     :return: The initialized JWK
     """
-    with open(CREDENTIAL_ISSUER_PRIVATE_KEY_PEM_PATH, "rb") as key_file:
-        pem_data = key_file.read()
+    global signing_keys
+    signing_keys = read_signing_keys(CREDENTIAL_ISSUER_PRIVATE_KEY_PEM_PATH)
+    return signing_keys[0][0]
 
-    # Create a JWK from private key
-    return jwk.JWK.from_pem(pem_data)
+
+class LazySwagger(Swagger):
+    """
+    Flasgger extension that reads its template file on first use instead of on startup. Parsing the OpenAPI
+    specification is one of the slowest steps of the startup, while its views and request hooks must be registered
+    before the first request, so they are still registered right away.
+    """
+
+    def __init__(self, app: Flask, template_file: str, **kwargs) -> None:
+        self.__lazy_template_file = template_file
+        self.__lazy_template = None
+        self.__lazy_template_lock = Lock()
+        super().__init__(app, **kwargs)
+
+    @property
+    def template(self) -> dict | None:
+        if self.__lazy_template is None and self.__lazy_template_file is not None:
+            with self.__lazy_template_lock:
+                if self.__lazy_template is None:
+                    self.__lazy_template = self.load_swagger_file(self.__lazy_template_file)
+        return self.__lazy_template
+
+    @template.setter
+    def template(self, template: dict | None) -> None:
+        # Called by Swagger.__init__, an explicitly set template replaces the template file
+        if template is not None:
+            self.__lazy_template_file = None
+        self.__lazy_template = template
 
 
 def init_app():
@@ -59,7 +170,9 @@ def init_app():
 
     class HealthCheckFilter(logging.Filter):
         def filter(self, record: logging.LogRecord) -> bool:
-            return record.getMessage().find("/health") == -1
+            # Requests of health checks and metric scrapes would pollute the log output
+            message = record.getMessage()
+            return message.find("/health") == -1 and message.find("/metrics") == -1
 
     dictConfig({
         'version': 1,
@@ -78,8 +191,9 @@ def init_app():
     })
 
     logging.getLogger("werkzeug").addFilter(HealthCheckFilter())
+    logging.getLogger("gunicorn.access").addFilter(HealthCheckFilter())
     app = Flask(__name__)
-    Swagger(app, template_file=os.path.join(
+    LazySwagger(app, template_file=os.path.join(
         './openapi-spec.yaml'), parse=True, merge=True)
     app.logger.info("Initializing app")
 
@@ -95,7 +209,10 @@ def init_app():
                 "An error occurred while initializing JWK for signatures")
             exit(-1)
 
-        app.logger.info("Signing key has been successfully configured")
+        app.logger.info("Signing key has been successfully configured [algorithm: {algorithm}, "
+                        "verification_method_fragment: {fragment}, keys: {keys}]"
+                        .format(algorithm=get_signature_suite(signature_jwk).algorithm, fragment=signing_keys[0][1],
+                                keys=len(signing_keys)))
         app.logger.info("Initialization has been finished")
         return app
 
@@ -104,33 +221,193 @@ app = init_app()
 
 did_store = DIDStore(storage_path=DID_STORAGE_PATH,
                      storage_type=DID_STORAGE_TYPE,
-                     vp_vc_id_prefix=VP_VC_ID_PREFIX)
+                     vp_vc_id_prefix=VP_VC_ID_PREFIX,
+                     storage_layout=DID_STORAGE_LAYOUT,
+                     precompress=DID_STORAGE_PRECOMPRESS,
+                     s3_endpoint_url=DID_STORAGE_S3_ENDPOINT_URL)
+if DID_STORAGE_WRITE_BEHIND:
+    did_store.enable_write_behind(max_batch_size=DID_STORAGE_WRITE_BEHIND_BATCH_SIZE,
+                                  max_delay_sec=DID_STORAGE_WRITE_BEHIND_MAX_DELAY_SEC,
+                                  max_queue_size=DID_STORAGE_WRITE_BEHIND_QUEUE_SIZE,
+                                  durable=DID_STORAGE_WRITE_BEHIND_DURABLE)
+# Pending writes are drained when the process exits
+atexit.register(did_store.close)
+claim_files_backlog_collector = ClaimFilesBacklogCollector(CLAIM_FILES_DIR)
+# Stored documents are immutable, so they can be cached without invalidation
+did_document_cache = TTLCache(max_size=DID_DOCUMENT_CACHE_SIZE)
+document_loader_kwargs = {"bundle_dir": JSONLD_CONTEXT_BUNDLE_DIR,
+                          "cache_size": JSONLD_CONTEXT_CACHE_SIZE,
+                          "cache_ttl_sec": JSONLD_CONTEXT_CACHE_TTL_SEC,
+                          "offline": JSONLD_OFFLINE_MODE}
+document_loader = CachingDocumentLoader(**document_loader_kwargs)
+canonicalization_kwargs = None
+if JSONLD_CANONICALIZATION_ENGINE == "optimized":
+    canonicalization_kwargs = {"context_cache_size": JSONLD_CONTEXT_CACHE_SIZE,
+                               "context_cache_ttl_sec": JSONLD_CONTEXT_CACHE_TTL_SEC}
+elif JSONLD_CANONICALIZATION_ENGINE != "pyld":
+    raise ValueError("Canonicalization engine ({}) is not supported.".format(JSONLD_CANONICALIZATION_ENGINE))
+canonicalization_engine = CanonicalizationEngine(**canonicalization_kwargs) if canonicalization_kwargs else None
+signing_pool = None
+if SIGNING_POOL_SIZE > 0:
+    signing_pool = SigningPool(pool_size=SIGNING_POOL_SIZE,
+                               queue_size=SIGNING_POOL_QUEUE_SIZE,
+                               queue_timeout_sec=SIGNING_POOL_QUEUE_TIMEOUT_SEC,
+                               signature_jwk=signature_jwk,  # type: ignore
+                               processor_kwargs={"credential_issuer": CREDENTIAL_ISSUER,
+                                                 "use_legacy_catalogue_signature": USE_LEGACY_CATALOGUE_SIGNATURE,
+                                                 "verification_method_fragment": signing_keys[0][1]},
+                               document_loader_kwargs=document_loader_kwargs,
+                               canonicalization_kwargs=canonicalization_kwargs,
+                               warm_up_context_urls=STARTUP_WARM_UP_JSONLD_CONTEXTS)
 self_description_processor = SelfDescriptionProcessor(credential_issuer=CREDENTIAL_ISSUER,
                                                       signature_jwk=signature_jwk, # type: ignore needed for linting, type error would indicate that signature_jwk could ne None, but in init_app() we check, if signature_jwk is None.
                                                       use_legacy_catalogue_signature=USE_LEGACY_CATALOGUE_SIGNATURE,
-                                                      did_store=did_store)
+                                                      did_store=did_store,
+                                                      document_loader=document_loader,
+                                                      signing_pool=signing_pool,
+                                                      canonicalization_engine=canonicalization_engine,
+                                                      verification_method_fragment=signing_keys[0][1],
+                                                      signing_cache=TTLCache(max_size=SIGNING_CACHE_SIZE,
+                                                                             ttl_sec=SIGNING_CACHE_TTL_SEC)
+                                                      if SIGNING_CACHE_ENABLED else None)
+verification_key_resolver = VerificationKeyResolver(
+    local_verification_keys={CREDENTIAL_ISSUER + "#" + verification_method_fragment: key
+                             for key, verification_method_fragment in signing_keys},
+    cache_size=VERIFICATION_KEY_CACHE_SIZE,
+    cache_ttl_sec=VERIFICATION_KEY_CACHE_TTL_SEC,
+    timeout_sec=VERIFICATION_KEY_RESOLVE_TIMEOUT_SEC,
+    max_workers=VERIFICATION_KEY_RESOLVER_THREADS)
+proof_verifier = ProofVerifier(self_description_processor=self_description_processor,
+                               key_resolver=verification_key_resolver,
+                               signing_pool=signing_pool)
+STARTUP_SECONDS.labels("initialization").observe(time.perf_counter() - initialization_started)
+
+
+def warm_up():
+    """
+    Prepare the application for the first requests: load the OpenAPI specification, start the workers of the signing
+    pool and sign a dummy Credential, which loads the JSON-LD contexts and uses the signing key once. Runs in a
+    background thread, so `/health` is served meanwhile, while `/health/ready` only succeeds afterward. Failed steps
+    are logged and don't prevent the application from becoming ready, since requests would just be slower.
+    """
+    warm_up_started = time.perf_counter()
+    try:
+        app.swag.template
+    except Exception as e:
+        app.logger.warning("OpenAPI specification could not be loaded [error: {error}]".format(error=e.args))
+    if signing_pool is not None:
+        try:
+            worker_count = signing_pool.warm_up(timeout_sec=STARTUP_WARM_UP_TIMEOUT_SEC)
+            app.logger.info("Signing pool has been warmed up [workers: {workers}]".format(workers=worker_count))
+        except Exception as e:
+            app.logger.warning("Warm-up of signing pool failed [error: {error}]".format(error=e.args))
+    try:
+        self_description_processor.warm_up(STARTUP_WARM_UP_JSONLD_CONTEXTS)
+    except Exception as e:
+        app.logger.warning("Warm-up of signing failed [error: {error}]".format(error=e.args))
+    warm_up_duration_sec = time.perf_counter() - warm_up_started
+    STARTUP_SECONDS.labels("warm_up").observe(warm_up_duration_sec)
+    warm_up_finished.set()
+    app.logger.info("Warm-up has been finished [duration_sec: {duration:.3f}]".format(duration=warm_up_duration_sec))
+
+
+if STARTUP_WARM_UP_ENABLED:
+    Thread(target=warm_up, name="warm-up", daemon=True).start()
+else:
+    warm_up_finished.set()
+
+
+def get_federated_catalogue_client() -> FederatedCatalogueClient:
+    """
+    Return the client for the Federated Catalogue, which is shared across requests to reuse the cached Keycloak token
+    and the pooled connections.
+    :return: The shared client
+    """
+    global federated_catalogue_client
+    with federated_catalogue_client_lock:
+        if federated_catalogue_client is None:
+            federated_catalogue_client = FederatedCatalogueClient(
+                federated_catalogue_url=FEDERATED_CATALOGUE_URL,
+                keycloak_server_url=KEYCLOAK_SERVER_URL,
+                federated_catalogue_user_name=FEDERATED_CATALOGUE_USER_NAME,
+                federated_catalogue_user_password=FEDERATED_CATALOGUE_USER_PASSWORD,
+                keycloak_client_secret=KEYCLOAK_CLIENT_SECRET,
+                keycloak_token_refresh_margin_sec=KEYCLOAK_TOKEN_REFRESH_MARGIN_SEC,
+                connection_pool_size=FEDERATED_CATALOGUE_CONNECTION_POOL_SIZE,
+                connect_timeout_sec=FEDERATED_CATALOGUE_CONNECT_TIMEOUT_SEC,
+                read_timeout_sec=FEDERATED_CATALOGUE_READ_TIMEOUT_SEC,
+                max_retries=FEDERATED_CATALOGUE_MAX_RETRIES,
+                retry_backoff_factor=FEDERATED_CATALOGUE_RETRY_BACKOFF_FACTOR,
+                bulk_max_in_flight=FEDERATED_CATALOGUE_BULK_MAX_IN_FLIGHT,
+                bulk_max_attempts=FEDERATED_CATALOGUE_BULK_MAX_ATTEMPTS)
+        return federated_catalogue_client
 
 
 def background_task():
     """
     Main function to handle background work.
     """
-    federated_catalogue_client = FederatedCatalogueClient(federated_catalogue_url=FEDERATED_CATALOGUE_URL,
-                                                          keycloak_server_url=KEYCLOAK_SERVER_URL,
-                                                          federated_catalogue_user_name=FEDERATED_CATALOGUE_USER_NAME,
-                                                          federated_catalogue_user_password=FEDERATED_CATALOGUE_USER_PASSWORD,
-                                                          keycloak_client_secret=KEYCLOAK_CLIENT_SECRET)
+    if current_thread() is main_thread():
+        # Exit regularly on SIGTERM, so that pending writes of the did store are drained
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    claim_file_leases = None
+    if CLAIM_FILES_LEASING_ENABLED:
+        claim_file_leases = ClaimFileLeases(claim_files_dir=CLAIM_FILES_DIR,
+                                            replica_id=CLAIM_FILES_REPLICA_ID,
+                                            lease_timeout_sec=CLAIM_FILES_LEASE_TIMEOUT_SEC)
+        claim_file_leases.start()
     claim_file_handler = ClaimFileHandler(claim_files_dir=CLAIM_FILES_DIR,
                                           claim_files_cleanup_max_file_age_days=int(
                                               CLAIM_FILES_CLEANUP_MAX_FILE_AGE_DAYS),
                                           self_description_processor=self_description_processor,
-                                          federated_catalogue_client=federated_catalogue_client)
+                                          federated_catalogue_client=get_federated_catalogue_client(),
+                                          upload_concurrency=CLAIM_FILES_UPLOAD_CONCURRENCY,
+                                          upload_queue_size=CLAIM_FILES_UPLOAD_QUEUE_SIZE,
+                                          checkpoint_interval=CLAIM_FILES_CHECKPOINT_INTERVAL,
+                                          claim_file_leases=claim_file_leases)
+    if CLAIM_FILES_WATCH_MODE == "inotify":
+        if is_inotify_available():
+            watch_claim_files(claim_file_handler)
+        else:
+            app.logger.warning("inotify is not available, falling back to polling the Claim files folder")
     while True:
+        claim_file_handler.recover_stale_leases()
         claim_file_handler.process_claim_files()
         claim_file_handler.cleanup_old_files()
         time.sleep(CLAIM_FILES_POLL_INTERVAL_SEC)
 
 
+def watch_claim_files(claim_file_handler: ClaimFileHandler):
+    """
+    Process Claim files as soon as they have been written to the Claim files folder. Old files are cleaned up every
+    `CLAIM_FILES_WATCH_CLEANUP_INTERVAL_SEC`. Since inotify events can get lost without overflow (e.g. files written
+    while the watch is being set up or by another host), the whole folder is checked every
+    `CLAIM_FILES_WATCH_RESCAN_INTERVAL_SEC` as well.
+    :param claim_file_handler: The handler used to process the Claim files
+    """
+    claim_file_watcher = ClaimFileWatcher(CLAIM_FILES_DIR)
+    # Files written before the watch has been set up
+    claim_file_handler.process_claim_files()
+    next_cleanup = time.monotonic()
+    next_rescan = time.monotonic() + CLAIM_FILES_WATCH_RESCAN_INTERVAL_SEC
+    while True:
+        if time.monotonic() >= next_cleanup:
+            # Recovered files are moved into the Claim files folder, so they are reported by the watcher
+            claim_file_handler.recover_stale_leases()
+            claim_file_handler.cleanup_old_files()
+            next_cleanup = time.monotonic() + CLAIM_FILES_WATCH_CLEANUP_INTERVAL_SEC
+        if time.monotonic() >= next_rescan:
+            claim_file_handler.process_claim_files()
+            next_rescan = time.monotonic() + CLAIM_FILES_WATCH_RESCAN_INTERVAL_SEC
+        file_names = claim_file_watcher.wait_for_files(
+            timeout_sec=max(min(next_cleanup, next_rescan) - time.monotonic(), 0))
+        if file_names is None:
+            claim_file_handler.process_claim_files()
+            next_rescan = time.monotonic() + CLAIM_FILES_WATCH_RESCAN_INTERVAL_SEC
+        elif file_names:
+            claim_file_handler.process_claim_files(file_names)
+
+
 def get_json_request_body(request: Request):
     body = request.get_json()
     if body is None:
@@ -139,6 +416,152 @@ def get_json_request_body(request: Request):
         return body
 
 
+class BatchLimitExceededError(ValueError):
+    """
+    Raised in case a batch request exceeds the configured limits.
+    """
+
+
+def get_batch_request_items(request: Request) -> list:
+    """
+    Read the items of a batch request. The request body can either be a JSON array or NDJSON (one JSON document per line,
+    Content-Type `application/x-ndjson`). Lines of an NDJSON body that can't be parsed are returned as exception
+    instances, so that they can be reported individually.
+    :param request: The batch request
+    :return: The items contained in the request body
+    """
+    if request.content_length is not None and request.content_length > BATCH_MAX_BODY_BYTES:
+        raise BatchLimitExceededError(
+            "Request body exceeds the maximum size of {} bytes".format(BATCH_MAX_BODY_BYTES))
+    return parse_batch_request_body(request.stream.read(BATCH_MAX_BODY_BYTES + 1), request.mimetype)
+
+
+def parse_batch_request_body(body: bytes, mimetype: str) -> list:
+    """
+    Parse the body of a batch request, see `get_batch_request_items`.
+    :param body: The request body, reading it should have been stopped after `BATCH_MAX_BODY_BYTES` + 1 bytes
+    :param mimetype: The mimetype of the request body
+    :return: The items contained in the request body
+    """
+    if len(body) > BATCH_MAX_BODY_BYTES:
+        raise BatchLimitExceededError(
+            "Request body exceeds the maximum size of {} bytes".format(BATCH_MAX_BODY_BYTES))
+
+    if mimetype in ("application/x-ndjson", "application/jsonl"):
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(e)
+    else:
+        items = json.loads(body)
+        if not isinstance(items, list):
+            raise TypeError("Request body must be a JSON array or NDJSON")
+
+    if len(items) > BATCH_MAX_SIZE:
+        raise BatchLimitExceededError("Batch exceeds the maximum size of {} items".format(BATCH_MAX_SIZE))
+    return items
+
+
+def stream_batch_results(items: list, create_function) -> Response:
+    """
+    Process the items of a batch one after another and stream the results as NDJSON. Every result line contains the
+    index of the related item and its own status, so that a failing item doesn't fail the whole batch.
+    :param items: The items of the batch
+    :param create_function: Function that is called for each item and returns the result for it
+    :return: The streamed response
+    """
+
+    def generate():
+        for index, item in enumerate(items):
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                if not isinstance(item, dict):
+                    raise TypeError("Batch item must be a JSON object")
+                check_if_id_is_present(item)
+                result = {"index": index, "status": "success", "result": create_function(item)}
+            except Exception as e:
+                error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+                app.logger.warning(error_msg)
+                result = {"index": index, "status": "failed", "error": error_msg}
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def upload_batch_to_federated_catalogue(items: list, client: FederatedCatalogueClient) -> dict:
+    """
+    Create a Verifiable Presentation for each item of a batch and send them to the Federated Catalogue using the bulk
+    upload of the client, so that Presentations are created while previous ones are still being sent.
+    :param items: The items of the batch
+    :param client: The client used to send the Presentations
+    :return: A report with the number of succeeded and failed items and the result of every item
+    """
+    results = [None] * len(items)
+    # Item indexes by the index of their Self Description within the bulk upload
+    item_indexes = []
+
+    def create_self_descriptions():
+        for index, item in enumerate(items):
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                if not isinstance(item, dict):
+                    raise TypeError("Batch item must be a JSON object")
+                check_if_id_is_present(item)
+                self_description = self_description_processor.create_self_description(claims=item)
+            except Exception as e:
+                error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+                app.logger.warning(error_msg)
+                results[index] = {"index": index, "status": "failed", "error": error_msg}
+                continue
+            item_indexes.append(index)
+            yield self_description
+
+    for upload_result in client.send_many_to_federated_catalogue(create_self_descriptions()):
+        index = item_indexes[upload_result["index"]]
+        results[index] = dict(upload_result, index=index)
+    for index in range(len(results)):
+        if results[index] is None:
+            # The client reports every Self Description, a missing result must not fail the whole batch though
+            results[index] = {"index": index, "status": "failed", "error": ERROR_MESSAGE_TEMPLATE.format(
+                error_details=("No upload result has been reported",))}
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    return {"status": "success", "succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+
+def verify_batch(items: list) -> dict:
+    """
+    Verify the Proofs of every item of a batch, see `ProofVerifier.verify_many`.
+    :param items: The items of the batch
+    :return: A report with the number of verified and failed items and the result of every item
+    """
+    results = [None] * len(items)
+    documents = []
+    # Item indexes by the index of their document within the verified documents
+    item_indexes = []
+    for index, item in enumerate(items):
+        if isinstance(item, Exception):
+            error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=item.args)
+        elif not isinstance(item, dict):
+            error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=("Batch item must be a JSON object",))
+        else:
+            item_indexes.append(index)
+            documents.append(item)
+            continue
+        app.logger.warning(error_msg)
+        results[index] = {"index": index, "verified": False, "error": error_msg}
+
+    for item_index, result in zip(item_indexes, proof_verifier.verify_many(documents)):
+        results[item_index] = dict(result, index=item_index, id=items[item_index].get("id"))
+    verified = sum(1 for result in results if result["verified"])
+    return {"status": "success", "verified": verified, "failed": len(results) - verified, "results": results}
+
+
 def check_if_id_is_present(dictionary_to_check):
     if "id" not in dictionary_to_check.keys():
         app.logger.warning("No ID has been specified")
@@ -146,12 +569,71 @@ def check_if_id_is_present(dictionary_to_check):
     return True
 
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def observe_request_latency(response: Response) -> Response:
+    request_start = g.get("request_start")
+    if request_start is not None:
+        # The route pattern instead of the actual path keeps the number of label values bounded
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(request.method, route, str(response.status_code)).observe(
+            time.perf_counter() - request_start)
+    return response
+
+
+def is_background_task_running() -> bool:
+    """
+    :return: Whether the background task of operating mode HYBRID is running, either in the process started by the
+    Gunicorn arbiter or in a thread of the development server
+    """
+    if BACKGROUND_TASK_STATUS_FILE:
+        return os.path.exists(BACKGROUND_TASK_STATUS_FILE)
+    return background_thread is not None and background_thread.is_alive()
+
+
 @app.route("/health")
 def health():
     data = {"status": "success"}
     return data, 200
 
 
+@app.route("/health/ready")
+def ready():
+    if not warm_up_finished.is_set():
+        data = {"status": "starting"}
+        return data, 503
+    if OPERATING_MODE == "HYBRID" and not is_background_task_running():
+        data = {"status": "failed", "error": "The background task processing Claim files isn't running"}
+        return data, 503
+    data = {"status": "success"}
+    return data, 200
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    data, content_type = generate_metrics([claim_files_backlog_collector])
+    return Response(data, content_type=content_type)
+
+
+@app.route("/jsonld-document-loader/statistics", methods=["GET"])
+def get_document_loader_statistics():
+    return document_loader.get_statistics(), 200
+
+
+@app.route("/did-store/statistics", methods=["GET"])
+def get_did_store_statistics():
+    return did_store.get_statistics(), 200
+
+
+@app.route("/verification-keys/statistics", methods=["GET"])
+def get_verification_key_statistics():
+    return verification_key_resolver.get_statistics(), 200
+
+
 # This endpoint is deprecated, use /vp-from-claims instead
 @app.route("/self-description", methods=["POST"])
 def post_self_description():
@@ -164,8 +646,13 @@ def create_vp_from_claims():
         claims: dict = get_json_request_body(request)
         check_if_id_is_present(claims)
         verifiable_presentation = self_description_processor.create_self_description(
-            claims=claims)  # type: ignore
+            claims=claims, idempotency_key=request.headers.get("Idempotency-Key"))  # type: ignore
         return verifiable_presentation, 200
+    except IdempotencyKeyConflictError as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 422
     except Exception as e:
         error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
         app.logger.warning(error_msg)
@@ -179,22 +666,52 @@ def post_self_description_to_federated_catalogue():
     return redirect(location="/federated-catalogue/upload-from-claims", code=308)
 
 
+@app.route("/federated-catalogue/token-statistics", methods=["GET"])
+def get_federated_catalogue_token_statistics():
+    try:
+        return get_federated_catalogue_client().get_token_statistics(), 200
+    except Exception as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 500
+
+
 @app.route("/federated-catalogue/upload-from-claims", methods=["POST"])
 def post_claims_to_federated_catalogue():
     try:
-        federated_catalogue_client = FederatedCatalogueClient(federated_catalogue_url=FEDERATED_CATALOGUE_URL,
-                                                              keycloak_server_url=KEYCLOAK_SERVER_URL,
-                                                              federated_catalogue_user_name=FEDERATED_CATALOGUE_USER_NAME,
-                                                              federated_catalogue_user_password=FEDERATED_CATALOGUE_USER_PASSWORD,
-                                                              keycloak_client_secret=KEYCLOAK_CLIENT_SECRET)
+        federated_catalogue_client = get_federated_catalogue_client()
         claims: dict = get_json_request_body(request)
         check_if_id_is_present(claims)
         self_description = self_description_processor.create_self_description(
-            claims=claims)  # type: ignore
+            claims=claims, idempotency_key=request.headers.get("Idempotency-Key"))  # type: ignore
         federated_catalogue_client.send_to_federated_catalogue(
             self_description)
         data = {"status": "success"}
         return data, 201
+    except IdempotencyKeyConflictError as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 422
+    except Exception as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 500
+
+
+@app.route("/federated-catalogue/upload-from-claims/batch", methods=["POST"])
+def post_claims_batch_to_federated_catalogue():
+    try:
+        federated_catalogue_client = get_federated_catalogue_client()
+        claims_list = get_batch_request_items(request)
+        return upload_batch_to_federated_catalogue(claims_list, federated_catalogue_client), 200
+    except BatchLimitExceededError as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 413
     except Exception as e:
         error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
         app.logger.warning(error_msg)
@@ -223,8 +740,78 @@ def create_vc_from_claims():
         claims: dict = get_json_request_body(request)
         check_if_id_is_present(claims)
         self_description = self_description_processor.create_verifiable_credential(
-            claims=claims)  # type: ignore
+            claims=claims, idempotency_key=request.headers.get("Idempotency-Key"))  # type: ignore
         return self_description, 200
+    except IdempotencyKeyConflictError as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 422
+    except Exception as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 500
+
+
+@app.route("/vc-from-claims/batch", methods=["POST"])
+def create_vcs_from_claims_batch():
+    try:
+        claims_list = get_batch_request_items(request)
+        return stream_batch_results(claims_list, self_description_processor.create_verifiable_credential)
+    except BatchLimitExceededError as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 413
+    except Exception as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 500
+
+
+@app.route("/vp-from-claims/batch", methods=["POST"])
+def create_vps_from_claims_batch():
+    try:
+        claims_list = get_batch_request_items(request)
+        return stream_batch_results(claims_list, self_description_processor.create_self_description)
+    except BatchLimitExceededError as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 413
+    except Exception as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 500
+
+
+@app.route("/verify-proof", methods=["POST"])
+def verify_proof():
+    try:
+        document: dict = get_json_request_body(request)
+        if not isinstance(document, dict):
+            raise TypeError("Request body must be a JSON object")
+        return proof_verifier.verify(document), 200
+    except Exception as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 500
+
+
+@app.route("/verify-proof/batch", methods=["POST"])
+def verify_proof_batch():
+    try:
+        documents = get_batch_request_items(request)
+        return verify_batch(documents), 200
+    except BatchLimitExceededError as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.warning(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 413
     except Exception as e:
         error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
         app.logger.warning(error_msg)
@@ -261,16 +848,65 @@ def create_vp_without_proof_from_vcs():
         return data, 500
 
 
+def encode_cursor(cursor: tuple[int, str]) -> str:
+    created, object_uuid = cursor
+    return base64.urlsafe_b64encode("{}:{}".format(created, object_uuid).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(encoded_cursor: str) -> tuple[int, str]:
+    try:
+        created, object_uuid = base64.urlsafe_b64decode(encoded_cursor.encode("ascii")).decode("utf-8").split(":")
+        return int(created), object_uuid
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def parse_id_documents_query(args) -> tuple[int, tuple[int, str] | None, int | None, str | None]:
+    """
+    Parse the query parameters of `/id-documents`.
+    :param args: The query parameters of the request
+    :return: The page size, the cursor, the creation time (microseconds since epoch) after which documents are listed
+    and the type of the listed documents
+    """
+    limit = min(int(args.get("limit", ID_DOCUMENTS_DEFAULT_PAGE_SIZE)), ID_DOCUMENTS_MAX_PAGE_SIZE)
+    if limit < 1:
+        raise ValueError("Parameter limit must be a positive number")
+    cursor = decode_cursor(args["cursor"]) if "cursor" in args else None
+    created_after = None
+    if "created_after" in args:
+        created_after_date = datetime.fromisoformat(args["created_after"])
+        if created_after_date.tzinfo is None:
+            created_after_date = created_after_date.replace(tzinfo=timezone.utc)
+        created_after = int(created_after_date.timestamp() * 1_000_000)
+    object_type = args.get("type")
+    if object_type not in (None, "VC", "VP"):
+        raise ValueError("Parameter type must be either VC or VP")
+    return limit, cursor, created_after, object_type
+
+
 @app.route("/id-documents", methods=["GET"])
 def get_id_documents():
     try:
-        data = []
-        cnt = 0
-        for uuid in did_store.get_saved_uuids():
-            if cnt < 500:
-                data.append(uuid)
-                cnt += 1
-        return data, 200
+        limit, cursor, created_after, object_type = parse_id_documents_query(request.args)
+    except ValueError as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.info(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 400
+    try:
+        data, next_cursor = did_store.list_saved_uuids(limit=limit, cursor=cursor, created_after=created_after,
+                                                       object_type=object_type)
+        response = app.make_response((data, 200))
+        if next_cursor is not None:
+            query = request.args.to_dict()
+            query.update({"cursor": encode_cursor(next_cursor), "limit": limit})
+            response.headers["Link"] = '<{}>; rel="next"'.format(url_for("get_id_documents", **query))
+            response.headers["X-Next-Cursor"] = query["cursor"]
+        last_created = did_store.get_last_created(object_type)
+        if last_created is not None:
+            response.last_modified = datetime.fromtimestamp(last_created / 1_000_000, tz=timezone.utc)
+        response.add_etag()
+        return response.make_conditional(request)
     except Exception as e:
         error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
         app.logger.warning(error_msg)
@@ -278,11 +914,60 @@ def get_id_documents():
         return data, 500
     
 
+def get_cached_did_document(request_uuid: str, content_encoding: str | None) -> tuple[bytes, str, bool] | None:
+    """
+    Return a stored DID document, preferably from the in-memory cache. Documents still queued by the write-behind are
+    not cached, since they are lost if their batch can't be written.
+    :param request_uuid: UUID of the document
+    :param content_encoding: Content encoding of the requested variant or `None` for the uncompressed document
+    :return: The (possibly compressed) document, its ETag and whether it has been written to the storage or `None` if
+    the requested variant doesn't exist
+    """
+    cache_key = (request_uuid, content_encoding)
+    cached_document = did_document_cache.get(cache_key)
+    if cached_document is not None:
+        return cached_document + (True,)
+    # Checked before reading, a document written in the meantime is then just not cached yet
+    pending = did_store.is_object_pending(request_uuid)
+    document = did_store.get_saved_object(request_uuid).encode("utf-8")
+    etag = hashlib.sha256(document).hexdigest()
+    if content_encoding is not None:
+        document = did_store.get_saved_object_variant(request_uuid, content_encoding)
+        if document is None:
+            return None
+        # Strong ETags must differ between the encodings of a document
+        etag = etag + "-" + content_encoding
+    if not pending:
+        did_document_cache.put(cache_key, (document, etag))
+    return document, etag, not pending
+
+
 @app.route("/id-documents/<request_uuid>/did.json", methods=["GET"])
 def get_id_document_via_uuid(request_uuid):
     try:
-        did_document = did_store.get_saved_object(request_uuid)
-        return did_document, 200
+        cached_document = None
+        if DID_STORAGE_PRECOMPRESS:
+            content_encoding = request.accept_encodings.best_match(["br", "gzip"])
+            if content_encoding is not None:
+                cached_document = get_cached_did_document(request_uuid, content_encoding)
+        if cached_document is None:
+            content_encoding = None
+            cached_document = get_cached_did_document(request_uuid, None)
+        did_document, etag, written = cached_document
+
+        response = Response(did_document, mimetype="application/json")
+        if content_encoding is not None:
+            response.headers["Content-Encoding"] = content_encoding
+        response.headers["Vary"] = "Accept-Encoding"
+        # Queued documents must be revalidated, they disappear if their batch can't be written
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable" if written else "no-cache"
+        response.set_etag(etag)
+        return response.make_conditional(request)
+    except DIDStoreObjectNotFoundError as e:
+        error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
+        app.logger.info(error_msg)
+        data = {"status": "failed", "error": error_msg}
+        return data, 404
     except Exception as e:
         error_msg = ERROR_MESSAGE_TEMPLATE.format(error_details=e.args)
         app.logger.warning(error_msg)
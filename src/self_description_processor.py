@@ -1,12 +1,52 @@
+from __future__ import annotations  # used for linting (type annotations)
+
+import copy
+import json
+import logging
+import re
+from collections.abc import Callable
+from typing import TYPE_CHECKING
 from datetime import datetime, timedelta
 from hashlib import sha256
 
 from jwcrypto import jws
-from jwcrypto.common import base64url_encode
+from jwcrypto.common import base64url_decode, base64url_encode
 from jwcrypto.jwk import JWK
-from pyld import jsonld
 
+from cache import TTLCache
+from canonicalization import CanonicalizationEngine, normalize_with_pyld
 from did_store import DIDStore
+from metrics import JSONLD_NORMALIZATION_SECONDS, SIGNING_CACHE_REQUESTS, SIGNING_SECONDS
+from signature_suites import get_signature_suite
+
+if TYPE_CHECKING:
+    from signing_pool import SigningPool
+
+logger = logging.getLogger()
+
+# Literals used to derive the canonical proof template. Both must be valid `xsd:dateTime` values in the format used for
+# `created`, the second one is only used to verify the template.
+PROOF_TEMPLATE_CREATED_PLACEHOLDER = "1970-01-01T00:00:00Z"
+PROOF_TEMPLATE_CREATED_CHECK_VALUE = "2000-02-29T12:34:56Z"
+PROOF_TEMPLATE_CREATED_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z")
+# Credential signed on startup to warm up the JSON-LD context cache and the signing key, see `warm_up`
+WARM_UP_CREDENTIAL = {
+    "@context": [
+        "https://www.w3.org/2018/credentials/v1",
+        "https://www.w3.org/2018/credentials/examples/v1"],
+    "type": ["VerifiableCredential"],
+    "issuer": "did:web:localhost",
+    "issuanceDate": "2024-01-01T00:00:00Z",
+    "credentialSubject": {"id": "did:web:localhost"}}
+# Algorithms accepted in the protected header of verified Proofs, symmetric algorithms and "none" are rejected
+JWS_VERIFICATION_ALGORITHMS = ("PS256", "PS384", "PS512", "RS256", "RS384", "RS512", "ES256", "ES256K", "ES384",
+                               "ES512", "EdDSA")
+
+
+class IdempotencyKeyConflictError(ValueError):
+    """
+    Raised in case an Idempotency-Key is reused for different Claims.
+    """
 
 
 class SelfDescriptionProcessor:
@@ -14,36 +54,79 @@ class SelfDescriptionProcessor:
     Class can be used to create Self Descriptions from Claims provided as input.
     """
 
-    def __init__(self, credential_issuer: str, signature_jwk: JWK, use_legacy_catalogue_signature: bool, did_store: DIDStore) -> None:
+    def __init__(self, credential_issuer: str, signature_jwk: JWK, use_legacy_catalogue_signature: bool,
+                 did_store: DIDStore | None, document_loader: Callable | None = None,
+                 signing_pool: SigningPool | None = None, signing_cache: TTLCache | None = None,
+                 canonicalization_engine: CanonicalizationEngine | None = None,
+                 verification_method_fragment: str | None = None) -> None:
         """
         :param credential_issuer:
         :param signature_jwk:
+        :param did_store: DID store used to persist created VCs and VPs. Nothing is persisted if not set.
+        :param document_loader: Optional PyLD document loader used to retrieve JSON-LD contexts during normalization.
+        PyLD's default loader is used if not set.
+        :param signing_pool: Optional pool of worker processes used to create Proofs. Proofs are created in the calling
+        thread if not set.
+        :param signing_cache: Optional cache of issued VCs and VPs. If set, the previously issued document is returned
+        for identical Claims or a repeated Idempotency-Key instead of signing again, as long as the entry hasn't expired.
+        :param canonicalization_engine: Optional engine used instead of `pyld.jsonld.normalize` to create the canonical
+        representation of Credentials and Proofs. The output of both is identical. Either way, normalizations of
+        concurrent threads are serialized, see `canonicalization.PYLD_LOCK`.
+        :param verification_method_fragment: Optional fragment of the verification method referenced by the Proofs.
+        By default, it is derived from the type of the signing key (see `signature_suites.py`).
         """
         self.__credential_issuer = credential_issuer
         self.__signature_jwk = signature_jwk
+        self.__signature_suite = get_signature_suite(signature_jwk)
+        self.__verification_method_fragment = (verification_method_fragment
+                                               or self.__signature_suite.verification_method_fragment)
         self.__use_legacy_catalogue_signature = use_legacy_catalogue_signature
-        self.__did_storage_type = did_store.get_type()
+        # The content to be signed must be converted into a canonical JSON representation to ensure that the
+        # verification of the signature on different systems leads to the same results
+        self.__normalization_options = {
+            "algorithm": "URDNA2015",
+            "format": "application/n-quads"}
+        if document_loader is not None:
+            self.__normalization_options["documentLoader"] = document_loader
+        self.__normalize = normalize_with_pyld
+        if canonicalization_engine is not None:
+            self.__normalize = canonicalization_engine.normalize
+        self.__signing_pool = signing_pool
+        self.__signing_cache = signing_cache
+        self.__did_storage_type = did_store.get_type() if did_store is not None else "None"
         if self.__did_storage_type != "None":
             self.__did_store = did_store
+        self.__canonical_proof_template = None
+        if self.__use_legacy_catalogue_signature:
+            self.__canonical_proof_template = self._create_canonical_proof_template()
 
-    def create_self_description(self, claims: dict) -> dict:
+    def create_self_description(self, claims: dict, idempotency_key: str | None = None) -> dict:
         """
         Create a Gaia-X Self Description for given Claims which basically corresponds to a W3C Verifiable Presentation.
         :param claims: JSON-LD based Claims.
+        :param idempotency_key: Optional client-supplied key identifying the request, see `signing_cache`
         :return:
         """
-        verifiable_credential = self.create_verifiable_credential(claims)
+        cache_key, claims_hash, cached_presentation = self._get_cached_document("VP", claims, idempotency_key)
+        if cached_presentation is not None:
+            return cached_presentation
+        verifiable_credential = self.create_verifiable_credential(claims, idempotency_key)
         verifiable_presentation = self.create_verifiable_presentation(
             [verifiable_credential])
+        self._put_cached_document(cache_key, claims_hash, verifiable_presentation)
         return verifiable_presentation
 
-    def create_verifiable_credential(self, claims: dict) -> dict:
+    def create_verifiable_credential(self, claims: dict, idempotency_key: str | None = None) -> dict:
         """
         Create a W3C Verifiable Credential (VC). Relevant information can be found in the related Specification
         (see https://www.w3.org/TR/vc-data-model/).
         :param claims: Set of Claims made about certain subject
+        :param idempotency_key: Optional client-supplied key identifying the request, see `signing_cache`
         :return: A W3C Verifiable Credential
         """
+        cache_key, claims_hash, cached_credential = self._get_cached_document("VC", claims, idempotency_key)
+        if cached_credential is not None:
+            return cached_credential
         issuance_date = datetime.utcnow().replace(microsecond=0)
         expiration_date = issuance_date + timedelta(weeks=24)
 
@@ -65,6 +148,7 @@ class SelfDescriptionProcessor:
         if self.__did_storage_type != "None":
             did_store_object.set_object_content(vc)
             self.__did_store.save_object_into_storage(did_store_object)
+        self._put_cached_document(cache_key, claims_hash, vc)
         return vc
 
     def create_verifiable_presentation(self, verifiable_credentials: list, create_proof: bool=True) -> dict:
@@ -94,15 +178,62 @@ class SelfDescriptionProcessor:
             self.__did_store.save_object_into_storage(did_store_object)
         return presentation
 
+    def _get_cached_document(self, document_type: str, claims: dict,
+                             idempotency_key: str | None) -> tuple[tuple | None, str | None, dict | None]:
+        """
+        Look up a previously issued document in the signing cache. Documents are identified by the issuer, their type
+        and either the Idempotency-Key or the hash of the Claims. The hash is computed over a canonical JSON
+        serialization of the Claims (sorted keys, no whitespace), which is much cheaper than an RDF normalization and
+        sufficient to detect resent Claims.
+        :param document_type: "VC" or "VP"
+        :param claims: The Claims of the request
+        :param idempotency_key: The client-supplied key or `None`
+        :return: The cache key, the hash of the Claims and a copy of the cached document, which is `None` in case of a
+        cache miss. Cache key and hash are `None` if the cache is disabled.
+        """
+        if self.__signing_cache is None:
+            return None, None, None
+        claims_hash = sha256(json.dumps(claims, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+        if idempotency_key is not None:
+            cache_key = (self.__credential_issuer, document_type, "idempotency-key", idempotency_key)
+        else:
+            cache_key = (self.__credential_issuer, document_type, "claims", claims_hash)
+        cached_entry = self.__signing_cache.get(cache_key)
+        if cached_entry is None:
+            SIGNING_CACHE_REQUESTS.labels("miss").inc()
+            return cache_key, claims_hash, None
+        cached_claims_hash, cached_document = cached_entry
+        if cached_claims_hash != claims_hash:
+            raise IdempotencyKeyConflictError("Idempotency-Key has already been used for different Claims")
+        SIGNING_CACHE_REQUESTS.labels("hit").inc()
+        # Callers may modify the returned document, e.g. by embedding it into a VP
+        return cache_key, claims_hash, copy.deepcopy(cached_document)
+
+    def _put_cached_document(self, cache_key: tuple | None, claims_hash: str | None, document: dict) -> None:
+        if cache_key is not None:
+            self.__signing_cache.put(cache_key, (claims_hash, copy.deepcopy(document)))
+
     def add_proof(self, credential: dict) -> dict:
         """
         Add a Proof to given Credential.
         :param credential: The credential where a Proof will be added to
         :return: The Credential including a Proof
         """
+        if self.__signing_pool is not None:
+            return self.__signing_pool.add_proof(credential)
         credential = self._add_proof_jws_2020(credential)
         return credential
 
+    def warm_up(self, context_urls: list[str] | None = None) -> None:
+        """
+        Sign a dummy Credential in the calling process, so the JSON-LD contexts have been loaded and processed and the
+        signing key has been used once before the first request. The Credential is neither persisted nor returned.
+        :param context_urls: Additional JSON-LD contexts to be loaded, e.g. the contexts of the expected Claims
+        """
+        credential = copy.deepcopy(WARM_UP_CREDENTIAL)
+        credential["@context"] += list(context_urls or [])
+        self._add_proof_jws_2020(credential)
+
     def _add_proof_jws_2020(self, credential: dict) -> dict:
         """
         Sign a Credential with `JSON Web Signature 2020`. Relevant information can be found in the related Specification
@@ -110,36 +241,10 @@ class SelfDescriptionProcessor:
         :param credential: The credential where a Proof will be added to
         :return: The Credential including a Proof
         """
-        signing_algorithm = "PS256"
-        proof = {
-            "type": "JsonWebSignature2020",
-            "created": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
-            "verificationMethod": self.__credential_issuer+"#JWK2020-RSA",
-            "proofPurpose": "assertionMethod",
-        }
-        # Important info (legacy catalogue): The @context provided in the proof object is required to successfully perform the
-        # normalization with the used pyld library. This is what the corresponding Java implementation does as well,
-        # but with API version 'v3', instead of 'v3-unstable'. But the 'v3' just returns a HTTP 404. Not sure at the
-        # moment, why it works with the Java implementation. The actual proof fields don't need this context.
-        proof_for_normalization = proof.copy()
-        proof_for_normalization["@context"] = "https://w3id.org/security/v3-unstable"
-        # The content to be signed must be converted into a canonical JSON representation to ensure that the
-        # verification of the signature on different systems leads to the same results
-        normalization_options = {
-            "algorithm": "URDNA2015",
-            "format": "application/n-quads"}
-        canonical_proof = jsonld.normalize(
-            proof_for_normalization, options=normalization_options)
-        canonical_credential = jsonld.normalize(
-            credential, options=normalization_options)
-        hashed_proof = sha256(canonical_proof.encode('utf-8')).hexdigest()
-        hashed_credential = sha256(
-            canonical_credential.encode('utf-8')).hexdigest()
-
-        hashed_signature_payload = hashed_credential
-        if self.__use_legacy_catalogue_signature:
-            hashed_signature_payload = bytes.fromhex(
-                hashed_proof + hashed_credential)
+        signing_algorithm = self.__signature_suite.algorithm
+        proof = self._create_proof(created=datetime.utcnow().replace(microsecond=0).isoformat() + "Z")
+        hashed_signature_payload = self._create_signature_payload(
+            self._hash_credential(credential), proof, self.__use_legacy_catalogue_signature)
 
         # In the following the actual signing process takes place Important info: The following headers must have
         # this exact format (which is defined in the related Specification)
@@ -147,8 +252,9 @@ class SelfDescriptionProcessor:
         jws_token = jws.JWS(hashed_signature_payload)
         #  Important info: Internally, the signer uses the following input for the signing process:
         #  signing_input = encoded_jws_protected_header + b'.' + hashed_signature_payload
-        jws_token.add_signature(
-            self.__signature_jwk, protected=jws_protected_header, alg=signing_algorithm)
+        with SIGNING_SECONDS.labels(signing_algorithm).time():
+            jws_token.add_signature(
+                self.__signature_jwk, protected=jws_protected_header, alg=signing_algorithm)
 
         # According to W3C Json Web Signature for Data Integrity Proof (
         # https://www.w3.org/TR/vc-jws-2020/#proof-representation) for proof type 'JsonWebSignature2020' the jws
@@ -160,3 +266,198 @@ class SelfDescriptionProcessor:
         proof["jws"] = detached_jws_string
         credential["proof"] = proof
         return credential
+
+    def _hash_credential(self, credential: dict) -> str:
+        """
+        :param credential: The Credential (without Proof) to be hashed
+        :return: The hex encoded SHA-256 hash of the canonical representation of the Credential
+        """
+        with JSONLD_NORMALIZATION_SECONDS.labels("credential").time():
+            canonical_credential = self.__normalize(
+                credential, options=self.__normalization_options)
+        return sha256(canonical_credential.encode('utf-8')).hexdigest()
+
+    def _create_signature_payload(self, hashed_credential: str, proof: dict, legacy: bool) -> str | bytes:
+        """
+        Create the payload of a `JSON Web Signature 2020` Proof. By default, the payload is the hashed Credential. The
+        legacy catalogue expects the concatenated hashes of the Proof and the Credential instead.
+        :param hashed_credential: The hashed Credential, see `_hash_credential`
+        :param proof: The Proof (without signature)
+        :param legacy: Whether the payload of the legacy catalogue is created
+        :return: The payload to be signed
+        """
+        if not legacy:
+            return hashed_credential
+        canonical_proof = self._normalize_proof(proof)
+        hashed_proof = sha256(canonical_proof.encode('utf-8')).hexdigest()
+        return bytes.fromhex(hashed_proof + hashed_credential)
+
+    def verify_proofs(self, document: dict, verification_keys: dict[str, JWK]) -> dict:
+        """
+        Verify the `JSON Web Signature 2020` Proof of a VC or VP. The Proofs of the VCs embedded into a VP are verified
+        as well. Both payloads (see `_create_signature_payload`) are accepted, starting with the configured one.
+        :param document: The VC or VP
+        :param verification_keys: Public keys by the ID of their verification method. Proofs referring to another
+        verification method fail.
+        :return: The overall result and the result of every Proof
+        """
+        proofs = [self._verify_proof(document, "$", verification_keys)]
+        credentials = document.get("verifiableCredential", [])
+        if isinstance(credentials, dict):
+            credentials = [credentials]
+        for index, credential in enumerate(credentials):
+            path = "$.verifiableCredential[{index}]".format(index=index)
+            if isinstance(credential, dict):
+                proofs.append(self._verify_proof(credential, path, verification_keys))
+            else:
+                proofs.append({"path": path, "verificationMethod": None, "verified": False, "payload": None,
+                               "error": "Embedded credential must be a JSON object"})
+        return {"verified": all(proof["verified"] for proof in proofs), "proofs": proofs}
+
+    def _verify_proof(self, credential: dict, path: str, verification_keys: dict[str, JWK]) -> dict:
+        """
+        Verify the Proof of a single Credential, see `verify_proofs`.
+        :param credential: The Credential including its Proof
+        :param path: Location of the Credential within the verified document, only used for the result
+        :param verification_keys: Public keys by the ID of their verification method
+        :return: The result of the verification
+        """
+        result = {"path": path, "verificationMethod": None, "verified": False, "payload": None, "error": None}
+        try:
+            proof = credential.get("proof")
+            if not isinstance(proof, dict):
+                raise ValueError("Credential must contain a single Proof")
+            if proof.get("type") != "JsonWebSignature2020":
+                raise ValueError("Unsupported Proof type [type: {type}]".format(type=proof.get("type")))
+            verification_method = proof.get("verificationMethod")
+            result["verificationMethod"] = verification_method
+            verification_key = verification_keys.get(verification_method)
+            if verification_key is None:
+                raise ValueError("Verification method could not be resolved [verification_method: {method}]"
+                                 .format(method=verification_method))
+            protected_header, signature = parse_detached_jws(proof.get("jws"))
+
+            hashed_credential = self._hash_credential({key: value for key, value in credential.items()
+                                                       if key != "proof"})
+            proof_without_signature = {key: value for key, value in proof.items() if key != "jws"}
+            for legacy in (self.__use_legacy_catalogue_signature, not self.__use_legacy_catalogue_signature):
+                payload = self._create_signature_payload(hashed_credential, proof_without_signature, legacy)
+                if verify_detached_jws(verification_key, protected_header, payload, signature):
+                    result["verified"] = True
+                    result["payload"] = "legacy" if legacy else "standard"
+                    return result
+            raise ValueError("Signature doesn't match the Credential")
+        except Exception as e:
+            result["error"] = str(e)
+            return result
+
+    def get_verification_method(self) -> str:
+        """
+        :return: ID of the verification method referenced by the created Proofs
+        """
+        return self.__credential_issuer + "#" + self.__verification_method_fragment
+
+    def _create_proof(self, created: str) -> dict:
+        """
+        Create the Proof fields (without signature) for a `JSON Web Signature 2020` Proof.
+        :param created: Creation date of the Proof
+        :return: The Proof
+        """
+        return {
+            "type": "JsonWebSignature2020",
+            "created": created,
+            "verificationMethod": self.get_verification_method(),
+            "proofPurpose": "assertionMethod",
+        }
+
+    def _normalize_proof(self, proof: dict) -> str:
+        """
+        Convert a Proof into its canonical N-Quads representation. If available, the canonical proof template is used
+        instead of a full normalization.
+        :param proof: The Proof (without signature) to be normalized
+        :return: The canonical representation of the Proof
+        """
+        if self.__canonical_proof_template is not None and self._matches_proof_template(proof):
+            return self.__canonical_proof_template.replace(
+                '"%s"' % PROOF_TEMPLATE_CREATED_PLACEHOLDER, '"%s"' % proof["created"])
+        # Important info (legacy catalogue): The @context provided in the proof object is required to successfully perform the
+        # normalization with the used pyld library. This is what the corresponding Java implementation does as well,
+        # but with API version 'v3', instead of 'v3-unstable'. But the 'v3' just returns a HTTP 404. Not sure at the
+        # moment, why it works with the Java implementation. The actual proof fields don't need this context.
+        proof_for_normalization = proof.copy()
+        proof_for_normalization["@context"] = "https://w3id.org/security/v3-unstable"
+        with JSONLD_NORMALIZATION_SECONDS.labels("proof").time():
+            return self.__normalize(
+                proof_for_normalization, options=self.__normalization_options)
+
+    def _matches_proof_template(self, proof: dict) -> bool:
+        """
+        Proofs of verified documents may have been created by other issuers, so the template must only be used for
+        Proofs that only differ from the own ones in a well-formed creation date.
+        :param proof: The Proof (without signature)
+        :return: Whether the Proof can be normalized by means of the template
+        """
+        created = proof.get("created")
+        return (isinstance(created, str) and PROOF_TEMPLATE_CREATED_PATTERN.fullmatch(created) is not None
+                and proof == self._create_proof(created=created))
+
+    def _create_canonical_proof_template(self) -> str | None:
+        """
+        Precompute the canonical representation of the Proof. Apart from `created`, all fields of the Proof are fixed
+        and the Proof contains a single blank node, so the canonical N-Quads only differ in the `created` literal,
+        which can be substituted for every signature instead of normalizing the Proof again.
+        :return: The canonical Proof containing `PROOF_TEMPLATE_CREATED_PLACEHOLDER` as creation date or `None` if
+        the template could not be created
+        """
+        try:
+            template = self._normalize_proof(self._create_proof(created=PROOF_TEMPLATE_CREATED_PLACEHOLDER))
+            # Ensure the substitution leads to exactly the same result as the normalization
+            expected = self._normalize_proof(self._create_proof(created=PROOF_TEMPLATE_CREATED_CHECK_VALUE))
+            actual = template.replace('"%s"' % PROOF_TEMPLATE_CREATED_PLACEHOLDER,
+                                      '"%s"' % PROOF_TEMPLATE_CREATED_CHECK_VALUE)
+            if template.count('"%s"' % PROOF_TEMPLATE_CREATED_PLACEHOLDER) != 1 or actual != expected:
+                logger.warning("Canonical proof template doesn't match the normalized proof, template is disabled")
+                return None
+            return template
+        except Exception as e:
+            logger.warning("Canonical proof template could not be created, template is disabled [error: {error}]"
+                           .format(error=e.args))
+            return None
+
+
+def parse_detached_jws(detached_jws: str) -> tuple[str, bytes]:
+    """
+    Split a detached JWS (`<protected header>..<signature>`) with unencoded payload (RFC 7797) into its parts.
+    :param detached_jws: The `jws` property of a Proof
+    :return: The decoded protected header and the signature
+    """
+    if not isinstance(detached_jws, str) or detached_jws.count(".") != 2:
+        raise ValueError("Proof must contain a detached JWS")
+    encoded_header, payload, encoded_signature = detached_jws.split(".")
+    if payload:
+        raise ValueError("JWS must not contain the payload")
+    protected_header = base64url_decode(encoded_header).decode("utf-8")
+    header = json.loads(protected_header)
+    if not isinstance(header, dict) or header.get("b64") is not False or "b64" not in header.get("crit", []):
+        raise ValueError("JWS must use an unencoded payload")
+    if header.get("alg") not in JWS_VERIFICATION_ALGORITHMS:
+        raise ValueError("Unsupported JWS algorithm [alg: {alg}]".format(alg=header.get("alg")))
+    # The signing input is built from the re-encoded header, so it must match the transmitted one
+    if base64url_encode(protected_header.encode("utf-8")) != encoded_header:
+        raise ValueError("JWS header is not properly encoded")
+    return protected_header, base64url_decode(encoded_signature)
+
+
+def verify_detached_jws(verification_key: JWK, protected_header: str, payload: str | bytes, signature: bytes) -> bool:
+    """
+    :param verification_key: The public key of the signer
+    :param protected_header: The decoded protected header, see `parse_detached_jws`
+    :param payload: The detached payload
+    :param signature: The signature
+    :return: Whether the signature is valid for the payload
+    """
+    algorithm = json.loads(protected_header)["alg"]
+    try:
+        return jws.JWSCore(algorithm, verification_key, protected_header, payload, algs=[algorithm]).verify(signature)
+    except jws.InvalidJWSSignature:
+        return False
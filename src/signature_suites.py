@@ -0,0 +1,74 @@
+"""
+Signature suites of `JSON Web Signature 2020` Proofs. The JWS algorithm and the fragment of the verification method are
+derived from the type of the signing key, so faster keys (Ed25519, P-256) can be used instead of RSA by replacing the
+PEM file. Further key types can be supported by adding them to `SIGNATURE_SUITES`.
+"""
+from __future__ import annotations  # used for linting (type annotations)
+
+from jwcrypto.jwk import JWK
+
+
+class SignatureSuite:
+    """
+    Class describes how Proofs are signed with a certain type of key.
+    """
+
+    def __init__(self, algorithm: str, verification_method_fragment: str) -> None:
+        """
+
+        :param algorithm: The JWS algorithm used in the protected header
+        :param verification_method_fragment: Fragment appended to the credential issuer to reference the key
+        """
+        self.algorithm = algorithm
+        self.verification_method_fragment = verification_method_fragment
+
+    def __repr__(self) -> str:
+        return "SignatureSuite(algorithm={}, verification_method_fragment={})".format(
+            self.algorithm, self.verification_method_fragment)
+
+
+# Suites by key type and curve. RSA keys keep the fragment used before the suites became configurable, so existing
+# Proofs still reference the right verification method.
+SIGNATURE_SUITES = {
+    ("RSA", None): SignatureSuite(algorithm="PS256", verification_method_fragment="JWK2020-RSA"),
+    ("EC", "P-256"): SignatureSuite(algorithm="ES256", verification_method_fragment="JWK2020-P256"),
+    ("OKP", "Ed25519"): SignatureSuite(algorithm="EdDSA", verification_method_fragment="JWK2020-Ed25519"),
+}
+
+
+def get_signature_suite(signature_jwk: JWK) -> SignatureSuite:
+    """
+    :param signature_jwk: The signing key
+    :return: The suite matching the type of the key
+    """
+    key_type = signature_jwk.get("kty")
+    curve = signature_jwk.get("crv")
+    signature_suite = SIGNATURE_SUITES.get((key_type, curve))
+    if signature_suite is None:
+        raise ValueError("Signing key is not supported [key_type: {key_type}, curve: {curve}]"
+                         .format(key_type=key_type, curve=curve))
+    return signature_suite
+
+
+def read_signing_keys(pem_paths: str) -> list[tuple[JWK, str]]:
+    """
+    Read the signing keys of the credential issuer. Several keys can be given to rotate keys: the first one signs new
+    Proofs, the others are only used to verify Proofs that have been created with them.
+    :param pem_paths: Comma-separated paths of PEM files. The fragment of the verification method is derived from the
+    key type unless it is appended to the path, e.g. `new-key.pem#JWK2020-RSA-2,old-key.pem`.
+    :return: The keys and the fragments of their verification methods, starting with the signing key
+    """
+    signing_keys = []
+    for pem_path in pem_paths.split(","):
+        pem_path, _, verification_method_fragment = pem_path.strip().partition("#")
+        with open(pem_path, "rb") as key_file:
+            signature_jwk = JWK.from_pem(key_file.read())
+        if not verification_method_fragment:
+            verification_method_fragment = get_signature_suite(signature_jwk).verification_method_fragment
+        signing_keys.append((signature_jwk, verification_method_fragment))
+    verification_method_fragments = [fragment for _, fragment in signing_keys]
+    for fragment in verification_method_fragments:
+        if verification_method_fragments.count(fragment) > 1:
+            raise ValueError("Signing keys must reference different verification methods, append a fragment to the "
+                             "path of the key [fragment: {fragment}]".format(fragment=fragment))
+    return signing_keys
@@ -0,0 +1,151 @@
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from jwcrypto.jwk import JWK
+
+from canonicalization import CanonicalizationEngine
+from document_loader import CachingDocumentLoader
+from self_description_processor import SelfDescriptionProcessor
+
+logger = logging.getLogger()
+
+# Time a worker holds a warm-up task, so the tasks of `SigningPool.warm_up` are spread across all workers
+WARM_UP_TASK_DURATION_SEC = 0.05
+
+# Variable will be initialized in each worker process by `_init_worker`
+_worker_processor: SelfDescriptionProcessor | None = None
+
+
+def _init_worker(signature_jwk_json: str, processor_kwargs: dict, document_loader_kwargs: dict,
+                 canonicalization_kwargs: dict | None, warm_up_context_urls: list[str]):
+    """
+    Initialize a worker process of the signing pool.
+    :param signature_jwk_json: The private signing key exported as JSON
+    :param processor_kwargs: Arguments used to create the `SelfDescriptionProcessor` of the worker
+    :param document_loader_kwargs: Arguments used to create the `CachingDocumentLoader` of the worker
+    :param canonicalization_kwargs: Arguments used to create the `CanonicalizationEngine` of the worker, PyLD is used
+    if not set
+    :param warm_up_context_urls: Additional JSON-LD contexts loaded by the warm-up of the worker
+    """
+    global _worker_processor
+    canonicalization_engine = None
+    if canonicalization_kwargs is not None:
+        canonicalization_engine = CanonicalizationEngine(**canonicalization_kwargs)
+    _worker_processor = SelfDescriptionProcessor(signature_jwk=JWK.from_json(signature_jwk_json),
+                                                 did_store=None,
+                                                 document_loader=CachingDocumentLoader(**document_loader_kwargs),
+                                                 canonicalization_engine=canonicalization_engine,
+                                                 **processor_kwargs)
+    try:
+        _worker_processor.warm_up(warm_up_context_urls)
+    except Exception as e:
+        logger.warning("Warm-up of signing worker failed [error: {error}]".format(error=e.args))
+
+
+def _add_proof(credential: dict) -> dict:
+    return _worker_processor.add_proof(credential)
+
+
+def _get_worker_pid() -> int:
+    time.sleep(WARM_UP_TASK_DURATION_SEC)
+    return os.getpid()
+
+
+def _verify_proofs(document: dict, verification_keys_json: dict[str, str]) -> dict:
+    verification_keys = {verification_method: JWK.from_json(key_json)
+                         for verification_method, key_json in verification_keys_json.items()}
+    return _worker_processor.verify_proofs(document, verification_keys)
+
+
+class SigningPool:
+    """
+    Class can be used to create Proofs in a pool of worker processes. Normalization and signing are CPU-bound and
+    hold the GIL, so running them in separate processes allows to use all available cores.
+    """
+
+    def __init__(self, pool_size: int, queue_size: int, queue_timeout_sec: float, signature_jwk: JWK,
+                 processor_kwargs: dict, document_loader_kwargs: dict, canonicalization_kwargs: dict | None = None,
+                 warm_up_context_urls: list[str] | None = None):
+        """
+
+        :param pool_size: Number of worker processes
+        :param queue_size: Maximum number of Proofs waiting for a free worker. Further requests are blocked until a
+        slot becomes available.
+        :param queue_timeout_sec: Maximum time to wait for a slot in the queue
+        :param signature_jwk: The private key used to sign the Proofs
+        :param processor_kwargs: Arguments used to create the `SelfDescriptionProcessor` of each worker (except for the
+        key, the DID store and the document loader)
+        :param document_loader_kwargs: Arguments used to create the `CachingDocumentLoader` of each worker
+        :param canonicalization_kwargs: Arguments used to create the `CanonicalizationEngine` of each worker, PyLD is
+        used if not set
+        :param warm_up_context_urls: Additional JSON-LD contexts loaded by each worker on startup
+        """
+        self.__pool_size = pool_size
+        self.__queue_timeout_sec = queue_timeout_sec
+        self.__slots = threading.BoundedSemaphore(pool_size + queue_size)
+        self.__executor = ProcessPoolExecutor(max_workers=pool_size,
+                                              initializer=_init_worker,
+                                              initargs=(signature_jwk.export_private(), processor_kwargs,
+                                                        document_loader_kwargs, canonicalization_kwargs,
+                                                        list(warm_up_context_urls or [])))
+        logger.info("Signing pool initialized [pool_size: {pool_size}, queue_size: {queue_size}]"
+                    .format(pool_size=pool_size, queue_size=queue_size))
+
+    def add_proof(self, credential: dict) -> dict:
+        """
+        Add a Proof to given Credential using one of the worker processes.
+        :param credential: The credential where a Proof will be added to
+        :return: The Credential including a Proof
+        """
+        if not self.__slots.acquire(timeout=self.__queue_timeout_sec):
+            raise RuntimeError("Signing queue is full")
+        try:
+            return self.__executor.submit(_add_proof, credential).result()
+        finally:
+            self.__slots.release()
+
+    def verify_proofs(self, documents: list[dict], verification_keys: dict[str, JWK]) -> list[dict]:
+        """
+        Verify the Proofs of several documents using all worker processes, see
+        `SelfDescriptionProcessor.verify_proofs`. The documents occupy a single slot of the queue.
+        :param documents: The VCs or VPs to be verified
+        :param verification_keys: Public keys by the ID of their verification method
+        :return: The results in the order of the documents
+        """
+        verification_keys_json = {verification_method: key.export_public()
+                                  for verification_method, key in verification_keys.items()}
+        if not self.__slots.acquire(timeout=self.__queue_timeout_sec):
+            raise RuntimeError("Signing queue is full")
+        try:
+            # Chunks reduce the overhead of passing the keys and results between the processes
+            chunk_size = max(1, len(documents) // (self.__pool_size * 4))
+            return list(self.__executor.map(functools.partial(_verify_proofs,
+                                                              verification_keys_json=verification_keys_json),
+                                            documents, chunksize=chunk_size))
+        finally:
+            self.__slots.release()
+
+    def warm_up(self, timeout_sec: float) -> int:
+        """
+        Start the worker processes and wait until they have been initialized. The executor only starts workers when
+        tasks are submitted, so otherwise the first requests after startup would wait for the warm-up of the workers.
+        :param timeout_sec: Maximum time to wait for all workers
+        :return: The number of workers that have been initialized
+        """
+        deadline = time.monotonic() + timeout_sec
+        worker_pids = set()
+        while len(worker_pids) < self.__pool_size and time.monotonic() < deadline:
+            # Workers only take tasks after their initializer has finished
+            futures = [self.__executor.submit(_get_worker_pid) for _ in range(self.__pool_size)]
+            worker_pids.update(future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures)
+        return len(worker_pids)
+
+    def shutdown(self):
+        """
+        Wait for pending Proofs and stop the worker processes.
+        """
+        self.__executor.shutdown(wait=True)
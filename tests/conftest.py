@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+from jwcrypto.jwk import JWK
+
+# The modules of the application are imported like in `src/self_description_creator.py`
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+sys.path.insert(0, SRC_DIR)
+
+CREDENTIAL_ISSUER = "did:web:example.org"
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """
+    The module `self_description_creator` configured with a local did store and a generated signing key. The
+    configuration is read from environment variables on import, so the module is only imported once per session.
+    Tests change its settings with `monkeypatch.setattr`.
+    """
+    work_dir = tmp_path_factory.mktemp("app")
+    pem_path = work_dir / "signing-key.pem"
+    pem_path.write_bytes(JWK.generate(kty="RSA", size=2048).export_to_pem(private_key=True, password=None))
+    os.makedirs(work_dir / "did")
+    os.makedirs(work_dir / "claim-files")
+    os.environ.update({"CREDENTIAL_ISSUER": CREDENTIAL_ISSUER,
+                       "CREDENTIAL_ISSUER_PRIVATE_KEY_PEM_PATH": str(pem_path),
+                       "VP_VC_ID_PREFIX": "https://example.org",
+                       "DID_STORAGE_TYPE": "local",
+                       "DID_STORAGE_PATH": str(work_dir / "did"),
+                       "CLAIM_FILES_DIR": str(work_dir / "claim-files"),
+                       "JSONLD_OFFLINE_MODE": "true",
+                       "STARTUP_WARM_UP_ENABLED": "false",
+                       "OPERATING_MODE": "API"})
+    # The OpenAPI specification is loaded relative to the working directory
+    os.chdir(ROOT_DIR)
+    import self_description_creator
+    return self_description_creator
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
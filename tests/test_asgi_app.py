@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture
+def asgi_app(app_module):
+    import asgi_app
+    return asgi_app
+
+
+def test_signing_executor_has_a_thread_per_signing_worker(app_module, asgi_app, monkeypatch):
+    monkeypatch.setattr(app_module, "ASYNC_SIGNING_THREADS", 1)
+    monkeypatch.setattr(app_module, "SIGNING_POOL_SIZE", 4)
+    assert asgi_app.create_signing_executor()._max_workers == 1
+
+    # The pool isn't used by the executor itself, only its presence matters
+    monkeypatch.setattr(app_module, "signing_pool", object())
+    assert asgi_app.create_signing_executor()._max_workers == 4
+    monkeypatch.setattr(app_module, "ASYNC_SIGNING_THREADS", 8)
+    assert asgi_app.create_signing_executor()._max_workers == 8
@@ -0,0 +1,9 @@
+import pytest
+
+from async_federated_catalogue_client import get_keycloak_token_url
+
+
+@pytest.mark.parametrize("keycloak_server_url", ["http://keycloak:8080", "http://keycloak:8080/"])
+def test_token_url_is_independent_of_trailing_slash(keycloak_server_url):
+    assert get_keycloak_token_url(keycloak_server_url) == \
+        "http://keycloak:8080/realms/gaia-x/protocol/openid-connect/token"
@@ -0,0 +1,162 @@
+import copy
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pyld import jsonld
+from pyld.jsonld import JsonLdProcessor
+
+from canonicalization import canonicalize_dataset, CanonicalizationEngine, normalize_with_pyld
+from document_loader import CachingDocumentLoader, DEFAULT_CONTEXT_BUNDLE_DIR
+
+CREDENTIAL_CONTEXTS = ["https://www.w3.org/2018/credentials/v1", "https://www.w3.org/2018/credentials/examples/v1"]
+EXAMPLE_CONTEXT = {"@version": 1.1, "ex": "https://example.org/ontology/",
+                   "xsd": "http://www.w3.org/2001/XMLSchema#"}
+VERIFIABLE_CREDENTIAL = {
+    "@context": CREDENTIAL_CONTEXTS,
+    "id": "did:web:example.org:id-documents:1",
+    "type": ["VerifiableCredential"],
+    "issuer": "did:web:example.org",
+    "issuanceDate": "2024-01-01T00:00:00Z",
+    "expirationDate": "2024-06-17T00:00:00Z",
+    "credentialSubject": {
+        "@context": EXAMPLE_CONTEXT,
+        "id": "https://example.org/offering/1",
+        "@type": "ex:ServiceOffering",
+        "ex:name": {"@value": "Offering", "@language": "en"},
+        "ex:price": {"@type": "xsd:decimal", "@value": "12.5"},
+        "ex:hasPart": [{"ex:name": "Part 1"}, {"ex:name": "Part 2"}]}}
+VERIFIABLE_PRESENTATION = {
+    "@context": ["https://www.w3.org/2018/credentials/v1"],
+    "type": ["VerifiablePresentation"],
+    "holder": "did:web:example.org",
+    "verifiableCredential": [dict(VERIFIABLE_CREDENTIAL, proof={
+        "type": "JsonWebSignature2020",
+        "created": "2024-01-01T00:00:00Z",
+        "verificationMethod": "did:web:example.org#JWK2020-RSA",
+        "proofPurpose": "assertionMethod",
+        "jws": "eyJhbGciOiJQUzI1NiJ9..c2lnbmF0dXJl"})]}
+PROOF = {"@context": "https://w3id.org/security/v3-unstable",
+         "type": "JsonWebSignature2020",
+         "created": "2024-01-01T00:00:00Z",
+         "verificationMethod": "did:web:example.org#JWK2020-RSA",
+         "proofPurpose": "assertionMethod"}
+# Type-scoped contexts don't propagate into nested nodes, so `name` of the nested node falls back to `ex:name`
+TYPE_SCOPED_CONTEXT_DOCUMENT = {
+    "@context": dict(EXAMPLE_CONTEXT, name="ex:name", Person={"@id": "ex:Person",
+                                                              "@context": {"name": "ex:personName"}}),
+    "@id": "https://example.org/person/1",
+    "@type": "Person",
+    "name": "Alice",
+    "ex:knows": {"name": "Bob", "ex:knows": {"@type": "Person", "name": "Carol"}}}
+# Property-scoped contexts propagate, unless they set `@propagate: false`
+PROPERTY_SCOPED_CONTEXT_DOCUMENT = {
+    "@context": dict(EXAMPLE_CONTEXT, city="ex:city",
+                     address={"@id": "ex:address", "@context": {"city": "ex:addressCity"}},
+                     office={"@id": "ex:office", "@context": {"@propagate": False, "city": "ex:officeCity"}}),
+    "city": "Berlin",
+    "address": {"city": "Munich", "ex:next": {"city": "Hamburg"}},
+    "office": {"city": "Stuttgart", "ex:next": {"city": "Cologne"}}}
+PROPAGATE_FALSE_DOCUMENT = {
+    "@context": dict(EXAMPLE_CONTEXT, label="ex:label"),
+    "label": "outer",
+    "ex:child": {"@context": {"@propagate": False, "label": "ex:childLabel"},
+                 "label": "child",
+                 "ex:grandChild": {"label": "grand child"}},
+    "ex:other": {"@type": "ex:Thing", "label": "other"}}
+# Blank nodes with the same first degree hash are labeled by PyLD
+BLANK_NODE_TIES_DOCUMENT = {"@context": EXAMPLE_CONTEXT,
+                            "ex:items": [{"ex:value": "same"}, {"ex:value": "same"}, {"ex:link": {"ex:value": "x"}}]}
+# Cases in the layout of the W3C RDF Dataset Canonicalization test suite, see `benchmarks/rdf_canon_conformance.py`
+RDF_CANON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rdf_canon")
+with open(os.path.join(RDF_CANON_DIR, "manifest.jsonld"), encoding="utf-8") as manifest_file:
+    RDF_CANON_TESTS = json.load(manifest_file)["entries"]
+DOCUMENTS = {"verifiable_credential": VERIFIABLE_CREDENTIAL,
+             "verifiable_presentation": VERIFIABLE_PRESENTATION,
+             "proof": PROOF,
+             "type_scoped_context": TYPE_SCOPED_CONTEXT_DOCUMENT,
+             "property_scoped_context": PROPERTY_SCOPED_CONTEXT_DOCUMENT,
+             "propagate_false": PROPAGATE_FALSE_DOCUMENT,
+             "blank_node_ties": BLANK_NODE_TIES_DOCUMENT}
+
+
+@pytest.fixture(scope="module")
+def normalization_options():
+    document_loader = CachingDocumentLoader(bundle_dir=DEFAULT_CONTEXT_BUNDLE_DIR, cache_size=10, cache_ttl_sec=0,
+                                            offline=True)
+    return {"algorithm": "URDNA2015", "format": "application/n-quads", "documentLoader": document_loader}
+
+
+def create_engine() -> CanonicalizationEngine:
+    return CanonicalizationEngine(context_cache_size=100, context_cache_ttl_sec=0)
+
+
+def get_context_cache_hits(engine: CanonicalizationEngine) -> int:
+    return engine._CanonicalizationEngine__context_cache.get_statistics()["hits"]
+
+
+@pytest.mark.parametrize("name", list(DOCUMENTS))
+def test_normalize_matches_pyld(normalization_options, name):
+    document = DOCUMENTS[name]
+    expected = jsonld.normalize(copy.deepcopy(document), options=normalization_options)
+    engine = create_engine()
+
+    assert engine.normalize(copy.deepcopy(document), options=normalization_options) == expected
+    # The second run uses the processed contexts of the first one
+    cache_hits = get_context_cache_hits(engine)
+    assert engine.normalize(copy.deepcopy(document), options=normalization_options) == expected
+    assert get_context_cache_hits(engine) > cache_hits
+
+
+def test_normalize_matches_pyld_with_contexts_shared_across_documents(normalization_options):
+    expected = {name: jsonld.normalize(copy.deepcopy(document), options=normalization_options)
+                for name, document in DOCUMENTS.items()}
+    engine = create_engine()
+
+    for _ in range(2):
+        for name, document in DOCUMENTS.items():
+            assert engine.normalize(copy.deepcopy(document), options=normalization_options) == expected[name]
+
+
+def test_normalize_matches_pyld_with_contexts_shared_across_threads(normalization_options):
+    expected = {name: jsonld.normalize(copy.deepcopy(document), options=normalization_options)
+                for name, document in DOCUMENTS.items()}
+    engine = create_engine()
+    # PyLD and the engine share PyLD's caches of resolved contexts, so both are used at the same time
+    normalize_functions = [engine.normalize, normalize_with_pyld]
+    tasks = [(name, normalize) for name in DOCUMENTS for normalize in normalize_functions] * 200
+
+    switch_interval = sys.getswitchinterval()
+    # Frequent thread switches make races on the caches likely
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(
+                lambda task: task[1](copy.deepcopy(DOCUMENTS[task[0]]), options=normalization_options), tasks))
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    for (name, _), result in zip(tasks, results):
+        assert result == expected[name]
+
+
+def read_rdf_canon_file(path: str) -> str:
+    with open(os.path.join(RDF_CANON_DIR, path), encoding="utf-8") as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("test", RDF_CANON_TESTS, ids=[test["id"].lstrip("#") for test in RDF_CANON_TESTS])
+def test_normalize_conforms_to_rdf_canon_test_suite(test):
+    nquads = read_rdf_canon_file(test["action"])
+    options = {"algorithm": "URDNA2015", "format": "application/n-quads", "inputFormat": "application/n-quads"}
+
+    assert create_engine().normalize(nquads, options=options) == read_rdf_canon_file(test["result"])
+
+
+def test_rdf_canon_test_suite_covers_both_labelings():
+    datasets = [JsonLdProcessor.parse_nquads(read_rdf_canon_file(test["action"])) for test in RDF_CANON_TESTS]
+    # Blank node ties are labeled by PyLD, all other datasets by their first degree hashes
+    labeled_by_pyld = [canonicalize_dataset(dataset) is None for dataset in datasets]
+    assert any(labeled_by_pyld) and not all(labeled_by_pyld)
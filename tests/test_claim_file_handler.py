@@ -0,0 +1,184 @@
+import json
+import os
+
+import pytest
+
+import claim_file_handler
+from claim_file_handler import _BulkClaimFileProgress, ClaimFileHandler
+from claim_file_leases import ClaimFileLeases
+from claim_file_reader import detect_claim_file_format, FILE_FORMAT_ARRAY, FILE_FORMAT_NDJSON, iter_claim_records
+
+RECORD_COUNT = 12
+# Records rejected by the processor, see `SelfDescriptionProcessorStub`
+FAILING_RECORDS = {4, 9}
+
+
+def create_claims(number: int) -> dict:
+    claims = {"id": "https://example.org/offering/{}".format(number)}
+    if number in FAILING_RECORDS:
+        claims["fail"] = True
+    return claims
+
+
+class SelfDescriptionProcessorStub:
+    def create_self_description(self, claims: dict) -> dict:
+        if claims.get("fail"):
+            raise ValueError("Claims are invalid")
+        return {"id": claims["id"]}
+
+
+class FederatedCatalogueClientStub:
+    """
+    Accepts Self Descriptions in groups and reports the results of each group in reverse order, like concurrent
+    uploads completing out of order. Optionally, the connection is lost after a number of uploads, in which case the
+    results of the current group are never reported.
+    """
+
+    def __init__(self, group_size: int = 3, fail_after: int | None = None):
+        self.group_size = group_size
+        self.fail_after = fail_after
+        self.uploaded = []
+
+    def send_many_to_federated_catalogue(self, self_descriptions, on_result, max_in_flight=None, max_queued=0):
+        pending_results = []
+        for index, self_description in enumerate(self_descriptions):
+            if self.fail_after is not None and len(self.uploaded) >= self.fail_after:
+                raise ConnectionError("Federated Catalogue isn't reachable")
+            self.uploaded.append(self_description["id"])
+            pending_results.append({"index": index, "status": "success"})
+            if len(pending_results) == self.group_size:
+                for result in reversed(pending_results):
+                    on_result(result)
+                pending_results = []
+        for result in reversed(pending_results):
+            on_result(result)
+
+
+def write_bulk_file(claim_files_dir, file_format: str) -> str:
+    records = [json.dumps(create_claims(number)) for number in range(RECORD_COUNT)]
+    if file_format == FILE_FORMAT_NDJSON:
+        path = claim_files_dir / "records.ndjson"
+        # A malformed record is rejected without stopping the file
+        path.write_text("\n".join(records[:6] + ["{not json"] + records[6:]) + "\n")
+    else:
+        path = claim_files_dir / "records.json"
+        path.write_text("[\n" + ",\n".join(records) + "\n]")
+    return str(path)
+
+
+def create_handler(claim_files_dir, catalogue_client: FederatedCatalogueClientStub,
+                   claim_file_leases: ClaimFileLeases | None = None) -> ClaimFileHandler:
+    return ClaimFileHandler(claim_files_dir=str(claim_files_dir), claim_files_cleanup_max_file_age_days=1,
+                            self_description_processor=SelfDescriptionProcessorStub(),
+                            federated_catalogue_client=catalogue_client, upload_concurrency=3, checkpoint_interval=2,
+                            claim_file_leases=claim_file_leases)
+
+
+def read_rejects(claim_files_dir, file_name: str) -> list[dict]:
+    with open(claim_files_dir / "failed" / (file_name + ".rejected.ndjson")) as reject_file:
+        return [json.loads(line) for line in reject_file]
+
+
+@pytest.mark.parametrize("file_format", [FILE_FORMAT_NDJSON, FILE_FORMAT_ARRAY])
+def test_interrupted_bulk_file_is_resumed_after_the_checkpoint(tmp_path, file_format):
+    path = write_bulk_file(tmp_path, file_format)
+    file_name = os.path.basename(path)
+    interrupted_client = FederatedCatalogueClientStub(fail_after=7)
+
+    create_handler(tmp_path, interrupted_client).process_claim_files()
+    assert os.path.exists(path)
+    with open(tmp_path / "checkpoints" / (file_name + ".checkpoint")) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    # The results of the last group have never been reported, so the checkpoint stops before its records
+    checkpointed_ids = {claims["id"] for claims, _, end_offset in iter_claim_records(path, file_format)
+                        if end_offset <= checkpoint["offset"] and not isinstance(claims, Exception)
+                        and not claims.get("fail")}
+    assert 0 < checkpoint["next_record"] < RECORD_COUNT
+    assert set(interrupted_client.uploaded) > checkpointed_ids
+    assert os.path.getsize(tmp_path / "failed" / (file_name + ".rejected.ndjson")) == checkpoint["reject_file_size"]
+
+    resumed_client = FederatedCatalogueClientStub()
+    create_handler(tmp_path, resumed_client).process_claim_files()
+    # No record covered by the checkpoint is sent again, records after it are sent at least once
+    assert not checkpointed_ids & set(resumed_client.uploaded)
+    expected_ids = {create_claims(number)["id"] for number in range(RECORD_COUNT) if number not in FAILING_RECORDS}
+    assert set(interrupted_client.uploaded) | set(resumed_client.uploaded) == expected_ids
+    assert os.path.exists(tmp_path / "processed" / file_name)
+    assert not os.path.exists(tmp_path / "checkpoints" / (file_name + ".checkpoint"))
+
+    # Every rejected record is listed exactly once and in file order
+    rejects = read_rejects(tmp_path, file_name)
+    rejected_ids = [reject["claims"]["id"] for reject in rejects if "claims" in reject]
+    assert rejected_ids == [create_claims(number)["id"] for number in sorted(FAILING_RECORDS)]
+    assert [reject["record"] for reject in rejects] == sorted(reject["record"] for reject in rejects)
+    assert len(rejects) == len(FAILING_RECORDS) + (1 if file_format == FILE_FORMAT_NDJSON else 0)
+
+
+def test_checkpoint_is_ignored_for_a_different_file(tmp_path):
+    path = write_bulk_file(tmp_path, FILE_FORMAT_NDJSON)
+    create_handler(tmp_path, FederatedCatalogueClientStub(fail_after=7)).process_claim_files()
+    assert os.path.exists(tmp_path / "checkpoints" / "records.ndjson.checkpoint")
+
+    # A new file with the same name is processed from the start
+    os.remove(path)
+    write_bulk_file(tmp_path, FILE_FORMAT_NDJSON)
+    os.utime(path, ns=(0, 0))
+    client = FederatedCatalogueClientStub()
+    create_handler(tmp_path, client).process_claim_files()
+    assert client.uploaded[0] == create_claims(0)["id"]
+    assert len(client.uploaded) == RECORD_COUNT - len(FAILING_RECORDS)
+
+
+def test_reject_file_is_truncated_to_the_checkpoint(tmp_path):
+    path = tmp_path / "records.ndjson"
+    path.write_text("\n".join(json.dumps(create_claims(number)) for number in range(4)) + "\n")
+    checkpoint_path = str(tmp_path / "checkpoints" / "records.ndjson.checkpoint")
+    reject_file_path = str(tmp_path / "failed" / "records.ndjson.rejected.ndjson")
+    progress = _BulkClaimFileProgress(file_path=str(path), checkpoint_path=checkpoint_path,
+                                      reject_file_path=reject_file_path, checkpoint_interval=2)
+    for record in range(3):
+        progress.start(record, record * 10, record * 10 + 10)
+    # Records are completed out of order, the checkpoint only covers the records up to the first pending one
+    progress.complete(1, create_claims(1), ValueError("rejected"))
+    progress.complete(2, create_claims(2), ValueError("rejected"))
+    assert progress.next_record == 0
+    progress.complete(0)
+    assert progress.next_record == 3
+    progress.start(3, 30, 40)
+    progress.complete(3, create_claims(3), ValueError("rejected"))
+    # The reject of record 3 has been written after the checkpoint
+    with open(checkpoint_path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    assert checkpoint["next_record"] == 3 and checkpoint["offset"] == 30
+    progress._BulkClaimFileProgress__reject_file.flush()
+    assert os.path.getsize(reject_file_path) > checkpoint["reject_file_size"]
+
+    resumed_progress = _BulkClaimFileProgress(file_path=str(path), checkpoint_path=checkpoint_path,
+                                              reject_file_path=reject_file_path, checkpoint_interval=2)
+    assert (resumed_progress.offset, resumed_progress.next_record, resumed_progress.rejected_records) == (30, 3, 2)
+    with open(reject_file_path) as reject_file:
+        assert [json.loads(line)["record"] for line in reject_file] == [1, 2]
+
+
+def test_leased_files_are_read_only_after_they_have_been_leased(tmp_path, monkeypatch):
+    detected_paths = []
+
+    def record_detection(file_path: str) -> str:
+        detected_paths.append(file_path)
+        return detect_claim_file_format(file_path)
+
+    monkeypatch.setattr(claim_file_handler, "detect_claim_file_format", record_detection)
+    write_bulk_file(tmp_path, FILE_FORMAT_ARRAY)
+    (tmp_path / "offering.json").write_text(json.dumps(create_claims(100)))
+    (tmp_path / "invalid.json").write_text("{not json")
+    client = FederatedCatalogueClientStub()
+
+    create_handler(tmp_path, client, ClaimFileLeases(str(tmp_path), "replica-a", 60.0)).process_claim_files()
+    lease_dir = str(tmp_path / "in-progress" / "replica-a")
+    assert sorted(os.path.basename(path) for path in detected_paths) == ["invalid.json", "offering.json",
+                                                                         "records.json"]
+    assert all(os.path.dirname(path) == lease_dir for path in detected_paths)
+    assert sorted(os.listdir(tmp_path / "processed")) == ["offering.json", "records.json"]
+    assert "invalid.json" in os.listdir(tmp_path / "failed")
+    assert create_claims(100)["id"] in client.uploaded
+    assert os.listdir(lease_dir) == []
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+import pytest
+
+from claim_file_leases import ClaimFileLeases
+
+LEASE_TIMEOUT_SEC = 60.0
+
+
+def create_leases(claim_files_dir, replica_id: str, lease_timeout_sec: float = LEASE_TIMEOUT_SEC) -> ClaimFileLeases:
+    return ClaimFileLeases(claim_files_dir=str(claim_files_dir), replica_id=replica_id,
+                           lease_timeout_sec=lease_timeout_sec)
+
+
+def write_claim_file(claim_files_dir, file_name: str) -> str:
+    path = claim_files_dir / file_name
+    path.write_text('{"id": "https://example.org/offering/1"}')
+    return str(path)
+
+
+def make_stale(lease_dir):
+    stale_time = time.time() - 2 * LEASE_TIMEOUT_SEC
+    os.utime(lease_dir, (stale_time, stale_time))
+
+
+@pytest.mark.parametrize("replica_id", ["", ".recovering-1", "a/b", " a"])
+def test_invalid_replica_id_is_rejected(tmp_path, replica_id):
+    with pytest.raises(ValueError):
+        create_leases(tmp_path, replica_id)
+
+
+def test_only_one_of_two_racing_replicas_leases_a_file(tmp_path):
+    replicas = [create_leases(tmp_path, "replica-a"), create_leases(tmp_path, "replica-b")]
+    for round_number in range(50):
+        path = write_claim_file(tmp_path, "claims-{}.json".format(round_number))
+        barrier = threading.Barrier(len(replicas))
+        leased_paths = [None] * len(replicas)
+
+        def lease(index: int):
+            barrier.wait()
+            leased_paths[index] = replicas[index].lease(path)
+
+        threads = [threading.Thread(target=lease, args=(index,)) for index in range(len(replicas))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        winners = [leased_path for leased_path in leased_paths if leased_path is not None]
+        assert len(winners) == 1
+        assert os.path.isfile(winners[0]) and not os.path.exists(path)
+        assert replicas[0].is_leased(os.path.basename(path))
+
+
+def test_stale_lease_folder_is_recovered_while_its_owner_resumes(tmp_path):
+    owner, other = create_leases(tmp_path, "replica-a"), create_leases(tmp_path, "replica-b")
+    path = write_claim_file(tmp_path, "claims.json")
+    leased_path = owner.lease(path)
+
+    # The lease folder is recent, so nothing is recovered
+    assert other.recover_stale_leases() == 0
+    make_stale(tmp_path / "in-progress" / "replica-a")
+    assert other.recover_stale_leases() == 1
+    assert os.path.isfile(path) and not os.path.exists(leased_path)
+    assert not os.path.exists(tmp_path / "in-progress" / "replica-a")
+    assert not other.is_leased("claims.json")
+
+    # The owner continues after a pause: its folder is created again and the recovered file can be leased again by
+    # either replica, but only once
+    owner.renew()
+    leased_again = [owner.lease(path), other.lease(path)]
+    assert leased_again[0] == leased_path and leased_again[1] is None
+    assert other.recover_stale_leases() == 0
+
+
+def test_restarted_replica_reclaims_its_own_lease_folder(tmp_path):
+    path = write_claim_file(tmp_path, "claims.json")
+    create_leases(tmp_path, "replica-a").lease(path)
+    assert not os.path.exists(path)
+
+    # The folder is recent, but a replica with the same ID doesn't wait for the timeout
+    restarted = create_leases(tmp_path, "replica-a")
+    restarted.start()
+    try:
+        assert os.path.isfile(path)
+        assert os.listdir(tmp_path / "in-progress") == ["replica-a"]
+        assert os.listdir(tmp_path / "in-progress" / "replica-a") == []
+    finally:
+        restarted.stop()
+
+
+def test_heartbeat_keeps_the_lease_folder_recent(tmp_path):
+    leases = create_leases(tmp_path, "replica-a", lease_timeout_sec=0.3)
+    lease_dir = tmp_path / "in-progress" / "replica-a"
+    leases.start()
+    try:
+        make_stale(lease_dir)
+        time.sleep(0.3)
+        assert os.stat(lease_dir).st_mtime > time.time() - 0.3
+    finally:
+        leases.stop()
+    # Other replicas recover the files of a stopped replica once the timeout has passed
+    make_stale(lease_dir)
+    time.sleep(0.2)
+    assert os.stat(lease_dir).st_mtime < time.time() - LEASE_TIMEOUT_SEC
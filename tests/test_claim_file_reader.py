@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+import claim_file_reader
+from claim_file_reader import detect_claim_file_format, FILE_FORMAT_ARRAY, FILE_FORMAT_NDJSON, FILE_FORMAT_OBJECT, \
+    iter_claim_records
+
+RECORDS = [{"id": "https://example.org/offering/{}".format(number), "ex:name": "Offering [{}], \"ü\"".format(number)}
+           for number in range(5)]
+
+
+def write_array_file(path, records: list) -> str:
+    path.write_text(" [\n" + ",\n".join(json.dumps(record, ensure_ascii=False) for record in records) + "\n]\n",
+                    encoding="utf-8")
+    return str(path)
+
+
+def test_claim_file_format_is_detected(tmp_path):
+    (tmp_path / "object.json").write_text('\n {"id": "x"}')
+    (tmp_path / "array.json").write_text('\n [{"id": "x"}]')
+    (tmp_path / "records.jsonl").write_text('[1]\n')
+
+    assert detect_claim_file_format(str(tmp_path / "object.json")) == FILE_FORMAT_OBJECT
+    assert detect_claim_file_format(str(tmp_path / "array.json")) == FILE_FORMAT_ARRAY
+    assert detect_claim_file_format(str(tmp_path / "records.jsonl")) == FILE_FORMAT_NDJSON
+
+
+def test_ndjson_records_are_read_with_their_offsets(tmp_path):
+    lines = [json.dumps(RECORDS[0]), "", "{not json", json.dumps(RECORDS[1])]
+    path = tmp_path / "records.ndjson"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    records = list(iter_claim_records(str(path), FILE_FORMAT_NDJSON))
+    assert [record for record, _, _ in records if not isinstance(record, Exception)] == RECORDS[:2]
+    assert isinstance(records[1][0], ValueError)
+    # Continuing from the end offset of a record returns the following records only
+    assert [record for record, _, _ in iter_claim_records(str(path), FILE_FORMAT_NDJSON, records[1][2])] == \
+           [RECORDS[1]]
+
+
+@pytest.mark.parametrize("chunk_size", [3, 64 * 1024])
+def test_array_records_are_read_across_chunks(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(claim_file_reader, "READ_CHUNK_SIZE", chunk_size)
+    path = write_array_file(tmp_path / "records.json", RECORDS)
+    content = open(path, "rb").read()
+
+    records = list(iter_claim_records(path, FILE_FORMAT_ARRAY))
+    assert [record for record, _, _ in records] == RECORDS
+    # The offsets are byte offsets, although the records contain multibyte characters
+    for record, start_offset, end_offset in records:
+        assert json.loads(content[start_offset:end_offset].decode("utf-8")) == record
+    for index, (_, _, end_offset) in enumerate(records):
+        assert [record for record, _, _ in iter_claim_records(path, FILE_FORMAT_ARRAY, end_offset)] == \
+               RECORDS[index + 1:]
+
+
+def test_empty_array_has_no_records(tmp_path):
+    assert list(iter_claim_records(write_array_file(tmp_path / "records.json", []), FILE_FORMAT_ARRAY)) == []
+
+
+def test_malformed_array_stops_reading(tmp_path):
+    path = tmp_path / "records.json"
+    path.write_text('[{"id": "1"}, {"id": } , {"id": "3"}]')
+
+    records = list(iter_claim_records(str(path), FILE_FORMAT_ARRAY))
+    assert records[0][0] == {"id": "1"}
+    assert isinstance(records[1][0], ValueError)
+    assert len(records) == 2
+
+    path.write_text('[{"id": "1"} {"id": "2"}]')
+    records = list(iter_claim_records(str(path), FILE_FORMAT_ARRAY))
+    assert "Expected one of" in str(records[1][0])
+
+    path.write_text('[{"id": "1"},')
+    assert "not closed" in str(list(iter_claim_records(str(path), FILE_FORMAT_ARRAY))[-1][0])
+
+
+def test_oversized_array_record_is_rejected(tmp_path, monkeypatch):
+    assert claim_file_reader.MAX_RECORD_SIZE == 16 * 1024 * 1024
+    monkeypatch.setattr(claim_file_reader, "MAX_RECORD_SIZE", 100)
+    monkeypatch.setattr(claim_file_reader, "READ_CHUNK_SIZE", 16)
+    path = write_array_file(tmp_path / "records.json", [RECORDS[0], {"ex:description": "x" * 200}, RECORDS[1]])
+
+    records = list(iter_claim_records(path, FILE_FORMAT_ARRAY))
+    assert records[0][0] == RECORDS[0]
+    assert "exceeds the maximum size" in str(records[1][0])
+    assert len(records) == 2
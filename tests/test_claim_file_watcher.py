@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from claim_file_watcher import ClaimFileWatcher, is_inotify_available
+
+pytestmark = pytest.mark.skipif(not is_inotify_available(), reason="inotify is only available on Linux")
+
+
+class StopWatching(Exception):
+    pass
+
+
+class ClaimFileHandlerStub:
+    """
+    Records the calls of `watch_claim_files` and stops it after the given number of full scans.
+    """
+
+    def __init__(self, full_scans: int):
+        self.full_scans = full_scans
+        self.processed = []
+
+    def process_claim_files(self, file_names: list[str] | None = None):
+        self.processed.append(file_names)
+        if self.processed.count(None) >= self.full_scans:
+            raise StopWatching()
+
+    def recover_stale_leases(self):
+        pass
+
+    def cleanup_old_files(self):
+        pass
+
+
+def test_files_are_reported_once_atomically_renamed(tmp_path):
+    watcher = ClaimFileWatcher(str(tmp_path))
+    try:
+        with open(tmp_path / "claims.json.part", "w") as file:
+            file.write('{"@context": {}}')
+            assert watcher.wait_for_files(timeout_sec=0.1) == []
+        # Closing the temporary file is reported, but it isn't a Claim file
+        assert watcher.wait_for_files(timeout_sec=0.1) == []
+
+        os.rename(tmp_path / "claims.json.part", tmp_path / "claims.json")
+        assert watcher.wait_for_files(timeout_sec=1) == ["claims.json"]
+        assert watcher.wait_for_files(timeout_sec=0.1) == []
+    finally:
+        watcher.close()
+
+
+def test_whole_folder_is_rescanned_periodically(app_module, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, "CLAIM_FILES_DIR", str(tmp_path))
+    monkeypatch.setattr(app_module, "CLAIM_FILES_WATCH_CLEANUP_INTERVAL_SEC", 3600.0)
+    monkeypatch.setattr(app_module, "CLAIM_FILES_WATCH_RESCAN_INTERVAL_SEC", 0.2)
+    handler = ClaimFileHandlerStub(full_scans=3)
+
+    with pytest.raises(StopWatching):
+        app_module.watch_claim_files(handler)
+    # The initial scan and two rescans, although no event has been received
+    assert handler.processed == [None, None, None]
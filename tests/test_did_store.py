@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from did_store import DIDStore
+from did_store_backends import DIDStoreBackend
+
+BUCKET = "did-store"
+STORAGE_URL = "s3://{}/did".format(BUCKET)
+VC_CONTENT = {"type": ["VerifiableCredential"], "credentialSubject": {"id": "did:web:example.org"}}
+VP_CONTENT = {"type": ["VerifiablePresentation"], "verifiableCredential": []}
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        yield BUCKET
+
+
+def create_cloud_did_store() -> DIDStore:
+    return DIDStore(storage_type="cloud", storage_path=STORAGE_URL, vp_vc_id_prefix="did:web:example.org")
+
+
+def save_object(did_store: DIDStore, content: dict) -> str:
+    did_store_object = did_store.create_transient_did_store_object(dict(content))
+    did_store.save_object_into_storage(did_store_object)
+    return did_store_object.get_uuid()
+
+
+def test_incomplete_backend_cannot_be_created():
+    class IncompleteBackend(DIDStoreBackend):
+        def get_location(self, key: str) -> str:
+            return key
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+
+def test_cloud_save_and_get(s3_bucket):
+    did_store = create_cloud_did_store()
+    object_uuid = save_object(did_store, VC_CONTENT)
+
+    saved_object = json.loads(did_store.get_saved_object(object_uuid))
+    assert saved_object["credentialSubject"] == VC_CONTENT["credentialSubject"]
+    assert saved_object["id"] == "did:web:example.org:id-documents:" + object_uuid
+    assert list(did_store.get_saved_uuids()) == [object_uuid]
+    with pytest.raises(ValueError):
+        did_store.get_saved_object("0" * 32)
+
+
+def test_cloud_index_lists_objects_by_type(s3_bucket):
+    did_store = create_cloud_did_store()
+    vc_uuids = [save_object(did_store, VC_CONTENT) for _ in range(3)]
+    vp_uuid = save_object(did_store, VP_CONTENT)
+
+    assert did_store.list_saved_uuids(limit=10) == (vc_uuids + [vp_uuid], None)
+    assert did_store.list_saved_uuids(limit=10, object_type="VC") == (vc_uuids, None)
+    first_page, cursor = did_store.list_saved_uuids(limit=2)
+    assert first_page == vc_uuids[:2]
+    assert did_store.list_saved_uuids(limit=2, cursor=cursor) == ([vc_uuids[2], vp_uuid], None)
+
+
+def test_cloud_index_lists_markers_written_out_of_order(s3_bucket):
+    writer = create_cloud_did_store()
+    reader = create_cloud_did_store()
+    first_uuid = save_object(writer, VC_CONTENT)
+    assert reader.list_saved_uuids(limit=10) == ([first_uuid], None)
+
+    # Another worker has computed the creation time before the first object was saved, but writes its marker later
+    delayed_uuid = "a" * 32
+    writer._backend.append_index_records([[time.time_ns() // 1000 - 5_000_000, delayed_uuid, "VC"]])
+    second_uuid = save_object(writer, VC_CONTENT)
+
+    assert reader.list_saved_uuids(limit=10) == ([delayed_uuid, first_uuid, second_uuid], None)
+    # Markers of the skew window are read again, but listed only once
+    assert reader.list_saved_uuids(limit=10) == ([delayed_uuid, first_uuid, second_uuid], None)
+
+
+def test_migrate_local_to_cloud(s3_bucket, tmp_path):
+    source = DIDStore(storage_type="local", storage_path=str(tmp_path), vp_vc_id_prefix="did:web:example.org",
+                      precompress=True)
+    object_uuids = [save_object(source, VC_CONTENT), save_object(source, VP_CONTENT)]
+    target = create_cloud_did_store()
+
+    assert source.migrate_to(target, batch_size=2) == 6  # Objects and their gzip and brotli variants
+    migrated = create_cloud_did_store()
+    assert migrated.list_saved_uuids(limit=10) == (object_uuids, None)
+    for object_uuid in object_uuids:
+        assert migrated.get_saved_object(object_uuid) == source.get_saved_object(object_uuid)
+        assert migrated.get_saved_object_variant(object_uuid, "br") is not None
+
+
+def test_migrate_cloud_without_index_does_not_modify_source(s3_bucket, tmp_path):
+    did_store = create_cloud_did_store()
+    object_uuid = save_object(did_store, VC_CONTENT)
+    s3_client = boto3.client("s3")
+    index_keys = [content["Key"] for content in
+                  s3_client.list_objects_v2(Bucket=BUCKET, Prefix="did/index/")["Contents"]]
+    s3_client.delete_objects(Bucket=BUCKET, Delete={"Objects": [{"Key": key} for key in index_keys]})
+
+    source = DIDStore(storage_type="cloud", storage_path=STORAGE_URL, vp_vc_id_prefix="did:web:example.org",
+                      build_index=False)
+    target = DIDStore(storage_type="sqlite", storage_path=str(tmp_path / "did.sqlite"),
+                      vp_vc_id_prefix="did:web:example.org")
+    assert source.migrate_to(target) == 1
+
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=BUCKET, Prefix="did/index/")
+    assert target.list_saved_uuids(limit=10) == ([object_uuid], None)
+
+
+def test_index_is_built_once_by_concurrent_processes(tmp_path, monkeypatch):
+    did_store = DIDStore(storage_type="local", storage_path=str(tmp_path), vp_vc_id_prefix="did:web:example.org")
+    uuids = [save_object(did_store, VC_CONTENT) for _ in range(3)]
+    (tmp_path / "index.jsonl").unlink()
+    rebuilds = []
+    rebuild_index = DIDStore.rebuild_index
+
+    def slow_rebuild_index(self):
+        rebuilds.append(self)
+        time.sleep(0.2)
+        rebuild_index(self)
+
+    monkeypatch.setattr(DIDStore, "rebuild_index", slow_rebuild_index)
+    # Each store holds the lock via its own file description, like separate worker processes
+    threads = [threading.Thread(target=DIDStore, kwargs={"storage_type": "local", "storage_path": str(tmp_path),
+                                                         "vp_vc_id_prefix": "did:web:example.org"})
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(rebuilds) == 1
+    reopened_did_store = DIDStore(storage_type="local", storage_path=str(tmp_path),
+                                  vp_vc_id_prefix="did:web:example.org")
+    assert sorted(reopened_did_store.list_saved_uuids(limit=10)[0]) == sorted(uuids)
+
+
+@pytest.mark.parametrize("storage_layout", ["flat", "sharded"])
+def test_local_objects_are_replaced_atomically(tmp_path, monkeypatch, storage_layout):
+    did_store = DIDStore(storage_type="local", storage_path=str(tmp_path), vp_vc_id_prefix="did:web:example.org",
+                         storage_layout=storage_layout)
+    object_uuid = save_object(did_store, VC_CONTENT)
+    assert not list(tmp_path.rglob("*.tmp"))
+
+    def fail_replace(source, target):
+        raise OSError("disk full")
+
+    # An object that couldn't be completed is never visible under its key
+    monkeypatch.setattr(os, "replace", fail_replace)
+    did_store_object = did_store.create_transient_did_store_object(dict(VP_CONTENT))
+    assert not did_store.save_objects_into_storage([did_store_object])
+    monkeypatch.undo()
+    with pytest.raises(ValueError):
+        did_store.get_saved_object(did_store_object.get_uuid())
+    assert len(list(tmp_path.rglob("*.tmp"))) == 1
+    assert list(did_store.get_saved_uuids()) == [object_uuid]
+
+
+def test_sqlite_writes_objects_and_index_records_in_one_transaction(tmp_path):
+    did_store = DIDStore(storage_type="sqlite", storage_path=str(tmp_path / "did.sqlite"),
+                         vp_vc_id_prefix="did:web:example.org")
+    backend = did_store._backend
+    statements = []
+    backend._connection.set_trace_callback(statements.append)
+
+    did_store_objects = [did_store.create_transient_did_store_object(dict(content))
+                         for content in (VC_CONTENT, VP_CONTENT)]
+    assert did_store.save_objects_into_storage(did_store_objects)
+    assert statements.count("COMMIT") == 1
+    assert sorted(did_store.list_saved_uuids(limit=10)[0]) == sorted(did_store_object.get_uuid()
+                                                                     for did_store_object in did_store_objects)
+
+    # Objects aren't written if their index records can't be written
+    with pytest.raises(Exception):
+        backend.write_batch([("failed.json", b"{}")], [[1, "failed", None]])
+    assert backend.read_object("failed.json") is None
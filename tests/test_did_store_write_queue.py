@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+from did_store_write_queue import DIDStoreWriteQueue
+
+
+class DIDStoreObjectStub:
+    def __init__(self, object_uuid: str):
+        self.object_uuid = object_uuid
+        self.storage_path = "path"
+
+    def get_uuid(self) -> str:
+        return self.object_uuid
+
+    def set_storage_path(self, storage_path):
+        self.storage_path = storage_path
+
+
+class Storage:
+    """
+    Records the written batches, a batch only completes once `release` has been set.
+    """
+
+    def __init__(self, succeeds: bool = True):
+        self.succeeds = succeeds
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def save(self, did_store_objects: list) -> bool:
+        self.release.wait()
+        self.batches.append([did_store_object.get_uuid() for did_store_object in did_store_objects])
+        return self.succeeds
+
+
+def create_queue(storage: Storage, max_batch_size: int = 100, max_delay_sec: float = 60.0,
+                 durable: bool = False) -> DIDStoreWriteQueue:
+    return DIDStoreWriteQueue(save_function=storage.save, max_batch_size=max_batch_size, max_delay_sec=max_delay_sec,
+                              max_queue_size=1000, durable=durable)
+
+
+def wait_until(condition, timeout_sec: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout_sec
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_batch_is_written_once_it_is_full():
+    storage = Storage()
+    queue = create_queue(storage, max_batch_size=3)
+
+    for object_uuid in ("a", "b"):
+        queue.put(DIDStoreObjectStub(object_uuid))
+    time.sleep(0.1)
+    assert storage.batches == []
+    assert queue.get_pending_object("a") is not None
+    queue.put(DIDStoreObjectStub("c"))
+    assert wait_until(lambda: storage.batches == [["a", "b", "c"]])
+    assert wait_until(lambda: queue.get_pending_object("a") is None)
+    queue.close()
+
+
+def test_batch_is_written_after_the_maximum_delay():
+    storage = Storage()
+    queue = create_queue(storage, max_delay_sec=0.2)
+
+    started = time.monotonic()
+    queue.put(DIDStoreObjectStub("a"))
+    queue.put(DIDStoreObjectStub("b"))
+    assert wait_until(lambda: storage.batches == [["a", "b"]])
+    assert time.monotonic() - started >= 0.2
+    queue.close()
+
+
+def test_close_drains_the_queue():
+    storage = Storage()
+    queue = create_queue(storage, max_batch_size=2)
+
+    for object_uuid in ("a", "b", "c"):
+        queue.put(DIDStoreObjectStub(object_uuid))
+    queue.close()
+    assert storage.batches == [["a", "b"], ["c"]]
+    assert queue.get_statistics()["flushed_objects"] == 3
+    with pytest.raises(RuntimeError):
+        queue.put(DIDStoreObjectStub("d"))
+
+
+def test_durable_put_returns_after_the_batch_has_been_written():
+    storage = Storage()
+    storage.release.clear()
+    queue = create_queue(storage, max_delay_sec=0.01, durable=True)
+    finished = []
+
+    # Concurrent requests wait for a common batch
+    threads = [threading.Thread(target=lambda object_uuid=object_uuid: (queue.put(DIDStoreObjectStub(object_uuid)),
+                                                                        finished.append(object_uuid)))
+               for object_uuid in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    assert finished == []
+    storage.release.set()
+    for thread in threads:
+        thread.join()
+    assert sorted(finished) == ["a", "b"]
+    assert [sorted(batch) for batch in storage.batches] in ([["a", "b"]], [["a"], ["b"]])
+    queue.close()
+
+
+def test_failed_batches_are_reported():
+    storage = Storage(succeeds=False)
+    durable_queue = create_queue(storage, max_delay_sec=0.01, durable=True)
+    with pytest.raises(IOError):
+        durable_queue.put(DIDStoreObjectStub("a"))
+    durable_queue.close()
+
+    queue = create_queue(storage, max_delay_sec=0.01)
+    did_store_object = DIDStoreObjectStub("b")
+    queue.put(did_store_object)
+    queue.close()
+    assert did_store_object.storage_path is None
+    assert queue.get_pending_object("b") is None
+    assert queue.get_statistics()["failed_objects"] == 1
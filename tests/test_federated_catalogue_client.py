@@ -0,0 +1,225 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import federated_catalogue_client
+from federated_catalogue_client import AIMDConcurrencyLimit, BulkUploadRetryPolicy, FederatedCatalogueClient, \
+    KeycloakTokenCache
+
+REFRESH_MARGIN_SEC = 30.0
+
+
+class KeycloakStub:
+    """
+    Stands in for `KeycloakOpenID`, issuing numbered tokens that expire shortly after the refresh margin.
+    """
+
+    def __init__(self, expires_in: float = REFRESH_MARGIN_SEC + 0.2, token_delay_sec: float = 0.0):
+        self.expires_in = expires_in
+        self.token_delay_sec = token_delay_sec
+        self.refresh_fails = False
+        self.calls = []
+        self.__lock = threading.Lock()
+
+    def _issue(self, grant_type: str) -> dict:
+        with self.__lock:
+            self.calls.append(grant_type)
+            number = len(self.calls)
+        return {"access_token": "access-{}".format(number), "expires_in": self.expires_in,
+                "refresh_token": "refresh-{}".format(number), "refresh_expires_in": 1800}
+
+    def token(self, username: str, password: str) -> dict:
+        time.sleep(self.token_delay_sec)
+        return self._issue("password")
+
+    def refresh_token(self, refresh_token: str) -> dict:
+        if self.refresh_fails:
+            self.calls.append("refresh_token failed")
+            raise ConnectionError("refresh token has been revoked")
+        return self._issue("refresh_token")
+
+
+class CatalogueStub(ThreadingHTTPServer):
+    """
+    Self Description endpoint rejecting the first request with 401 and accepting all further ones.
+    """
+
+    def __init__(self):
+        self.authorization_headers = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(handler):
+                handler.rfile.read(int(handler.headers["Content-Length"]))
+                self.authorization_headers.append(handler.headers["Authorization"])
+                handler.send_response(401 if len(self.authorization_headers) == 1 else 201)
+                handler.send_header("Content-Length", "0")
+                handler.end_headers()
+
+            def log_message(handler, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), Handler)
+
+    @property
+    def url(self) -> str:
+        return "http://{}:{}".format(*self.server_address[:2])
+
+
+@pytest.fixture
+def keycloak(monkeypatch):
+    keycloak = KeycloakStub()
+    monkeypatch.setattr(federated_catalogue_client, "KeycloakOpenID", lambda **kwargs: keycloak)
+    return keycloak
+
+
+@pytest.fixture
+def catalogue():
+    catalogue = CatalogueStub()
+    threading.Thread(target=catalogue.serve_forever, daemon=True).start()
+    yield catalogue
+    catalogue.shutdown()
+    catalogue.server_close()
+
+
+def create_client(catalogue_url: str = "http://127.0.0.1:1") -> FederatedCatalogueClient:
+    return FederatedCatalogueClient(federated_catalogue_url=catalogue_url, keycloak_server_url="http://keycloak/",
+                                    federated_catalogue_user_name="user", federated_catalogue_user_password="password",
+                                    keycloak_client_secret="secret",
+                                    keycloak_token_refresh_margin_sec=REFRESH_MARGIN_SEC, max_retries=0)
+
+
+def test_concurrency_limit_is_halved_once_per_burst_and_grows_per_round_trip():
+    limit = AIMDConcurrencyLimit(max_limit=8)
+    started = [limit.start(now=1.0) for _ in range(8)]
+    assert limit.is_full()
+
+    limit.finish(started[0], now=2.0, throttled=True, retry_after_sec=None)
+    limit.finish(started[1], now=2.1, throttled=True, retry_after_sec=None)
+    assert limit.limit == 4.0
+    for started_at in started[2:]:
+        limit.finish(started_at, now=3.0, throttled=False, retry_after_sec=None)
+    assert 5.0 < limit.limit < 6.0
+    assert not limit.is_full()
+
+
+def test_concurrency_limit_pauses_for_retry_after():
+    limit = AIMDConcurrencyLimit(max_limit=2)
+    limit.finish(limit.start(now=1.0), now=2.0, throttled=True, retry_after_sec=3.0)
+    assert limit.get_pause_sec(now=4.0) == 1.0
+    assert limit.get_pause_sec(now=5.0) <= 0
+
+
+def test_concurrency_limit_is_kept_for_requests_failing_without_response():
+    limit = AIMDConcurrencyLimit(max_limit=4)
+    limit.finish(limit.start(now=1.0), now=2.0, throttled=False, retry_after_sec=None, failed=True)
+    assert limit.limit == 4.0
+    assert not limit.is_full()
+
+
+def test_retry_policy_only_retries_throttled_responses():
+    policy = BulkUploadRetryPolicy(max_attempts=2, backoff_factor=0.5)
+    result = {"index": 0, "status": "failed", "status_code": None, "attempts": 1}
+
+    assert policy.handle_response(result, 400, False, "bad request", retry_after_sec=None) is None
+    assert result["status_code"] == 400 and "bad request" in result["error"]
+    assert policy.handle_response(result, 429, False, "", retry_after_sec=2.0) == 0.0
+    assert 0 <= policy.handle_response(result, 503, False, "", retry_after_sec=None) <= 0.5
+    result["attempts"] = 2
+    assert policy.handle_response(result, 429, False, "", retry_after_sec=None) is None
+    assert policy.handle_response(result, 201, True, "", retry_after_sec=None) is None
+    assert result["status"] == "success" and "error" not in result
+
+
+def test_token_cache_expires_tokens_before_their_refresh_margin():
+    cache = KeycloakTokenCache(refresh_margin_sec=REFRESH_MARGIN_SEC)
+    started = time.monotonic()
+    cache.put({"access_token": "a", "expires_in": REFRESH_MARGIN_SEC + 0.2, "refresh_token": "r",
+               "refresh_expires_in": REFRESH_MARGIN_SEC + 60}, "password", started)
+
+    assert cache.get_valid_token()["access_token"] == "a"
+    time.sleep(0.3)
+    assert cache.get_valid_token() is None
+    assert cache.get_refresh_token(time.monotonic()) == "r"
+    assert cache.get_refresh_token(started + 60) is None
+    cache.invalidate()
+    assert cache.get_refresh_token(time.monotonic()) is None
+    assert cache.get_statistics()["password_grants"] == 1
+
+
+def test_token_is_refreshed_proactively_with_refresh_token(keycloak):
+    client = create_client()
+
+    assert client._get_keycloak_token()["access_token"] == "access-1"
+    assert client._get_keycloak_token()["access_token"] == "access-1"
+    time.sleep(0.3)
+    # The token is within the refresh margin, so it is replaced before it expires
+    assert client._get_keycloak_token()["access_token"] == "access-2"
+    assert keycloak.calls == ["password", "refresh_token"]
+    statistics = client.get_token_statistics()
+    assert statistics["password_grants"] == 1 and statistics["refresh_grants"] == 1
+
+
+def test_failed_refresh_falls_back_to_password_grant(keycloak):
+    client = create_client()
+    client._get_keycloak_token()
+    time.sleep(0.3)
+    keycloak.refresh_fails = True
+
+    assert client._get_keycloak_token()["access_token"] == "access-3"
+    assert keycloak.calls == ["password", "refresh_token failed", "password"]
+    assert client.get_token_statistics()["password_grants"] == 2
+
+
+def test_concurrent_requests_share_a_single_token_fetch(keycloak):
+    keycloak.expires_in = 3600
+    keycloak.token_delay_sec = 0.2
+    client = create_client()
+    tokens = []
+
+    threads = [threading.Thread(target=lambda: tokens.append(client._get_keycloak_token())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert keycloak.calls == ["password"]
+    assert {token["access_token"] for token in tokens} == {"access-1"}
+
+
+def test_rejected_token_is_replaced_and_request_retried_once(keycloak, catalogue):
+    keycloak.expires_in = 3600
+    client = create_client(catalogue.url)
+
+    client.send_to_federated_catalogue({"id": "https://example.org/sd/1"})
+    # The revoked token isn't refreshed, a new one is requested with the credentials
+    assert catalogue.authorization_headers == ["Bearer access-1", "Bearer access-2"]
+    assert keycloak.calls == ["password", "password"]
+    client.send_to_federated_catalogue({"id": "https://example.org/sd/2"})
+    assert catalogue.authorization_headers[-1] == "Bearer access-2"
+
+
+def test_bulk_upload_reports_failed_result_for_every_error(monkeypatch):
+    limiters = []
+
+    class RecordingLimiter(federated_catalogue_client.AdaptiveConcurrencyLimiter):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            limiters.append(self)
+
+    def send_self_description(request_body: str):
+        raise ConnectionError("connection refused")
+
+    monkeypatch.setattr(federated_catalogue_client, "AdaptiveConcurrencyLimiter", RecordingLimiter)
+    client = create_client()
+    client._send_self_description = send_self_description
+    # The list isn't a Self Description, so sending it raises before any request
+    results = client.send_many_to_federated_catalogue([{"id": "https://example.org/sd/1"}, ["not", "a", "dict"],
+                                                       {"id": "https://example.org/sd/3"}], max_in_flight=2)
+
+    assert [(result["index"], result["status"]) for result in results] == [(0, "failed"), (1, "failed"),
+                                                                            (2, "failed")]
+    assert all("connection refused" in results[index]["error"] for index in (0, 2))
+    assert results[1]["attempts"] == 0
+    # Connection errors are no sign of overload, so the limit isn't decreased
+    assert limiters[0].limit == 2.0
@@ -0,0 +1,87 @@
+import importlib.util
+import os
+import sys
+import time
+from threading import Thread
+
+import pytest
+
+from conftest import SRC_DIR
+
+
+@pytest.fixture
+def gunicorn_conf(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPERATING_MODE", "HYBRID")
+    monkeypatch.setenv("BACKGROUND_TASK_STATUS_FILE", str(tmp_path / "background-task"))
+    monkeypatch.setenv("BACKGROUND_TASK_RESTART_MAX_DELAY_SEC", "0.2")
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", os.path.join(SRC_DIR, "gunicorn.conf.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.BACKGROUND_TASK_RESTART_MIN_DELAY_SEC = 0.05
+    yield module
+    module.background_task_stopping.set()
+
+
+class Log:
+    def __init__(self):
+        self.messages = []
+
+    def info(self, message: str):
+        self.messages.append(message)
+
+    def error(self, message: str):
+        self.messages.append(message)
+
+
+class Server:
+    def __init__(self):
+        self.log = Log()
+
+
+def wait_until(condition, timeout_sec: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout_sec
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_terminated_background_task_is_restarted_with_backoff(gunicorn_conf, tmp_path):
+    counter_file = tmp_path / "starts"
+    # Every process records its start and exits immediately
+    gunicorn_conf.BACKGROUND_TASK_COMMAND = [sys.executable, "-c",
+                                             "open({!r}, 'a').write('x')".format(str(counter_file))]
+    server = Server()
+    supervisor = Thread(target=gunicorn_conf.supervise_background_task, args=(server,), daemon=True)
+    started = time.monotonic()
+    supervisor.start()
+
+    assert wait_until(lambda: counter_file.exists() and len(counter_file.read_text()) >= 4)
+    # Delays of 0.05, 0.1 and 0.2 seconds (capped) have been waited between the four starts
+    assert time.monotonic() - started >= 0.35
+    assert any("delay_sec: 0.2" in message for message in server.log.messages)
+    gunicorn_conf.background_task_stopping.set()
+    supervisor.join(timeout=5)
+    assert not supervisor.is_alive()
+
+
+def test_status_file_exists_while_background_task_is_running(gunicorn_conf):
+    status_file = os.environ["BACKGROUND_TASK_STATUS_FILE"]
+    gunicorn_conf.BACKGROUND_TASK_COMMAND = [sys.executable, "-c", "import time; time.sleep(60)"]
+    supervisor = Thread(target=gunicorn_conf.supervise_background_task, args=(Server(),), daemon=True)
+    supervisor.start()
+
+    assert wait_until(lambda: os.path.exists(status_file))
+    process = gunicorn_conf.background_process
+    assert open(status_file).read() == str(process.pid)
+
+    # A killed process is reported as not running until it has been restarted
+    process.kill()
+    assert wait_until(lambda: gunicorn_conf.background_process is not process and os.path.exists(status_file))
+
+    gunicorn_conf.on_exit(Server())
+    supervisor.join(timeout=5)
+    assert not supervisor.is_alive()
+    assert not os.path.exists(status_file)
+    assert gunicorn_conf.background_process.poll() is not None
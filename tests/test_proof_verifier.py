@@ -0,0 +1,129 @@
+import copy
+import time
+
+import pytest
+from jwcrypto.jwk import JWK
+
+from document_loader import CachingDocumentLoader, DEFAULT_CONTEXT_BUNDLE_DIR
+from proof_verifier import get_did_web_document_url, ProofVerifier, VerificationKeyResolver
+from self_description_processor import SelfDescriptionProcessor
+
+CREDENTIAL_ISSUER = "did:web:example.org"
+REMOTE_DID = "did:web:issuer.example.com:users:alice"
+
+
+@pytest.fixture(scope="module")
+def document_loader():
+    return CachingDocumentLoader(bundle_dir=DEFAULT_CONTEXT_BUNDLE_DIR, cache_size=10, cache_ttl_sec=0, offline=True)
+
+
+@pytest.fixture(scope="module")
+def signature_jwk():
+    return JWK.generate(kty="EC", crv="P-256")
+
+
+def create_processor(document_loader, signature_jwk: JWK, legacy: bool) -> SelfDescriptionProcessor:
+    return SelfDescriptionProcessor(credential_issuer=CREDENTIAL_ISSUER, signature_jwk=signature_jwk,
+                                    use_legacy_catalogue_signature=legacy, did_store=None,
+                                    document_loader=document_loader)
+
+
+def create_claims() -> dict:
+    return {"@context": {"ex": "https://example.org/ontology/"}, "id": "https://example.org/offering/1",
+            "@type": "ex:ServiceOffering", "ex:name": "Offering"}
+
+
+class DIDWebResolverStub(VerificationKeyResolver):
+    """
+    Resolves `did:web` DIDs from a dictionary instead of the network and counts the resolutions.
+    """
+
+    def __init__(self, did_documents: dict[str, dict[str, JWK]], **kwargs):
+        super().__init__(**kwargs)
+        self.did_documents = did_documents
+        self.resolved_dids = []
+
+    def _resolve_did_web(self, did: str) -> dict[str, JWK]:
+        self.resolved_dids.append(did)
+        if did not in self.did_documents:
+            raise IOError("DID document not found [did: {did}]".format(did=did))
+        return self.did_documents[did]
+
+
+def create_verifier(document_loader, signature_jwk: JWK, legacy: bool) -> ProofVerifier:
+    processor = create_processor(document_loader, signature_jwk, legacy)
+    key_resolver = DIDWebResolverStub({}, local_verification_keys={processor.get_verification_method(): signature_jwk},
+                                      cache_size=10, cache_ttl_sec=60)
+    return ProofVerifier(self_description_processor=processor, key_resolver=key_resolver)
+
+
+@pytest.mark.parametrize("signing_legacy, payload", [(True, "legacy"), (False, "standard")])
+@pytest.mark.parametrize("verifying_legacy", [True, False])
+def test_proofs_are_verified_in_both_payload_modes(document_loader, signature_jwk, signing_legacy, payload,
+                                                   verifying_legacy):
+    presentation = create_processor(document_loader, signature_jwk, signing_legacy).create_self_description(
+        create_claims())
+    verifier = create_verifier(document_loader, signature_jwk, verifying_legacy)
+
+    result = verifier.verify(presentation)
+    assert result["verified"]
+    assert [(proof["path"], proof["payload"]) for proof in result["proofs"]] == [
+        ("$", payload), ("$.verifiableCredential[0]", payload)]
+
+
+def test_tampered_documents_are_rejected(document_loader, signature_jwk):
+    # Only the legacy payload covers the Proof fields, the standard payload is the hashed Credential
+    presentation = create_processor(document_loader, signature_jwk, True).create_self_description(create_claims())
+    verifier = create_verifier(document_loader, signature_jwk, False)
+    tampered_credential = copy.deepcopy(presentation)
+    tampered_credential["verifiableCredential"][0]["credentialSubject"]["ex:name"] = "Other offering"
+    tampered_proof = copy.deepcopy(presentation)
+    tampered_proof["proof"]["created"] = "2000-01-01T00:00:00Z"
+
+    results = verifier.verify_many([presentation, tampered_credential, tampered_proof])
+    assert [result["verified"] for result in results] == [True, False, False]
+    # The Proof of the VP covers the embedded VC as well
+    assert [proof["verified"] for proof in results[1]["proofs"]] == [False, False]
+    assert [proof["verified"] for proof in results[2]["proofs"]] == [False, True]
+    assert "doesn't match" in results[2]["proofs"][0]["error"]
+
+
+def test_proof_with_unknown_verification_method_is_rejected(document_loader, signature_jwk):
+    presentation = create_processor(document_loader, signature_jwk, False).create_self_description(create_claims())
+    presentation["proof"]["verificationMethod"] = REMOTE_DID + "#unknown-key"
+    verifier = create_verifier(document_loader, signature_jwk, False)
+
+    result = verifier.verify(presentation)
+    assert not result["verified"]
+    assert result["proofs"][0]["verificationMethod"] == REMOTE_DID + "#unknown-key"
+    assert "could not be resolved" in result["proofs"][0]["error"]
+    assert result["proofs"][1]["verified"]
+
+
+def test_resolved_did_documents_are_cached_until_they_expire():
+    public_key = JWK.from_json(JWK.generate(kty="EC", crv="P-256").export_public())
+    key_resolver = DIDWebResolverStub({REMOTE_DID: {REMOTE_DID + "#key-1": public_key,
+                                                    REMOTE_DID + "#key-2": public_key}},
+                                      local_verification_keys={}, cache_size=10, cache_ttl_sec=0.3)
+
+    # Verification methods of the same DID are resolved with a single request
+    assert set(key_resolver.resolve_many([REMOTE_DID + "#key-1", REMOTE_DID + "#key-2"])) == {
+        REMOTE_DID + "#key-1", REMOTE_DID + "#key-2"}
+    assert key_resolver.resolve(REMOTE_DID + "#key-1") is public_key
+    assert key_resolver.resolved_dids == [REMOTE_DID]
+    with pytest.raises(ValueError):
+        key_resolver.resolve(REMOTE_DID + "#key-3")
+    assert key_resolver.resolved_dids == [REMOTE_DID]
+
+    time.sleep(0.4)
+    key_resolver.resolve(REMOTE_DID + "#key-1")
+    assert key_resolver.resolved_dids == [REMOTE_DID, REMOTE_DID]
+    # Unresolvable verification methods are left out
+    assert key_resolver.resolve_many(["did:web:unknown.example.com#key-1"]) == {}
+
+
+@pytest.mark.parametrize("did, url", [("did:web:example.com", "https://example.com/.well-known/did.json"),
+                                      ("did:web:example.com:users:alice", "https://example.com/users/alice/did.json"),
+                                      ("did:web:localhost%3A8443", "https://localhost:8443/.well-known/did.json")])
+def test_did_web_document_url(did, url):
+    assert get_did_web_document_url(did) == url
@@ -0,0 +1,279 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from cache import TTLCache
+from did_store import DIDStore
+from self_description_processor import SelfDescriptionProcessor
+
+
+def create_claims(number: int) -> dict:
+    return {"@context": {"ex": "https://example.org/ontology/"},
+            "id": "https://example.org/offering/{}".format(number),
+            "@type": "ex:ServiceOffering",
+            "ex:name": "Offering {}".format(number)}
+
+
+def read_ndjson(response) -> list[dict]:
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.mark.parametrize("path, document_type", [("/vc-from-claims/batch", "VerifiableCredential"),
+                                                 ("/vp-from-claims/batch", "VerifiablePresentation")])
+def test_batch_from_json_array(client, path, document_type):
+    response = client.post(path, json=[create_claims(1), create_claims(2)])
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    results = read_ndjson(response)
+    assert [result["index"] for result in results] == [0, 1]
+    assert all(result["status"] == "success" for result in results)
+    assert all(document_type in result["result"]["type"] for result in results)
+    assert all("proof" in result["result"] for result in results)
+
+
+@pytest.mark.parametrize("path", ["/vc-from-claims/batch", "/vp-from-claims/batch"])
+def test_batch_from_ndjson_with_invalid_items(client, path):
+    body = "\n".join([json.dumps(create_claims(1)),
+                      "{not json",
+                      "",
+                      json.dumps(["not", "an", "object"]),
+                      json.dumps(create_claims(2))])
+    response = client.post(path, data=body, content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    results = read_ndjson(response)
+    # Empty lines are skipped, the other items keep their position
+    assert [(result["index"], result["status"]) for result in results] == [
+        (0, "success"), (1, "failed"), (2, "failed"), (3, "success")]
+    assert "https://example.org/offering/2" in json.dumps(results[3]["result"])
+
+
+def test_batch_exceeding_max_size_is_rejected(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_MAX_SIZE", 2)
+
+    response = client.post("/vc-from-claims/batch", json=[create_claims(number) for number in range(3)])
+    assert response.status_code == 413
+    response = client.post("/vp-from-claims/batch", data="\n".join(json.dumps(create_claims(number))
+                                                                   for number in range(3)),
+                           content_type="application/x-ndjson")
+    assert response.status_code == 413
+    response = client.post("/vc-from-claims/batch", json=[create_claims(number) for number in range(2)])
+    assert response.status_code == 200
+
+
+def test_batch_exceeding_max_body_size_is_rejected(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_MAX_BODY_BYTES", 200)
+    body = json.dumps([create_claims(number) for number in range(3)])
+    assert len(body) > 200
+
+    response = client.post("/vc-from-claims/batch", data=body, content_type="application/json")
+    assert response.status_code == 413
+    assert "maximum size" in response.get_json()["error"]
+
+
+def test_batch_body_without_content_length_is_limited(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_MAX_BODY_BYTES", 200)
+    body = ("\n".join(json.dumps(create_claims(number)) for number in range(3))).encode("utf-8")
+
+    with pytest.raises(app_module.BatchLimitExceededError):
+        app_module.parse_batch_request_body(body[:201], "application/x-ndjson")
+    assert len(app_module.parse_batch_request_body(body[:body.index(b"\n")], "application/x-ndjson")) == 1
+
+
+def test_ready_succeeds_after_warm_up(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "warm_up_finished", threading.Event())
+
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.get_json() == {"status": "starting"}
+    # Liveness doesn't depend on the warm-up
+    assert client.get("/health").status_code == 200
+    app_module.warm_up()
+    assert client.get("/health/ready").status_code == 200
+
+
+class FailingWarmUpStub:
+    """
+    Stands in for the signing pool and the Self Description processor, failing their warm-up.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def warm_up(self, *args, **kwargs):
+        self.calls += 1
+        raise RuntimeError("warm-up failed")
+
+
+def test_ready_succeeds_after_failed_warm_up_steps(app_module, client, monkeypatch):
+    signing_pool, processor = FailingWarmUpStub(), FailingWarmUpStub()
+    monkeypatch.setattr(app_module, "warm_up_finished", threading.Event())
+    monkeypatch.setattr(app_module, "signing_pool", signing_pool)
+    monkeypatch.setattr(app_module, "self_description_processor", processor)
+
+    app_module.warm_up()
+    # Failed steps only make the first requests slower, so the application still becomes ready
+    assert (signing_pool.calls, processor.calls) == (1, 1)
+    assert client.get("/health/ready").status_code == 200
+
+
+def test_ready_reports_background_task_of_hybrid_mode(app_module, client, monkeypatch, tmp_path):
+    status_file = tmp_path / "background-task"
+    monkeypatch.setattr(app_module, "OPERATING_MODE", "HYBRID")
+    monkeypatch.setattr(app_module, "BACKGROUND_TASK_STATUS_FILE", str(status_file))
+
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.get_json()["status"] == "failed"
+    status_file.write_text("1234")
+    assert client.get("/health/ready").status_code == 200
+
+
+@pytest.fixture
+def did_store(app_module, monkeypatch, tmp_path):
+    did_store = DIDStore(storage_type="local", storage_path=str(tmp_path),
+                         vp_vc_id_prefix="https://example.org")
+    monkeypatch.setattr(app_module, "did_store", did_store)
+    return did_store
+
+
+def save_documents(did_store: DIDStore, count: int, document_type: str = "VerifiableCredential") -> list[str]:
+    uuids = []
+    for _ in range(count):
+        did_store_object = did_store.create_transient_did_store_object({"type": [document_type]})
+        did_store.save_object_into_storage(did_store_object)
+        uuids.append(did_store_object.get_uuid())
+    return uuids
+
+
+def test_id_documents_pages_stay_stable_across_inserts(client, did_store):
+    uuids = save_documents(did_store, 5)
+
+    response = client.get("/id-documents?limit=2")
+    assert response.get_json() == uuids[:2]
+    listed = list(response.get_json())
+    # Documents saved while paging are appended to the listing, earlier pages don't shift
+    uuids += save_documents(did_store, 2)
+    while "Link" in response.headers:
+        next_url = response.headers["Link"].split(">")[0].lstrip("<")
+        response = client.get(next_url)
+        assert response.status_code == 200
+        listed += response.get_json()
+    assert listed == uuids
+
+
+@pytest.mark.parametrize("query", ["cursor=not-a-cursor", "cursor=" + "A" * 7, "limit=0", "created_after=yesterday",
+                                   "type=SD"])
+def test_id_documents_with_invalid_parameters_are_rejected(client, did_store, query):
+    response = client.get("/id-documents?" + query)
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "failed"
+
+
+def test_id_documents_with_non_numeric_limit_is_rejected(client, did_store):
+    # Rejected by the parameter parsing of flasgger according to the OpenAPI specification
+    assert client.get("/id-documents?limit=ten").status_code == 400
+
+
+def test_id_documents_filters(client, did_store):
+    vc_uuids = save_documents(did_store, 2)
+    time.sleep(0.01)
+    created_after = datetime.now(timezone.utc)
+    time.sleep(0.01)
+    vp_uuids = save_documents(did_store, 2, "VerifiablePresentation")
+    later_vc_uuids = save_documents(did_store, 1)
+
+    assert client.get("/id-documents?type=VC").get_json() == vc_uuids + later_vc_uuids
+    assert client.get("/id-documents?type=VP").get_json() == vp_uuids
+    response = client.get("/id-documents", query_string={"created_after": created_after.isoformat()})
+    assert response.get_json() == vp_uuids + later_vc_uuids
+    response = client.get("/id-documents", query_string={"created_after": created_after.isoformat(), "type": "VC"})
+    assert response.get_json() == later_vc_uuids
+
+
+def test_id_documents_conditional_requests(client, did_store):
+    save_documents(did_store, 2)
+    response = client.get("/id-documents")
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+
+    assert client.get("/id-documents", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/id-documents", headers={"If-Modified-Since": last_modified}).status_code == 304
+    time.sleep(1)
+    save_documents(did_store, 1)
+    assert client.get("/id-documents", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/id-documents", headers={"If-Modified-Since": last_modified}).status_code == 200
+
+
+def test_id_document_is_served_by_uuid(client, did_store):
+    object_uuid = save_documents(did_store, 1)[0]
+
+    response = client.get("/id-documents/{}/did.json".format(object_uuid))
+    assert response.status_code == 200
+    assert response.get_json()["id"] == "https://example.org/id-documents/{}.json".format(object_uuid)
+
+
+@pytest.mark.parametrize("request_uuid", ["0" * 32, "not-a-uuid"])
+def test_unknown_id_document_is_not_found(client, did_store, request_uuid):
+    response = client.get("/id-documents/{}/did.json".format(request_uuid))
+    assert response.status_code == 404
+    assert response.get_json()["status"] == "failed"
+
+
+def test_queued_id_document_is_neither_cached_nor_immutable(app_module, client, did_store):
+    did_store.enable_write_behind(max_batch_size=100, max_delay_sec=60.0, max_queue_size=100, durable=False)
+    object_uuid = save_documents(did_store, 1)[0]
+    path = "/id-documents/{}/did.json".format(object_uuid)
+
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert app_module.did_document_cache.get((object_uuid, None)) is None
+
+    did_store.close()
+    response = client.get(path)
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert app_module.did_document_cache.get((object_uuid, None)) is not None
+
+
+@pytest.mark.parametrize("path", ["/vc-from-claims", "/vp-from-claims"])
+def test_reused_idempotency_key_with_different_claims_is_rejected(app_module, client, monkeypatch, path):
+    monkeypatch.setattr(app_module, "self_description_processor", SelfDescriptionProcessor(
+        credential_issuer=app_module.CREDENTIAL_ISSUER, signature_jwk=app_module.signature_jwk,
+        use_legacy_catalogue_signature=False, did_store=None, document_loader=app_module.document_loader,
+        signing_cache=TTLCache(max_size=10, ttl_sec=60)))
+    headers = {"Idempotency-Key": "key-1"}
+
+    response = client.post(path, json=create_claims(1), headers=headers)
+    assert response.status_code == 200
+    assert client.post(path, json=create_claims(1), headers=headers).get_json() == response.get_json()
+    response = client.post(path, json=create_claims(2), headers=headers)
+    assert response.status_code == 422
+    assert "Idempotency-Key" in response.get_json()["error"]
+
+
+class FederatedCatalogueClientStub:
+    """
+    Only reports the result of the first Self Description of a bulk upload.
+    """
+
+    def send_many_to_federated_catalogue(self, self_descriptions) -> list[dict]:
+        return [{"index": index, "status": "success", "status_code": 201, "attempts": 1}
+                for index, _ in enumerate(self_descriptions)][:1]
+
+
+def test_batch_upload_reports_items_without_upload_result_as_failed(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "get_federated_catalogue_client", lambda: FederatedCatalogueClientStub())
+
+    response = client.post("/federated-catalogue/upload-from-claims/batch",
+                           json=[create_claims(1), ["not", "an", "object"], create_claims(2)])
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report["succeeded"], report["failed"]) == (1, 2)
+    assert [(result["index"], result["status"]) for result in report["results"]] == [
+        (0, "success"), (1, "failed"), (2, "failed")]
+    assert "No upload result" in report["results"][2]["error"]
@@ -0,0 +1,102 @@
+import time
+from datetime import datetime
+
+import pytest
+from jwcrypto.jwk import JWK
+from pyld import jsonld
+
+from cache import TTLCache
+from canonicalization import CanonicalizationEngine
+from did_store import DIDStore
+from document_loader import CachingDocumentLoader, DEFAULT_CONTEXT_BUNDLE_DIR
+from self_description_processor import IdempotencyKeyConflictError, SelfDescriptionProcessor
+
+CREDENTIAL_ISSUER = "did:web:example.org"
+# Arguments of `JWK.generate` for the key types of the signature suites
+SIGNING_KEY_TYPES = {"RSA": {"kty": "RSA", "size": 2048},
+                     "EC": {"kty": "EC", "crv": "P-256"},
+                     "OKP": {"kty": "OKP", "crv": "Ed25519"}}
+CREATED_VALUES = ["2024-01-01T00:00:00Z", "1999-12-31T23:59:59Z", "2038-01-19T03:14:08Z",
+                  datetime.utcnow().replace(microsecond=0).isoformat() + "Z"]
+
+
+@pytest.fixture(scope="module")
+def document_loader():
+    return CachingDocumentLoader(bundle_dir=DEFAULT_CONTEXT_BUNDLE_DIR, cache_size=10, cache_ttl_sec=0, offline=True)
+
+
+@pytest.mark.parametrize("canonicalization_engine", ["pyld", "optimized"])
+@pytest.mark.parametrize("key_type", list(SIGNING_KEY_TYPES))
+def test_canonical_proof_template_matches_normalization(document_loader, key_type, canonicalization_engine):
+    processor = SelfDescriptionProcessor(
+        credential_issuer=CREDENTIAL_ISSUER, signature_jwk=JWK.generate(**SIGNING_KEY_TYPES[key_type]),
+        use_legacy_catalogue_signature=True, did_store=None, document_loader=document_loader,
+        canonicalization_engine=CanonicalizationEngine(context_cache_size=10, context_cache_ttl_sec=0)
+        if canonicalization_engine == "optimized" else None)
+    # The startup self-check disables the template if it doesn't match, which would hide a mismatch from this test
+    assert processor._SelfDescriptionProcessor__canonical_proof_template is not None
+
+    for created in CREATED_VALUES:
+        proof = processor._create_proof(created=created)
+        proof_for_normalization = dict(proof, **{"@context": "https://w3id.org/security/v3-unstable"})
+        expected = jsonld.normalize(proof_for_normalization, options={"algorithm": "URDNA2015",
+                                                                      "format": "application/n-quads",
+                                                                      "documentLoader": document_loader})
+        assert processor._normalize_proof(proof) == expected
+        assert processor.get_verification_method() in expected
+
+
+class CountingDIDStore(DIDStore):
+    def __init__(self, storage_path: str):
+        super().__init__(storage_type="local", storage_path=storage_path, vp_vc_id_prefix="https://example.org")
+        self.saved_objects = 0
+
+    def save_object_into_storage(self, did_store_object_to_save) -> None:
+        self.saved_objects += 1
+        super().save_object_into_storage(did_store_object_to_save)
+
+
+def create_cached_processor(document_loader, did_store: DIDStore, ttl_sec: float) -> SelfDescriptionProcessor:
+    return SelfDescriptionProcessor(
+        credential_issuer=CREDENTIAL_ISSUER, signature_jwk=JWK.generate(**SIGNING_KEY_TYPES["EC"]),
+        use_legacy_catalogue_signature=False, did_store=did_store, document_loader=document_loader,
+        signing_cache=TTLCache(max_size=10, ttl_sec=ttl_sec))
+
+
+def create_claims(name: str) -> dict:
+    return {"@context": {"ex": "https://example.org/ontology/"}, "id": "https://example.org/offering/1",
+            "@type": "ex:ServiceOffering", "ex:name": name}
+
+
+def test_signing_cache_returns_issued_documents_until_they_expire(document_loader, tmp_path):
+    did_store = CountingDIDStore(str(tmp_path))
+    processor = create_cached_processor(document_loader, did_store, ttl_sec=0.5)
+
+    presentation = processor.create_self_description(create_claims("Offering"))
+    assert did_store.saved_objects == 2
+    # Identical Claims in a different key order hit the cache and nothing is stored again
+    cached_presentation = processor.create_self_description(dict(reversed(create_claims("Offering").items())))
+    assert cached_presentation == presentation
+    assert did_store.saved_objects == 2
+    # The cached document can't be modified via a returned copy
+    cached_presentation["proof"] = None
+    assert processor.create_self_description(create_claims("Offering")) == presentation
+
+    time.sleep(0.6)
+    new_presentation = processor.create_self_description(create_claims("Offering"))
+    assert new_presentation["id"] != presentation["id"]
+    assert did_store.saved_objects == 4
+
+
+def test_signing_cache_rejects_idempotency_key_reused_for_different_claims(document_loader, tmp_path):
+    did_store = CountingDIDStore(str(tmp_path))
+    processor = create_cached_processor(document_loader, did_store, ttl_sec=60)
+
+    credential = processor.create_verifiable_credential(create_claims("Offering"), idempotency_key="key-1")
+    assert processor.create_verifiable_credential(create_claims("Offering"), idempotency_key="key-1") == credential
+    with pytest.raises(IdempotencyKeyConflictError):
+        processor.create_verifiable_credential(create_claims("Other offering"), idempotency_key="key-1")
+    assert did_store.saved_objects == 1
+    # A new key issues a new Credential for the same Claims
+    assert processor.create_verifiable_credential(create_claims("Offering"),
+                                                  idempotency_key="key-2")["id"] != credential["id"]